@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark: embedding store lookup latency vs recomputing the SDXL text encoders
+
+Store lookups are always measured (cold = fresh worker indexing the log, warm = repeat lookup).
+Encoder recompute times are measured only when torch and the SDXL base weights are available
+on the volume (pass --model-path to point elsewhere).
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_store import EmbeddingStore
+
+
+def _time_ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def _sdxl_embeds(rng):
+    # Shapes of SDXL base prompt + negative embeddings (fp16)
+    return {
+        "prompt_embeds": rng.standard_normal((1, 77, 2048)).astype(np.float16),
+        "negative_prompt_embeds": rng.standard_normal((1, 77, 2048)).astype(np.float16),
+        "pooled_prompt_embeds": rng.standard_normal((1, 1280)).astype(np.float16),
+        "negative_pooled_prompt_embeds": rng.standard_normal((1, 1280)).astype(np.float16),
+    }
+
+
+def benchmark_store(root, entries, repeats):
+    rng = np.random.default_rng(0)
+    writer = EmbeddingStore(root)
+    keys = [writer.make_key("sdxl-base", "prompt_embeds", f"prompt {i}", None) for i in range(entries)]
+
+    start = time.perf_counter()
+    for key in keys:
+        writer.put(key, _sdxl_embeds(rng))
+    put_ms = (time.perf_counter() - start) * 1000 / entries
+
+    # Cold: a brand-new worker maps and indexes the whole log on first lookup
+    cold_samples = []
+    for _ in range(repeats):
+        reader = EmbeddingStore(root)
+        start = time.perf_counter()
+        reader.get(keys[-1])
+        cold_samples.append((time.perf_counter() - start) * 1000)
+
+    reader = EmbeddingStore(root)
+    reader.get(keys[0])
+    warm_median, warm_max = _time_ms(lambda: reader.get(keys[entries // 2]), repeats)
+
+    return {
+        "log_mb": reader.stats()["bytes"] / 1e6,
+        "put_ms": put_ms,
+        "cold_ms": statistics.median(cold_samples),
+        "warm_ms": warm_median,
+        "warm_max_ms": warm_max,
+    }
+
+
+def benchmark_encoder(model_path, repeats):
+    try:
+        import torch
+        from diffusers import StableDiffusionXLPipeline
+    except ImportError:
+        return None
+    if not os.path.exists(model_path):
+        return None
+
+    pipe = StableDiffusionXLPipeline.from_pretrained(
+        model_path, torch_dtype=torch.float16, variant="fp16", use_safetensors=True, local_files_only=True,
+    )
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    pipe.text_encoder.to(device)
+    pipe.text_encoder_2.to(device)
+
+    def encode():
+        pipe.encode_prompt(
+            prompt="A majestic steampunk dragon soaring through a cloudy sky",
+            device=device,
+            num_images_per_prompt=1,
+            do_classifier_free_guidance=True,
+            negative_prompt="blurry, low quality",
+        )
+        if device == "cuda":
+            torch.cuda.synchronize()
+
+    encode()  # warm-up
+    return _time_ms(encode, repeats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=500)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--store-dir", default=None, help="Directory for the store (default: temp dir)")
+    parser.add_argument("--model-path", default="/runpod-volume/stable-diffusion-xl-base-1.0")
+    args = parser.parse_args()
+
+    print("📊 Embedding Store Benchmark")
+    print("=" * 60)
+
+    if args.store_dir:
+        results = benchmark_store(args.store_dir, args.entries, args.repeats)
+    else:
+        with tempfile.TemporaryDirectory() as root:
+            results = benchmark_store(root, args.entries, args.repeats)
+
+    print(f"Entries: {args.entries} (log size {results['log_mb']:.1f} MB)")
+    print(f"  put                      {results['put_ms']:8.3f} ms/entry")
+    print(f"  get (cold worker)        {results['cold_ms']:8.3f} ms")
+    print(f"  get (warm)               {results['warm_ms']:8.3f} ms (max {results['warm_max_ms']:.3f} ms)")
+
+    encoder = benchmark_encoder(args.model_path, args.repeats)
+    if encoder is None:
+        print("  encode_prompt            skipped (torch/diffusers or SDXL weights not available)")
+    else:
+        median, worst = encoder
+        print(f"  encode_prompt (recompute) {median:7.3f} ms (max {worst:.3f} ms)")
+        print(f"  speedup (warm lookup)    {median / max(results['warm_ms'], 1e-6):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
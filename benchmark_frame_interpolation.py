@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: CPU frame interpolation cost vs Wan generation time
+
+Interpolates a synthetic 81-frame 832x480 clip at each factor and method and reports the
+synthesis time (encoding excluded) as a share of a typical generation time, which can be set
+with --generation-seconds. Also times interpolation + streaming encode end to end.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from frame_interpolation import interpolate_frames, is_flow_available
+from video_encoding import encode_video
+
+
+def _clip(num_frames, width, height):
+    """Smoothly moving gradient + square, so flow has something to track"""
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    clip = np.empty((num_frames, height, width, 3), dtype=np.uint8)
+    for i in range(num_frames):
+        clip[i, :, :, 0] = np.roll(x, i * 3, axis=1).astype(np.uint8)
+        clip[i, :, :, 1] = 64
+        clip[i, :, :, 2] = 128
+        left = (i * 5) % (width - 64)
+        clip[i, height // 3:height // 3 + 64, left:left + 64] = 255
+    return clip
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=81)
+    parser.add_argument("--width", type=int, default=832)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=15)
+    parser.add_argument("--factors", type=int, nargs="+", default=[2, 3])
+    parser.add_argument("--generation-seconds", type=float, default=600.0,
+                        help="Typical Wan2.1-14B generation time to compare against")
+    args = parser.parse_args()
+
+    clip = _clip(args.frames, args.width, args.height)
+    methods = ["blend", "flow"] if is_flow_available() else ["blend"]
+
+    print("📊 Frame Interpolation Benchmark")
+    print("=" * 72)
+    print(f"{args.frames} frames at {args.width}x{args.height}; generation reference {args.generation_seconds:.0f}s")
+    if not is_flow_available():
+        print("  (opencv-python not installed, skipping optical flow)")
+
+    for method in methods:
+        for factor in args.factors:
+            frames, fps = interpolate_frames(clip, factor=factor, method=method, fps=args.fps)
+            start = time.perf_counter()
+            count = sum(1 for _ in frames)
+            synth = frames.seconds
+            total = time.perf_counter() - start
+
+            frames, fps = interpolate_frames(clip, factor=factor, method=method, fps=args.fps)
+            start = time.perf_counter()
+            video_bytes = encode_video(frames, fps=fps)
+            with_encode = time.perf_counter() - start
+
+            print(f"  {method:5s} x{factor}: {count} frames @ {fps} fps  synth {synth:6.2f}s "
+                  f"({synth / max(count - args.frames, 1) * 1000:5.1f} ms/new frame, "
+                  f"{synth / args.generation_seconds * 100:.2f}% of generation)  "
+                  f"iterate {total:5.2f}s  +encode {with_encode:5.2f}s ({len(video_bytes) / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
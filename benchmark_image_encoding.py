@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: encode time and byte size of output formats and compression presets
+
+Uses a synthetic 1024x1024 image with smooth gradients and fine noise, which compresses
+similarly to SDXL output. Also reports parallel throughput of the shared encoder pool.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from image_encoding import IMAGE_FORMATS, COMPRESSION_PRESETS, encode_image, encode_images, is_format_supported
+
+
+def synthetic_image(size=1024, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    base = np.stack([
+        128 + 100 * np.sin(6 * x + 2 * y),
+        128 + 100 * np.cos(4 * y - 3 * x),
+        128 + 80 * np.sin(5 * (x + y)),
+    ], axis=-1)
+    noise = rng.normal(0, 6, base.shape)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--batch", type=int, default=4, help="Images for the parallel throughput test")
+    args = parser.parse_args()
+
+    image = synthetic_image(args.size)
+    print(f"📊 Image Encoding Benchmark ({args.size}x{args.size}, quality {args.quality})")
+    print("=" * 60)
+    print(f"{'format':<8}{'preset':<10}{'median ms':>12}{'KB':>10}{'b64 KB':>10}")
+
+    for output_format in IMAGE_FORMATS:
+        if not is_format_supported(output_format):
+            print(f"{output_format:<8}{'-':<10}{'unsupported':>12}")
+            continue
+        for preset in COMPRESSION_PRESETS:
+            samples = []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                encoded = encode_image(image, output_format, args.quality, preset)
+                samples.append((time.perf_counter() - start) * 1000)
+            size_kb = len(encoded.data) / 1024
+            print(f"{output_format:<8}{preset:<10}{statistics.median(samples):>12.1f}{size_kb:>10.0f}{size_kb * 4 / 3:>10.0f}")
+
+    print(f"\nParallel throughput ({args.batch} images, balanced preset):")
+    images = [synthetic_image(args.size, seed) for seed in range(args.batch)]
+    for output_format in ("png", "webp", "jpeg"):
+        if not is_format_supported(output_format):
+            continue
+        start = time.perf_counter()
+        for img in images:
+            encode_image(img, output_format, args.quality, "balanced")
+        sequential = time.perf_counter() - start
+        start = time.perf_counter()
+        encode_images(images, output_format, args.quality, "balanced")
+        parallel = time.perf_counter() - start
+        print(f"  {output_format:<6} sequential {sequential * 1000:8.1f} ms   pool {parallel * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark: image jobs with upload inline on the generation thread vs. handed off to the
+post-processing stage
+
+The GPU is simulated by one thread that "generates" each job for --generation-seconds and
+produces real 1024x1024 images; post-processing is the worker's real
+save_and_upload_images_cloud (encoding, renditions, status writes) against an in-memory
+bucket whose uploads take --upload-seconds each and an in-memory Firestore. Reports end-to-end
+throughput, how long the GPU sat idle waiting on uploads, and the stage's hand-off stats.
+"""
+
+import os
+import sys
+import time
+import types
+import argparse
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cloud_storage as cloud_storage_module
+from postprocess import PostProcessStage
+from test_firestore_batching import FakeFirestore
+from test_image_renditions import FakeBlob, FakeBucket
+
+
+class SlowBucket(FakeBucket):
+    """Every upload takes ``seconds`` (network time, GIL released)"""
+    def __init__(self, seconds):
+        super().__init__()
+        self.seconds = seconds
+
+    def blob(self, path):
+        bucket = self
+
+        class SlowBlob(FakeBlob):
+            def upload_from_string(self, data, content_type=None, timeout=None, predefined_acl=None):
+                time.sleep(bucket.seconds)
+                super().upload_from_string(data, content_type)
+
+        return SlowBlob(self, path)
+
+
+def _use_fakes(upload_seconds):
+    storage = cloud_storage_module.cloud_storage
+    storage.storage_type = "firebase"
+    storage.storage_bucket = SlowBucket(upload_seconds)
+    storage.firestore_db = FakeFirestore()
+    cloud_storage_module.firestore = types.SimpleNamespace(SERVER_TIMESTAMP="SERVER_TIMESTAMP")
+    return storage
+
+
+def _generate(index, num_images, seconds):
+    time.sleep(seconds)
+    rng = np.random.default_rng(index)
+    return [Image.fromarray(rng.integers(0, 255, (1024, 1024, 3), dtype=np.uint8)) for _ in range(num_images)]
+
+
+def _finish(storage, images, index):
+    file_uid = f"file-{index}"
+    with storage.coalesce_writes():
+        urls = cloud_storage_module.save_and_upload_images_cloud(images, f"job-{index}", "user-1", file_uid)
+        storage.update_generation_status("user-1", file_uid, {"images": urls, "status": "completed"}, "images")
+
+
+def run(jobs, num_images, generation_seconds, upload_seconds, stage=None):
+    storage = _use_fakes(upload_seconds)
+    start = time.perf_counter()
+    gpu_busy = 0.0
+    futures = []
+    for index in range(jobs):
+        generation_start = time.perf_counter()
+        images = _generate(index, num_images, generation_seconds)
+        gpu_busy += time.perf_counter() - generation_start
+        if stage is None:
+            _finish(storage, images, index)
+        else:
+            futures.append(stage.submit(_finish, storage, images, index))
+    gpu_done = time.perf_counter() - start
+    for future in futures:
+        future.result()
+    total = time.perf_counter() - start
+    return total, gpu_done - gpu_busy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--images", type=int, default=2)
+    parser.add_argument("--generation-seconds", type=float, default=1.0)
+    parser.add_argument("--upload-seconds", type=float, default=0.8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    args = parser.parse_args()
+    # Keep the comparison about hand-off, not renditions
+    os.environ["IMAGE_RENDITIONS"] = ""
+
+    print(f"{args.jobs} jobs x {args.images} images, generation {args.generation_seconds}s, "
+          f"upload {args.upload_seconds}s per object\n")
+    print(f"{'mode':<10} {'total s':>8} {'jobs/min':>9} {'GPU idle s':>11}")
+    inline_total, inline_idle = run(args.jobs, args.images, args.generation_seconds, args.upload_seconds)
+    print(f"{'inline':<10} {inline_total:8.2f} {args.jobs / inline_total * 60:9.1f} {inline_idle:11.2f}")
+
+    stage = PostProcessStage(workers=args.workers, max_in_flight=args.max_in_flight)
+    staged_total, staged_idle = run(args.jobs, args.images, args.generation_seconds, args.upload_seconds, stage)
+    print(f"{'staged':<10} {staged_total:8.2f} {args.jobs / staged_total * 60:9.1f} {staged_idle:11.2f}")
+
+    print(f"\nspeedup: {inline_total / staged_total:.2f}x")
+    print(f"stage: {stage.stats()}")
+
+
+if __name__ == "__main__":
+    main()
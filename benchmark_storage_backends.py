@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark: upload-layer throughput by backend and concurrency limit, without live services
+
+The in-memory backend simulates the network (--latency seconds per request, --bandwidth-mbps
+per connection, --failure-rate for retried failures); the filesystem backend writes to a
+temporary directory. For each concurrency limit, --objects objects of --size-kb are uploaded
+from a pool as large as the limit, as the worker's upload pool does.
+
+A second table compares the Firebase backend's URL strategies against a simulated bucket in
+which every request (upload or make_public) takes --latency seconds; signed URLs are an
+HMAC computed locally, as V4 signing with the service account key is.
+"""
+
+import os
+import sys
+import time
+import hmac
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from storage_backends import FirebaseStorageBackend, LocalStorageBackend, MemoryStorageBackend, URL_STRATEGIES
+
+
+class SimulatedBlob:
+    def __init__(self, bucket, path):
+        self.bucket = bucket
+        self.path = path
+        self.public_url = f"https://storage.example/{path}"
+
+    def upload_from_string(self, data, content_type=None, timeout=None, predefined_acl=None):
+        time.sleep(self.bucket.latency)
+
+    def make_public(self, timeout=None):
+        time.sleep(self.bucket.latency)
+
+    def generate_signed_url(self, version=None, method="GET", expiration=None):
+        signature = hmac.new(b"service-account-key", self.path.encode(), hashlib.sha256).hexdigest()
+        return f"{self.public_url}?X-Goog-Expires={int(expiration.total_seconds())}&X-Goog-Signature={signature}"
+
+
+class SimulatedBucket:
+    """Firebase bucket stand-in whose every request takes ``latency`` seconds"""
+    def __init__(self, latency):
+        self.latency = latency
+
+    def blob(self, path):
+        return SimulatedBlob(self, path)
+
+
+def run(backend, objects, payload):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=backend.max_concurrency) as pool:
+        list(pool.map(lambda i: backend.upload(f"bench/{i}.png", payload, "image/png"), range(objects)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--objects", type=int, default=64)
+    parser.add_argument("--size-kb", type=int, default=1500)
+    parser.add_argument("--latency", type=float, default=0.08)
+    parser.add_argument("--bandwidth-mbps", type=float, default=200.0)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_kb * 1024)
+    total_mb = args.objects * len(payload) / 1e6
+    print(f"{args.objects} objects x {args.size_kb} KB; simulated network: {args.latency * 1000:.0f} ms, "
+          f"{args.bandwidth_mbps} Mbit/s per connection, {args.failure_rate:.0%} failures\n")
+    print(f"{'backend':<11} {'limit':>5} {'seconds':>8} {'objects/s':>10} {'MB/s':>7} {'retries':>8}")
+
+    with tempfile.TemporaryDirectory() as root:
+        for concurrency in args.concurrency:
+            backends = [
+                MemoryStorageBackend(latency=args.latency, bandwidth_mbps=args.bandwidth_mbps,
+                                     failure_rate=args.failure_rate, max_concurrency=concurrency, backoff=0.05),
+                LocalStorageBackend(root=root, max_concurrency=concurrency),
+            ]
+            for backend in backends:
+                seconds = run(backend, args.objects, payload)
+                print(f"{backend.name:<11} {concurrency:>5} {seconds:8.2f} {args.objects / seconds:10.1f} "
+                      f"{total_mb / seconds:7.1f} {backend.stats()['retries']:>8}")
+
+    # Small objects so the strategy, not the transfer, dominates
+    concurrency = max(args.concurrency)
+    print(f"\nFirebase URL strategies ({args.objects} objects, limit {concurrency}, "
+          f"{args.latency * 1000:.0f} ms per request)\n")
+    print(f"{'strategy':<15} {'seconds':>8} {'p50 ms':>7} {'p95 ms':>7}")
+    for strategy in URL_STRATEGIES:
+        backend = FirebaseStorageBackend(SimulatedBucket(args.latency), url_strategy=strategy,
+                                         max_concurrency=concurrency)
+        seconds = run(backend, args.objects, b"png")
+        stats = backend.stats()
+        print(f"{strategy:<15} {seconds:8.2f} {stats['upload_ms_p50']:7.1f} {stats['upload_ms_p95']:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
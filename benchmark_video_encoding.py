@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark: streaming in-memory MP4 encoding vs the old export_to_video + temp file path,
+and encoder profiles / codecs on the same fixed synthetic clip
+
+Frames are synthetic float32 arrays shaped like Wan2.1 output (81 frames at 832x480 by default).
+Peak memory is the Python-heap peak reported by tracemalloc (numpy buffers included); ffmpeg
+runs out of process in both paths. The legacy path uses diffusers' export_to_video when
+installed and otherwise the equivalent imageio writer (libx264, quality 5).
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from video_encoding import encode_video, encode_video_output, is_codec_supported, VIDEO_PROFILES
+
+
+def _frames(num_frames, width, height):
+    rng = np.random.default_rng(0)
+    base = rng.random((height, width, 3), dtype=np.float32)
+    return [np.roll(base, i * 4, axis=1) for i in range(num_frames)]
+
+
+def _export_to_video(frames, path, fps):
+    try:
+        from diffusers.utils import export_to_video
+        export_to_video(frames, path, fps=fps)
+    except ImportError:
+        import imageio
+        # Same steps as diffusers: convert every frame up front, then write
+        frames = [(frame * 255).astype(np.uint8) for frame in frames]
+        with imageio.get_writer(path, fps=fps, quality=5) as writer:
+            for frame in frames:
+                writer.append_data(frame)
+
+
+def legacy_path(frames, fps):
+    """What save_and_upload_video_cloud used to do: export to a temp file and read it back"""
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_file:
+        path = temp_file.name
+    try:
+        _export_to_video(frames, path, fps)
+        with open(path, "rb") as video_file:
+            return video_file.read()
+    finally:
+        os.unlink(path)
+
+
+def streaming_path(frames, fps):
+    return encode_video(frames, fps=fps)
+
+
+def measure(fn, frames, fps):
+    tracemalloc.start()
+    start = time.perf_counter()
+    video_bytes = fn(frames, fps)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, len(video_bytes), video_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=81)
+    parser.add_argument("--width", type=int, default=832)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=16)
+    parser.add_argument("--codecs", nargs="+", default=["h264", "h265"],
+                        help="Codecs for the profile comparison (vp9/av1 are much slower)")
+    args = parser.parse_args()
+
+    frames = _frames(args.frames, args.width, args.height)
+    print("📊 Video Encoding Benchmark")
+    print("=" * 60)
+    print(f"{args.frames} frames at {args.width}x{args.height}, {args.fps} fps "
+          f"(input frames {sum(f.nbytes for f in frames) / 1e6:.0f} MB, not counted below)")
+
+    results = {}
+    for name, fn in [("export_to_video + tempfile", legacy_path), ("streaming encoder", streaming_path)]:
+        elapsed, peak, size, video_bytes = measure(fn, frames, args.fps)
+        results[name] = (elapsed, peak)
+        moov_first = video_bytes.find(b"moov") < video_bytes.find(b"mdat")
+        print(f"  {name:28s} {elapsed:6.2f} s  peak {peak / 1e6:7.1f} MB  "
+              f"{size / 1e6:5.2f} MB  moov-first={moov_first}")
+
+    legacy, streaming = results["export_to_video + tempfile"], results["streaming encoder"]
+    print(f"  speedup {legacy[0] / streaming[0]:.2f}x, peak memory {streaming[1] / max(legacy[1], 1) * 100:.0f}% of legacy")
+
+    print()
+    print("Encoder profiles (same clip)")
+    for codec in args.codecs:
+        if not is_codec_supported(codec):
+            print(f"  {codec:5s} not available in this ffmpeg build")
+            continue
+        for profile in VIDEO_PROFILES:
+            encoded = encode_video_output(frames, fps=args.fps, profile=profile, codec=codec)
+            kbps = len(encoded.data) * 8 / 1000 / (len(frames) / args.fps)
+            print(f"  {codec:5s} {profile:13s} {encoded.seconds:6.2f} s  {len(encoded.data) / 1e6:6.2f} MB  "
+                  f"{kbps:8.0f} kbps")
+
+
+if __name__ == "__main__":
+    main()
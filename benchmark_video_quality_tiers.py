@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark: video quality tiers (draft / fast / full) end to end and by output quality
+
+Quality: a detailed synthetic 832x480 clip is downscaled to each tier's generation size and
+upscaled back with the worker's sharpened Lanczos (and plain bilinear for reference); PSNR
+against the original shows how much detail each tier can recover. Upscale time per frame is
+measured on CPU.
+
+End to end: with a CUDA GPU and the Wan weights on the volume (--model-path), each tier is
+generated for real (--steps denoising steps) and timed through decode, upscale and encode.
+Without them the generation column is estimated from --generation-seconds scaled by token
+count (attention cost grows faster, so the estimate is conservative).
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from video_encoding import encode_video
+from video_upscaling import VIDEO_QUALITY_TIERS, UpscaledFrames, generation_size
+
+
+def _clip(num_frames, width, height):
+    """Fine stripes, edges and noise moving across the frame"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    texture = rng.integers(0, 40, (height, width), dtype=np.uint8)
+    clip = np.empty((num_frames, height, width, 3), dtype=np.uint8)
+    for i in range(num_frames):
+        stripes = 127 + 120 * np.sin((x + i * 3) * 0.35) * np.cos(y * 0.12)
+        clip[i, ..., 0] = np.clip(stripes, 0, 255)
+        clip[i, ..., 1] = ((x // 32 + y // 32 + i) % 2) * 200 + texture
+        clip[i, ..., 2] = np.clip(x / width * 255, 0, 255)
+    return clip
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def _downscale(clip, size):
+    height, width = size
+    return np.stack([np.asarray(Image.fromarray(frame).resize((width, height), Image.BOX)) for frame in clip])
+
+
+def _bilinear(clip, size):
+    height, width = size
+    return np.stack([np.asarray(Image.fromarray(frame).resize((width, height), Image.BILINEAR)) for frame in clip])
+
+
+def _generate(model_path, size, num_frames, steps):
+    import torch
+    from diffusers import WanPipeline, AutoencoderKLWan
+    from video_decoding import decode_wan_latents
+
+    vae = AutoencoderKLWan.from_pretrained(model_path, subfolder="vae", torch_dtype=torch.float32,
+                                           local_files_only=True)
+    pipe = WanPipeline.from_pretrained(model_path, vae=vae, torch_dtype=torch.bfloat16,
+                                       local_files_only=True).to("cuda")
+    with torch.inference_mode():
+        latents = pipe(prompt="A red fox running through snowy woods, cinematic", height=size[0], width=size[1],
+                       num_frames=num_frames, num_inference_steps=steps, output_type="latent").frames
+        frames = decode_wan_latents(pipe.vae, latents)
+    del pipe
+    torch.cuda.empty_cache()
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=81)
+    parser.add_argument("--width", type=int, default=832)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=int, default=15)
+    parser.add_argument("--tiers", nargs="+", default=list(VIDEO_QUALITY_TIERS))
+    parser.add_argument("--model-path", default="/runpod-volume/Wan2.1-T2V-14B-Diffusers")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--generation-seconds", type=float, default=600.0,
+                        help="Full-resolution Wan2.1-14B generation time used for estimates")
+    args = parser.parse_args()
+
+    output_size = (args.height, args.width)
+    clip = _clip(args.frames, args.width, args.height)
+
+    real_generation = False
+    try:
+        import torch
+        real_generation = torch.cuda.is_available() and os.path.exists(args.model_path)
+    except ImportError:
+        pass
+
+    print("📊 Video Quality Tier Benchmark")
+    print("=" * 96)
+    print(f"{args.frames} frames output at {args.width}x{args.height}; generation "
+          f"{'measured on GPU' if real_generation else f'estimated from {args.generation_seconds:.0f}s at full size'}")
+    print(f"{'tier':6s} {'gen size':>9s} {'PSNR dB':>8s} {'bilinear':>9s} {'upscale s':>10s} {'ms/frame':>9s} "
+          f"{'gen s':>8s} {'encode s':>9s} {'total s':>8s} {'MB':>6s}")
+
+    for tier in args.tiers:
+        size = generation_size(args.height, args.width, tier)
+        low = _downscale(clip, size) if size != output_size else clip
+
+        if real_generation:
+            start = time.perf_counter()
+            low = _generate(args.model_path, size, args.frames, args.steps)
+            generation = time.perf_counter() - start
+        else:
+            generation = args.generation_seconds * (size[0] * size[1]) / (args.height * args.width)
+
+        upscaled = UpscaledFrames(low, output_size) if size != output_size else low
+        frames = np.stack(list(upscaled))
+        upscale_seconds = upscaled.seconds if size != output_size else 0.0
+
+        start = time.perf_counter()
+        video_bytes = encode_video(frames, fps=args.fps)
+        encode_seconds = time.perf_counter() - start
+
+        if real_generation or size == output_size:
+            quality, bilinear = ("-", "-") if real_generation else ("ref", "-")
+        else:
+            quality = f"{psnr(frames, clip):.2f}"
+            bilinear = f"{psnr(_bilinear(low, output_size), clip):.2f}"
+
+        total = generation + upscale_seconds + encode_seconds
+        print(f"{tier:6s} {size[1]:>4d}x{size[0]:<4d} {quality:>8s} {bilinear:>9s} {upscale_seconds:10.2f} "
+              f"{upscale_seconds / args.frames * 1000:9.1f} {generation:8.1f} {encode_seconds:9.2f} {total:8.1f} "
+              f"{len(video_bytes) / 1e6:6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Wan VAE decode latency and memory across temporal chunk sizes, tiling and precision
+
+Decodes random latents shaped like an 81-frame 832x480 clip with the real Wan2.1 VAE from the
+volume (pass --model-path to point elsewhere). Reports wall time, peak GPU memory allocated
+by torch and peak host RSS for each configuration. Needs a CUDA GPU and the VAE weights.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from memory_stats import PeakHostMemory
+
+
+def parse_configs(values):
+    """Parse chunk_frames:tile_size pairs, e.g. 0:0 (whole clip) 4:0 1:32"""
+    configs = []
+    for value in values:
+        chunk, tile = value.split(":")
+        configs.append((int(chunk), int(tile)))
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-path", default="/runpod-volume/Wan2.1-T2V-14B-Diffusers")
+    parser.add_argument("--frames", type=int, default=81)
+    parser.add_argument("--width", type=int, default=832)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "bfloat16"])
+    parser.add_argument("--configs", nargs="+", default=["0:0", "8:0", "4:0", "1:0", "4:40", "1:32"],
+                        help="chunk_frames:tile_size pairs (latent units)")
+    parser.add_argument("--tile-overlap", type=int, default=8)
+    args = parser.parse_args()
+
+    try:
+        import torch
+        from diffusers import AutoencoderKLWan
+    except ImportError:
+        print("⚠️ torch/diffusers not installed, skipping")
+        return
+    if not torch.cuda.is_available() or not os.path.exists(args.model_path):
+        print("⚠️ Needs a CUDA GPU and the Wan VAE weights, skipping")
+        return
+
+    from video_decoding import decode_wan_latents, VAE_DTYPES
+
+    latent_shape = (1, 16, (args.frames - 1) // 4 + 1, args.height // 8, args.width // 8)
+    latents = torch.randn(latent_shape, device="cuda", generator=torch.Generator("cuda").manual_seed(0))
+
+    print("📊 Wan VAE Decode Benchmark")
+    print("=" * 72)
+    print(f"Latents {tuple(latent_shape)} -> {args.frames} frames at {args.width}x{args.height}")
+    print(f"{'dtype':10s} {'chunk':>5s} {'tile':>5s} {'time s':>8s} {'GPU peak GB':>12s} {'host peak MB':>13s}")
+
+    for dtype_name in args.dtypes:
+        vae = AutoencoderKLWan.from_pretrained(
+            args.model_path, subfolder="vae", torch_dtype=VAE_DTYPES[dtype_name], local_files_only=True,
+        ).to("cuda")
+
+        for chunk_frames, tile_size in parse_configs(args.configs):
+            torch.cuda.empty_cache()
+            torch.cuda.reset_peak_memory_stats()
+            try:
+                with torch.inference_mode(), PeakHostMemory() as host_memory:
+                    start = time.perf_counter()
+                    frames = decode_wan_latents(vae, latents, chunk_frames=chunk_frames, tile_size=tile_size,
+                                                tile_overlap=args.tile_overlap, oom_fallback=False)
+                    torch.cuda.synchronize()
+                    elapsed = time.perf_counter() - start
+                gpu_peak = torch.cuda.max_memory_allocated() / 1e9
+                print(f"{dtype_name:10s} {chunk_frames:5d} {tile_size:5d} {elapsed:8.2f} {gpu_peak:12.2f} "
+                      f"{host_memory.peak_mb:13.0f}")
+                del frames
+            except torch.cuda.OutOfMemoryError:
+                print(f"{dtype_name:10s} {chunk_frames:5d} {tile_size:5d} {'OOM':>8s}")
+
+        del vae
+
+
+if __name__ == "__main__":
+    main()
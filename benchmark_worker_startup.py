@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: worker startup with cloud storage initialized inline vs. on a background thread
+
+Each run is a fresh interpreter that imports cloud_storage, then either initializes it
+inline before "loading models" (--model-load-seconds of sleep, standing in for the
+handler's ModelHandler) or starts it in the background and waits for it only after the
+models are loaded. Reports the import time, the initialization time and the time until the
+worker could serve a cloud-storage job, as medians over --repeat runs. Firebase is only
+initialized for real when FIREBASE_SERVICE_ACCOUNT_KEY / FIREBASE_STORAGE_BUCKET are set;
+without them, --simulate-init-seconds adds the given time to initialization.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+
+def child(mode, model_load_seconds, simulate_init_seconds):
+    start = time.perf_counter()
+    from cloud_storage import cloud_storage, CloudStorageManager
+    imported = time.perf_counter() - start
+
+    if simulate_init_seconds:
+        initialize = CloudStorageManager._initialize
+
+        def slow_initialize(self):
+            time.sleep(simulate_init_seconds)
+            initialize(self)
+
+        CloudStorageManager._initialize = slow_initialize
+
+    if mode == "inline":
+        cloud_storage.wait_ready()
+        time.sleep(model_load_seconds)
+    else:
+        cloud_storage.start_background_init()
+        time.sleep(model_load_seconds)
+        cloud_storage.wait_ready()
+    ready = time.perf_counter() - start
+    print(json.dumps({"import": imported, "init": cloud_storage.init_seconds, "ready": ready}))
+
+
+def run(mode, model_load_seconds, simulate_init_seconds):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode,
+         "--model-load-seconds", str(model_load_seconds),
+         "--simulate-init-seconds", str(simulate_init_seconds)],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--model-load-seconds", type=float, default=2.0)
+    parser.add_argument("--simulate-init-seconds", type=float, default=0.0)
+    parser.add_argument("--child", choices=["inline", "background"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.model_load_seconds, args.simulate_init_seconds)
+        return
+
+    print(f"{args.repeat} fresh interpreters per mode, simulated model load {args.model_load_seconds}s, "
+          f"extra init time {args.simulate_init_seconds}s\n")
+    print(f"{'mode':<11} {'import s':>9} {'init s':>8} {'ready s':>8}")
+    ready = {}
+    for mode in ("inline", "background"):
+        runs = [run(mode, args.model_load_seconds, args.simulate_init_seconds) for _ in range(args.repeat)]
+        median = {key: statistics.median(r[key] for r in runs) for key in ("import", "init", "ready")}
+        ready[mode] = median["ready"]
+        print(f"{mode:<11} {median['import']:9.3f} {median['init']:8.3f} {median['ready']:8.3f}")
+    print(f"\nstartup saved: {ready['inline'] - ready['background']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
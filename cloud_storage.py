@@ -5,30 +5,245 @@ Handles uploading images/videos to Firebase Storage and updating Firestore
 
 import os
 import base64
+import importlib.util
 import json
-from io import BytesIO
 from typing import Optional, Dict, Any, List
-import uuid
-from datetime import datetime
-
-# Firebase imports
-try:
-    import firebase_admin
-    from firebase_admin import credentials, storage, firestore
-    FIREBASE_AVAILABLE = True
-except ImportError:
-    FIREBASE_AVAILABLE = False
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+from concurrent.futures import ThreadPoolExecutor
+from image_encoding import encode_images, encode_renditions, parse_renditions
+from video_encoding import encode_video
+from resumable_upload import DEFAULT_CHUNK_SIZE
+from storage_backends import (StorageBackend, FirebaseStorageBackend, create_storage_backend, content_md5,
+                              DEFAULT_STORAGE_BACKEND)
+from status_journal import StatusJournal, DEFAULT_JOURNAL_PATH, merge_fields as _merge_fields
+from retry_policy import RetryPolicy, request_timeout, DEFAULT_RETRY_MAX_DELAY
+from payload_spool import PayloadSpool, DEFAULT_SPOOL_DIR
+from content_index import ContentIndex, DEFAULT_DEDUP_ENABLED, DEDUP_MIN_BYTES
+
+# Firebase is imported when the manager initializes (the SDK and its google-cloud / gRPC
+# dependencies take seconds to import), so importing this module stays cheap
+FIREBASE_AVAILABLE = importlib.util.find_spec("firebase_admin") is not None
+firebase_admin = credentials = storage = firestore = None
+if not FIREBASE_AVAILABLE:
     print("⚠️ Firebase not available. Install with: pip install firebase-admin")
 
+
+def _server_timestamp():
+    """Firestore's SERVER_TIMESTAMP sentinel; None when Firebase is not loaded (no document is written then)"""
+    return firestore.SERVER_TIMESTAMP if firestore is not None else None
+
+# Storage file extension for each uploaded content type
+CONTENT_TYPE_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+    "image/gif": ".gif",
+    "video/mp4": ".mp4",
+}
+
+# Retries of a Firestore write that failed transiently, all within the deadline (seconds)
+STATUS_WRITE_RETRIES = int(os.environ.get("STATUS_WRITE_RETRIES", "3"))
+STATUS_WRITE_DEADLINE = float(os.environ.get("STATUS_WRITE_DEADLINE", "20"))
+
+# Data URIs longer than this never go into a Firestore document; they are spilled to
+# SPILL_STORAGE_BACKEND (if set) or the payload spool and replaced by a reference
+INLINE_PAYLOAD_MAX_BYTES = int(os.environ.get("INLINE_PAYLOAD_MAX_BYTES", "2048"))
+SPILL_STORAGE_BACKEND = os.environ.get("SPILL_STORAGE_BACKEND", "")
+
+# Uploads run on a bounded pool shared by every job on this worker
+_UPLOAD_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("UPLOAD_CONCURRENCY", "8")),
+    thread_name_prefix="upload",
+)
+
+
+class WriteCoalescer:
+    """
+    Pending Firestore writes of one job, merged per document
+
+    While a coalescer is active (see ``CloudStorageManager.coalesce_writes``), status writes
+    are held here and committed together as one batch at the next stage boundary; later writes
+    to the same document are merged into earlier ones. Counts writes requested and Firestore
+    round-trips actually made.
+    """
+
+    def __init__(self):
+        self.pending: Dict[str, Any] = {}
+        self.writes = 0
+        self.round_trips = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def add(self, doc_ref, fields: Dict[str, Any]):
+        with self._lock:
+            self.writes += 1
+            ref, merged = self.pending.get(doc_ref.path, (doc_ref, {}))
+            self.pending[doc_ref.path] = (ref, _merge_fields(merged, fields))
+
+    def take(self) -> List:
+        with self._lock:
+            pending, self.pending = list(self.pending.values()), {}
+            return pending
+
+    def record_round_trip(self, writes: int = 0, batch: bool = False):
+        with self._lock:
+            self.writes += writes
+            self.round_trips += 1
+            self.batches += int(batch)
+
+    def stats(self) -> Dict[str, int]:
+        return {"writes": self.writes, "round_trips": self.round_trips, "batches": self.batches}
+
+
+# Coalescer of the job running in the current context (None: write straight through)
+_JOB_WRITES: ContextVar[Optional[WriteCoalescer]] = ContextVar("job_writes", default=None)
+
+
 class CloudStorageManager:
-    """Manages Firebase Storage and Firestore operations for generated content"""
+    """
+    Manages object storage and Firestore operations for generated content
+    
+    Objects go through ``backend`` (see storage_backends): the Firebase bucket by default, or
+    the backend named by STORAGE_BACKEND. Without a backend, uploads fall back to base64, but
+    oversized data URIs are never written to Firestore (see ``_compact_payloads``).
+    
+    Construction is cheap: credentials are parsed and clients built on first use of
+    ``storage_type`` / ``backend`` / ``storage_bucket`` / ``firestore_db``, or earlier on a
+    background thread via ``start_background_init``. Concurrent first uses wait for the one
+    initialization; assigning any of them overrides what initialization found.
+    """
     
     def __init__(self):
         self.firebase_app = None
-        self.storage_bucket = None
-        self.firestore_db = None
+        self._storage_type = "local"
+        self._backend: Optional[StorageBackend] = None
+        self._storage_bucket = None
+        self._firestore_db = None
+        self._ready = threading.Event()
+        self._init_lock = threading.RLock()
+        self._initializing = False
+        self._init_thread = None
+        self._init_thread_lock = threading.Lock()
+        self.init_seconds: Optional[float] = None
+        self.journal_path = DEFAULT_JOURNAL_PATH
+        self.status_retry = RetryPolicy("firestore_write", STATUS_WRITE_RETRIES, 0.25,
+                                        min(DEFAULT_RETRY_MAX_DELAY, 4.0), deadline=STATUS_WRITE_DEADLINE)
+        self._journal = None
+        self._journal_lock = threading.Lock()
+        self.spool_dir = DEFAULT_SPOOL_DIR
+        self.spill_backend: Optional[StorageBackend] = None
+        self._spool = None
+        self._spool_lock = threading.Lock()
+        self.content_index = ContentIndex(remote_get=self._get_index_entry,
+                                          remote_put=self._put_index_entry) if DEFAULT_DEDUP_ENABLED else None
+    
+    def _initialize(self):
         self.storage_type = self._detect_storage_type()
         self._initialize_storage()
+        self._select_backend()
+        # Deliver updates a previous run left in the journal, and payloads it left in the spool
+        if self.firestore_db is not None and self.journal_path and os.path.exists(self.journal_path):
+            self._get_journal()
+        if self.backend is not None and self.spool_dir and os.path.isdir(self.spool_dir):
+            self._get_spool()
+    
+    def _ensure_initialized(self):
+        """Initialize once; other threads wait for it, re-entrant calls from it return at once"""
+        if self._ready.is_set():
+            return
+        with self._init_lock:
+            if self._ready.is_set() or self._initializing:
+                return
+            self._initializing = True
+            start = time.perf_counter()
+            try:
+                self._initialize()
+            finally:
+                self.init_seconds = time.perf_counter() - start
+                self._ready.set()
+            print(f"☁️ Cloud storage ready ({self._storage_type}) in {self.init_seconds:.2f}s")
+    
+    def start_background_init(self):
+        """Initialize on a background thread (e.g. while models load); first use waits for it"""
+        with self._init_thread_lock:
+            if self._ready.is_set() or self._init_thread is not None:
+                return
+            self._init_thread = threading.Thread(target=self._ensure_initialized,
+                                                 name="cloud-storage-init", daemon=True)
+            self._init_thread.start()
+    
+    def is_ready(self) -> bool:
+        """Whether initialization has finished (without triggering it)"""
+        return self._ready.is_set()
+    
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Start initialization if needed and wait for it; False on timeout"""
+        self.start_background_init()
+        return self._ready.wait(timeout)
+    
+    @property
+    def storage_type(self) -> str:
+        self._ensure_initialized()
+        return self._storage_type
+    
+    @storage_type.setter
+    def storage_type(self, storage_type: str):
+        self._ensure_initialized()
+        self._storage_type = storage_type
+    
+    @property
+    def backend(self) -> Optional[StorageBackend]:
+        self._ensure_initialized()
+        return self._backend
+    
+    @backend.setter
+    def backend(self, backend: Optional[StorageBackend]):
+        self._ensure_initialized()
+        self._backend = backend
+    
+    @property
+    def firestore_db(self):
+        self._ensure_initialized()
+        return self._firestore_db
+    
+    @firestore_db.setter
+    def firestore_db(self, db):
+        self._ensure_initialized()
+        self._firestore_db = db
+    
+    @property
+    def storage_bucket(self):
+        self._ensure_initialized()
+        return self._storage_bucket
+    
+    @storage_bucket.setter
+    def storage_bucket(self, bucket):
+        self._ensure_initialized()
+        # Assigning the Firebase bucket makes it the storage backend
+        self._storage_bucket = bucket
+        self.backend = FirebaseStorageBackend(bucket) if bucket is not None else None
+    
+    def _select_backend(self):
+        """
+        Switch to the backend named by STORAGE_BACKEND (Firestore stays on Firebase) and set up
+        the SPILL_STORAGE_BACKEND for oversized payloads
+        """
+        try:
+            self.spill_backend = create_storage_backend(SPILL_STORAGE_BACKEND)
+        except Exception as e:
+            print(f"⚠️ Failed to initialize {SPILL_STORAGE_BACKEND} spill backend: {e}")
+        if DEFAULT_STORAGE_BACKEND in ("", "firebase"):
+            return
+        try:
+            self.backend = create_storage_backend(DEFAULT_STORAGE_BACKEND)
+            print(f"📦 Using {self.backend.name} storage backend")
+        except Exception as e:
+            print(f"⚠️ Failed to initialize {DEFAULT_STORAGE_BACKEND} storage backend: {e}")
     
     def _detect_storage_type(self) -> str:
         """Detect if Firebase is available and configured"""
@@ -50,7 +265,10 @@ class CloudStorageManager:
     
     def _initialize_firebase(self):
         """Initialize Firebase Admin SDK"""
+        global firebase_admin, credentials, storage, firestore
         print(f"🔧 [DEBUG] Initializing Firebase...")
+        import firebase_admin
+        from firebase_admin import credentials, storage, firestore
         
         service_account_key = os.environ.get("FIREBASE_SERVICE_ACCOUNT_KEY")
         bucket_name = os.environ.get("FIREBASE_STORAGE_BUCKET")
@@ -89,9 +307,10 @@ class CloudStorageManager:
         print(f"🔧 [DEBUG] Firestore client object: {type(self.firestore_db)}")
     
     def upload_file(self, file_data: bytes, filename: str, content_type: str, 
-                   user_id: str, file_uid: str) -> str:
+                   user_id: str, file_uid: str, file_type: Optional[str] = None, dedup: bool = True,
+                   shared_dedup: bool = False) -> str:
         """
-        Upload file to Firebase Storage and return public URL
+        Upload file to the storage backend and return its URL
         
         Args:
             file_data: Raw file bytes
@@ -99,40 +318,314 @@ class CloudStorageManager:
             content_type: MIME type (e.g., "video/mp4", "image/png")
             user_id: Firebase user ID
             file_uid: Unique identifier for this file
+            file_type: Storage folder ("image" / "video"); derived from content_type by default
+            dedup: Link to an identical object the user already has instead of uploading
+                (off for objects that are overwritten in place)
+            shared_dedup: Also look the content up in the index shared by all workers (a
+                Firestore read before the upload; off for freshly generated outputs)
             
         Returns:
             Public URL to access the file
         """
-        if self.storage_type == "firebase":
-            return self._upload_to_firebase(file_data, filename, content_type, user_id, file_uid)
+        if self.backend is not None:
+            storage_path = self._storage_path(content_type, user_id, file_uid, file_type)
+            if dedup and self.content_index is not None and len(file_data) >= DEDUP_MIN_BYTES:
+                return self._upload_deduplicated(storage_path, file_data, content_type, user_id, shared_dedup)
+            return self.backend.upload(storage_path, file_data, content_type)
         else:
             # Fallback to base64 encoding
             encoded_data = base64.b64encode(file_data).decode("utf-8")
             return f"data:{content_type};base64,{encoded_data}"
     
-    def _upload_to_firebase(self, file_data: bytes, filename: str, content_type: str,
-                           user_id: str, file_uid: str) -> str:
-        """Upload file to Firebase Storage"""
+    def _upload_deduplicated(self, path: str, data: bytes, content_type: str, user_id: str,
+                             shared: bool = False) -> str:
+        """
+        Upload unless the user already has an object with the same content: then the new
+        file_uid's URL points at that object (after checking it still has the same MD5) and
+        no bytes are sent. ``shared`` also consults the Firestore index of other workers.
+        """
+        checksum = content_md5(data)
+        entry, _ = self.content_index.lookup(user_id, checksum, remote=shared)
+        if entry is not None:
+            try:
+                if self.backend.stored(entry["path"], checksum):
+                    url = self.backend.link(entry["path"])
+                    print(f"♻️ {path} has the same content as {entry['path']}, linked without uploading")
+                    return url
+            except Exception as e:
+                print(f"⚠️ Could not link {path} to {entry['path']}, uploading it: {e}")
+            self.content_index.forget(user_id, checksum)
+        url = self.backend.upload(path, data, content_type, checksum=checksum)
+        self.content_index.record(user_id, checksum, {"path": path, "content_type": content_type, "size": len(data)})
+        return url
+    
+    def _index_document(self, user_id: str, checksum: str):
+        # Index path: generations/{user_id}/content_index/{md5}
+        return self.firestore_db.collection('generations').document(user_id).collection('content_index').document(checksum)
+    
+    def _get_index_entry(self, user_id: str, checksum: str) -> Optional[Dict[str, Any]]:
+        """Remote content index: the entry every worker recorded in Firestore"""
+        if self.storage_type != "firebase" or not self.firestore_db:
+            return None
+        snapshot = self._index_document(user_id, checksum).get(timeout=STATUS_WRITE_DEADLINE)
+        return snapshot.to_dict() if snapshot.exists else None
+    
+    def _put_index_entry(self, user_id: str, checksum: str, entry: Dict[str, Any]):
+        if self.storage_type != "firebase" or not self.firestore_db:
+            return
+        self._set_document(self._index_document(user_id, checksum), {**entry, 'modified': _server_timestamp()})
+    
+    def _storage_path(self, content_type: str, user_id: str, file_uid: str,
+                      file_type: Optional[str] = None) -> str:
         # Determine file type and extension from content type
-        if content_type.startswith("video/"):
-            file_type = "video"
-            extension = ".mp4"
-        else:
-            file_type = "image"
-            extension = ".png"
+        file_type = file_type or ("video" if content_type.startswith("video/") else "image")
+        extension = CONTENT_TYPE_EXTENSIONS.get(content_type, ".png")
         
         # Create simple path: generating/{user_id}/{file_type}/{file_uid}.extension
-        storage_path = f"generating/{user_id}/{file_type}/{file_uid}{extension}"
+        return f"generating/{user_id}/{file_type}/{file_uid}{extension}"
+    
+    def open_upload(self, content_type: str, user_id: str, file_uid: str, file_type: Optional[str] = None,
+                    size: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Start a streaming upload to the same path ``upload_file`` would use (chunked and
+        resumable on Firebase, multipart on S3)
+        
+        Feed it with ``write`` (e.g. straight from the video encoder) and pass it to
+        ``complete_upload``; the size may be unknown until the end.
+        """
+        if self.backend is None:
+            raise RuntimeError("No storage backend configured")
+        storage_path = self._storage_path(content_type, user_id, file_uid, file_type)
+        return self.backend.open_upload(storage_path, content_type, size=size, chunk_size=chunk_size)
+    
+    def complete_upload(self, upload) -> str:
+        """Send the rest of a streaming upload and return the object's URL"""
+        return self.backend.complete_upload(upload)
+    
+    def _document(self, user_id: str, media_type: str, file_uid: str):
+        # Document path: generations/{user_id}/{media_type}/{file_uid}
+        return self.firestore_db.collection('generations').document(user_id).collection(media_type).document(file_uid)
+    
+    def _get_journal(self) -> Optional[StatusJournal]:
+        """The status journal, opened on first use; None when disabled or it cannot be opened"""
+        if not self.journal_path or self.firestore_db is None:
+            return None
+        with self._journal_lock:
+            if self._journal is None:
+                try:
+                    self._journal = StatusJournal(self.journal_path, self._deliver_journaled,
+                                                  sentinels={"SERVER_TIMESTAMP": firestore.SERVER_TIMESTAMP})
+                    print(f"📒 Status journal at {self.journal_path}")
+                except Exception as e:
+                    print(f"⚠️ Status journal unavailable, writing to Firestore directly: {e}")
+                    self.journal_path = ""
+            return self._journal
+    
+    def _deliver_journaled(self, updates: List):
+        """Journal flusher: commit queued document updates as one Firestore batch"""
+        batch = self.firestore_db.batch()
+        for path, fields in updates:
+            batch.set(self.firestore_db.document(path), fields, merge=True)
+        batch.commit(timeout=STATUS_WRITE_DEADLINE)
+    
+    def _journal_writes(self, updates: List) -> bool:
+        """Hand updates to the journal; False when they have to be written directly"""
+        journal = self._get_journal()
+        if journal is None:
+            return False
+        try:
+            journal.append_many(updates)
+            return True
+        except Exception as e:
+            print(f"⚠️ Could not journal {len(updates)} update(s), writing directly: {e}")
+            return False
+    
+    def _set_document(self, doc_ref, fields: Dict[str, Any], immediate: bool = False) -> str:
+        """
+        Merge ``fields`` into a document, queue them on the job's write coalescer, or append
+        them to the status journal for background delivery
+        
+        ``immediate`` writes (live previews, progress) always go out now so clients see them
+        during generation; they are still counted as round-trips of the job.
+        
+        Returns:
+            "sent" when Firestore accepted the write, "queued" (coalescer) or "journaled"
+            when it will be delivered later
+        """
+        writes = _JOB_WRITES.get()
+        if writes is not None and not immediate:
+            writes.add(doc_ref, fields)
+            return "queued"
+        if not immediate and self._journal_writes([(doc_ref.path, fields)]):
+            return "journaled"
+        # merge=True writes are idempotent, so a transient failure is simply retried
+        self.status_retry.call(lambda attempt, remaining: doc_ref.set(fields, merge=True, **request_timeout(remaining)))
+        if writes is not None:
+            writes.record_round_trip(writes=1)
+        return "sent"
+    
+    def flush_writes(self) -> bool:
+        """
+        Commit the job's pending writes as one Firestore batch (a stage boundary), or append
+        them to the status journal in one transaction when it is enabled
+        
+        Returns:
+            True if there was nothing to write or the batch committed / was journaled, False otherwise
+        """
+        writes = _JOB_WRITES.get()
+        if writes is None:
+            return True
+        pending = writes.take()
+        if not pending:
+            return True
+        if self._journal_writes([(doc_ref.path, fields) for doc_ref, fields in pending]):
+            print(f"📒 Journaled {len(pending)} Firestore document update(s)")
+            return True
+        def commit(attempt, remaining):
+            batch = self.firestore_db.batch()
+            for doc_ref, fields in pending:
+                batch.set(doc_ref, fields, merge=True)
+            batch.commit(**request_timeout(remaining))
+        
+        try:
+            self.status_retry.call(commit)
+            writes.record_round_trip(batch=True)
+            print(f"✅ Committed {len(pending)} Firestore document update(s) in one batch")
+            return True
+        except Exception as e:
+            print(f"❌ Failed to commit Firestore batch: {e}")
+            return False
+    
+    def _get_spool(self) -> Optional[PayloadSpool]:
+        """The payload spool, opened on first use; None when disabled or it cannot be opened"""
+        if not self.spool_dir:
+            return None
+        with self._spool_lock:
+            if self._spool is None:
+                try:
+                    self._spool = PayloadSpool(self.spool_dir, self._deliver_spooled,
+                                               on_dead_letter=self._spool_gave_up)
+                    print(f"📥 Payload spool at {self.spool_dir}")
+                except Exception as e:
+                    print(f"⚠️ Payload spool unavailable: {e}")
+                    self.spool_dir = ""
+            return self._spool
+    
+    def _deliver_spooled(self, data: bytes, meta: Dict[str, Any]):
+        """Spool flusher: upload a payload and record its URL on the document that references it"""
+        if self.backend is None:
+            raise RuntimeError("No storage backend configured")
+        if self.content_index is not None and meta.get("user_id"):
+            # Off the job's critical path, so worth asking whether another worker stored it already
+            url = self._upload_deduplicated(meta["path"], data, meta["content_type"], meta["user_id"], shared=True)
+        else:
+            url = self.backend.upload(meta["path"], data, meta["content_type"], checksum=meta["key"])
+        if self.firestore_db is not None:
+            self._set_document(self.firestore_db.document(meta["document"]), {
+                'spilled_payloads': {meta["key"]: url},
+                'modified': _server_timestamp()
+            })
+    
+    def _spool_gave_up(self, meta: Dict[str, Any], error: Exception):
+        """Tell the referencing document its spooled payload will not arrive"""
+        if self.firestore_db is not None:
+            self._set_document(self.firestore_db.document(meta["document"]), {
+                'spilled_payloads': {meta["key"]: f"unavailable://{meta['path']}"},
+                'modified': _server_timestamp()
+            })
+    
+    def _spill_payload(self, data_uri: str, user_id: str, media_type: str, file_uid: str) -> str:
+        """
+        Store the bytes of an oversized data URI outside Firestore and return a reference:
+        the URL on the spill backend, or ``spooled://{path}`` while the spool retries the
+        upload (the document's ``spilled_payloads.{md5}`` gets the URL once it succeeds)
+        """
+        header, _, encoded = data_uri.partition(",")
+        content_type = header[len("data:"):].split(";")[0] or "application/octet-stream"
+        data = base64.b64decode(encoded) if header.endswith(";base64") else encoded.encode("utf-8")
+        key = content_md5(data)
+        path = self._storage_path(content_type, user_id, key, "spilled")
         
-        # Upload to Firebase Storage
-        blob = self.storage_bucket.blob(storage_path)
-        blob.upload_from_string(file_data, content_type=content_type)
+        if self.spill_backend is not None:
+            try:
+                return self.spill_backend.upload(path, data, content_type)
+            except Exception as e:
+                print(f"⚠️ Failed to spill payload to {self.spill_backend.name}, spooling it: {e}")
+        spool = self._get_spool()
+        if spool is not None:
+            document = f"generations/{user_id}/{media_type}/{file_uid}"
+            try:
+                # One entry per referencing document: each needs its own spilled_payloads URL
+                spool.put(f"{content_md5(document.encode('utf-8'))}-{key}", data, {
+                    "key": key,
+                    "user_id": user_id,
+                    "path": path,
+                    "content_type": content_type,
+                    "document": document,
+                })
+                return f"spooled://{path}"
+            except Exception as e:
+                print(f"⚠️ Failed to spool payload: {e}")
+        print(f"❌ Dropping {len(data)}-byte inline payload from generations/{user_id}/{media_type}/{file_uid}")
+        return f"unavailable://{path}"
+    
+    def _compact_payloads(self, value: Any, user_id: str, media_type: str, file_uid: str,
+                          spilled: Optional[Dict[str, str]] = None) -> Any:
+        """Copy of ``value`` with every data URI over INLINE_PAYLOAD_MAX_BYTES spilled (each once)"""
+        spilled = {} if spilled is None else spilled
+        if isinstance(value, dict):
+            return {k: self._compact_payloads(v, user_id, media_type, file_uid, spilled) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._compact_payloads(v, user_id, media_type, file_uid, spilled) for v in value]
+        if isinstance(value, str) and value.startswith("data:") and len(value) > INLINE_PAYLOAD_MAX_BYTES:
+            if value not in spilled:
+                spilled[value] = self._spill_payload(value, user_id, media_type, file_uid)
+            return spilled[value]
+        return value
+    
+    def dedup_stats(self) -> Optional[Dict[str, Any]]:
+        return self.content_index.stats() if self.content_index is not None else None
+    
+    def spool_stats(self) -> Optional[Dict[str, Any]]:
+        return self._spool.stats() if self._spool is not None else None
+    
+    def journal_stats(self) -> Optional[Dict[str, Any]]:
+        return self._journal.stats() if self._journal is not None else None
+    
+    def drain_journal(self, timeout: float = 10.0) -> bool:
+        """Wait for journaled status updates to reach Firestore; False on timeout"""
+        return self._journal.drain(timeout) if self._journal is not None else True
+    
+    def finish_job_writes(self, user_id: str, file_uid: str, media_type: str,
+                          timeout: float = STATUS_WRITE_DEADLINE) -> bool:
+        """
+        Wait for the journal to deliver a finished job's updates; when it does not within
+        ``timeout``, write the job's document (holding its final status) directly
         
-        # Make the file publicly accessible
-        blob.make_public()
+        Returns:
+            True when the document's updates reached Firestore, False if they are still queued
+        """
+        journal = self._journal
+        if journal is None or journal.drain(timeout):
+            return True
+        print(f"⚠️ Status journal not drained in {timeout}s, writing generations/{user_id}/{media_type}/{file_uid} now")
+        return journal.deliver_now(self._document(user_id, media_type, file_uid).path)
+    
+    @contextmanager
+    def coalesce_writes(self, writes: Optional[WriteCoalescer] = None):
+        """
+        Coalesce this context's Firestore writes; pending writes are committed on exit
         
-        print(f"✅ Uploaded to Firebase Storage: {storage_path}")
-        return blob.public_url
+        Pass the same ``writes`` to several contexts (e.g. the request thread and the job's
+        background thread) to count the whole job.
+        """
+        writes = writes or WriteCoalescer()
+        token = _JOB_WRITES.set(writes)
+        try:
+            yield writes
+        finally:
+            self.flush_writes()
+            _JOB_WRITES.reset(token)
     
     def update_generation_status(self, user_id: str, file_uid: str, 
                                generation_data: Dict[str, Any], media_type: str = "videos") -> bool:
@@ -146,26 +639,30 @@ class CloudStorageManager:
             media_type: Type of media ("videos" or "images")
             
         Returns:
-            True if successful, False otherwise
+            True if the update was written or queued for delivery, False otherwise
         """
         if self.storage_type != "firebase" or not self.firestore_db:
             print("⚠️ Firestore not available, skipping database update")
             return False
         
         try:
-            # Document path: generations/{user_id}/{media_type}/{file_uid}
-            doc_ref = self.firestore_db.collection('generations').document(user_id).collection(media_type).document(file_uid)
+            doc_ref = self._document(user_id, media_type, file_uid)
+            # Outputs that fell back to base64 are stored elsewhere; the document gets references
+            generation_data = self._compact_payloads(generation_data, user_id, media_type, file_uid)
             
             # Update document with generation results
-            doc_ref.set({
+            outcome = self._set_document(doc_ref, {
                 'status': 'completed',
-                'completed_at': firestore.SERVER_TIMESTAMP,
+                'completed_at': _server_timestamp(),
                 'generation_data': generation_data,
                 'file_uid': file_uid,
                 'user_id': user_id
-            }, merge=True)
+            })
             
-            print(f"✅ Updated Firestore: generations/{user_id}/{media_type}/{file_uid}")
+            if outcome == "sent":
+                print(f"✅ Updated Firestore: generations/{user_id}/{media_type}/{file_uid}")
+            else:
+                print(f"📒 Queued Firestore update ({outcome}): generations/{user_id}/{media_type}/{file_uid}")
             return True
             
         except Exception as e:
@@ -183,36 +680,207 @@ class CloudStorageManager:
             media_type: Type of media ("videos" or "images")
             
         Returns:
-            True if successful, False otherwise
+            True if the update was written or queued for delivery, False otherwise
         """
         if self.storage_type != "firebase" or not self.firestore_db:
             print("⚠️ Firestore not available, skipping media ready update")
             return False
         
         try:
-            # Document path: generations/{user_id}/{media_type}/{file_uid}
-            doc_ref = self.firestore_db.collection('generations').document(user_id).collection(media_type).document(file_uid)
+            doc_ref = self._document(user_id, media_type, file_uid)
             
             # Update document with generated status
-            doc_ref.set({
+            outcome = self._set_document(doc_ref, {
                 'generated': True,
-                'modified': firestore.SERVER_TIMESTAMP
-            }, merge=True)
+                'modified': _server_timestamp()
+            })
             
-            print(f"✅ Marked media ready: generations/{user_id}/{media_type}/{file_uid}")
+            if outcome == "sent":
+                print(f"✅ Marked media ready: generations/{user_id}/{media_type}/{file_uid}")
+            else:
+                print(f"📒 Queued media ready ({outcome}): generations/{user_id}/{media_type}/{file_uid}")
             return True
             
         except Exception as e:
             print(f"❌ Failed to mark media ready: {e}")
             return False
 
+    def update_preview(self, user_id: str, file_uid: str, preview_url: str, step: int,
+                       total_steps: Optional[int] = None, media_type: str = "videos") -> bool:
+        """
+        Record the latest live preview on the generation document without touching its status
+        
+        Args:
+            user_id: Firebase user ID
+            file_uid: Unique identifier for this generation
+            preview_url: URL of the preview JPEG
+            step: Denoising step the preview was taken at
+            total_steps: Total denoising steps, if known
+            media_type: Type of media ("videos" or "images")
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        if self.storage_type != "firebase" or not self.firestore_db:
+            return False
+        
+        try:
+            doc_ref = self._document(user_id, media_type, file_uid)
+            self._set_document(doc_ref, {
+                'preview_url': preview_url,
+                'preview_step': step,
+                'preview_total_steps': total_steps,
+                'modified': _server_timestamp()
+            }, immediate=True)
+            return True
+            
+        except Exception as e:
+            print(f"❌ Failed to update live preview: {e}")
+            return False
+    
+    def update_progress(self, user_id: str, file_uid: str, progress: Dict[str, Any],
+                        media_type: str = "videos") -> bool:
+        """
+        Record generation progress (e.g. long-video windows done) without touching the status
+        
+        Args:
+            user_id: Firebase user ID
+            file_uid: Unique identifier for this generation
+            progress: Progress fields, stored under 'progress'
+            media_type: Type of media ("videos" or "images")
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        if self.storage_type != "firebase" or not self.firestore_db:
+            return False
+        
+        try:
+            doc_ref = self._document(user_id, media_type, file_uid)
+            self._set_document(doc_ref, {
+                'progress': progress,
+                'modified': _server_timestamp()
+            }, immediate=True)
+            return True
+            
+        except Exception as e:
+            print(f"❌ Failed to update progress: {e}")
+            return False
+
 
 # Global instance
 cloud_storage = CloudStorageManager()
 
 
+def publish_live_preview(jpeg_bytes: bytes, user_id: str, file_uid: str, step: int,
+                         total_steps: Optional[int] = None, media_type: str = "videos") -> Optional[str]:
+    """
+    Upload a live preview JPEG to generating/{user_id}/image/{file_uid}_live.jpg and point the
+    generation document at it. The same object is overwritten on every preview.
+    
+    Returns:
+        Cache-busted preview URL, or None when cloud storage is not configured
+    """
+    if cloud_storage.storage_type != "firebase":
+        return None
+    
+    url = cloud_storage.upload_file(
+        file_data=jpeg_bytes,
+        filename="",
+        content_type="image/jpeg",
+        user_id=user_id,
+        file_uid=f"{file_uid}_live",
+        dedup=False
+    )
+    # Signed URLs already carry a query string
+    preview_url = f"{url}{'&' if '?' in url else '?'}step={step}"
+    cloud_storage.update_preview(user_id, file_uid, preview_url, step, total_steps, media_type)
+    return preview_url
+
+
+def _upload_renditions(renditions: Dict[str, Any], user_id: str, image_file_uid: str,
+                       file_type: str = "image") -> Dict[str, Any]:
+    """
+    Start concurrent uploads of an image's (or video's) renditions to
+    generating/{user_id}/{file_type}/{image_file_uid}_{name}.{ext}
+
+    Returns:
+        {rendition name: Future resolving to the public URL}
+    """
+    return {
+        name: _UPLOAD_POOL.submit(
+            cloud_storage.upload_file,
+            file_data=encoded.data,
+            filename="",
+            content_type=encoded.content_type,
+            user_id=user_id,
+            file_uid=f"{image_file_uid}_{name}",
+            file_type=file_type,
+        )
+        for name, encoded in renditions.items()
+    }
+
+
+def _collect_rendition_urls(futures: Dict[str, Any], owner: str) -> Dict[str, str]:
+    """Wait for rendition uploads; a failed rendition is logged and left out"""
+    urls = {}
+    for name, future in futures.items():
+        try:
+            urls[name] = future.result()
+        except Exception as e:
+            print(f"⚠️ Failed to upload {name} rendition of {owner}: {e}")
+    return urls
+
+
+def _upload_image(index: int, encoded: Any, user_id: str, image_file_uid: str):
+    """
+    Upload one image, make it public and mark it ready; on failure record the error on its
+    document and fall back to a base64 data URI
+    
+    Returns:
+        (URL or data URI, seconds spent)
+    """
+    start = time.perf_counter()
+    try:
+        print(f"🔧 [DEBUG] Uploading image {index} with file_uid={image_file_uid}")
+        image_url = cloud_storage.upload_file(
+            file_data=encoded.data,
+            filename="",  # Not used anymore
+            content_type=encoded.content_type,
+            user_id=user_id,
+            file_uid=image_file_uid
+        )
+        print(f"✅ [DEBUG] Image {index} uploaded successfully: {image_url}")
+        
+        # Mark image as ready in Firestore
+        cloud_storage.mark_media_ready(user_id, image_file_uid, "images")
+        
+    except Exception as e:
+        print(f"❌ [DEBUG] Failed to upload image {index}: {type(e).__name__}: {e}")
+        print(f"❌ Failed to upload image {index}: {e}")
+        # Update Firestore with error status for this image
+        error_data = {
+            "generated": False,
+            "error": True,
+            "status": "failed",
+            "error_message": str(e),
+            "error_type": type(e).__name__,
+            "failed_at": _server_timestamp(),
+            "modified": _server_timestamp()
+        }
+        cloud_storage.update_generation_status(user_id, image_file_uid, error_data, "images")
+        
+        # Fallback to base64
+        image_data = base64.b64encode(encoded.data).decode("utf-8")
+        image_url = f"data:{encoded.content_type};base64,{image_data}"
+    
+    return image_url, time.perf_counter() - start
+
+
 def save_and_upload_images_cloud(images: List, job_id: str, user_id: str, 
-                                 file_uid: str) -> List[str]:
+                                 file_uid: str, output_format: Optional[str] = None,
+                                 quality: Optional[int] = None,
+                                 compression_preset: Optional[str] = None) -> List[str]:
     """
     Save images to cloud storage and return URLs
     This function is called by RunPod after Firebase function creates initial request
@@ -222,6 +890,9 @@ def save_and_upload_images_cloud(images: List, job_id: str, user_id: str,
         job_id: RunPod job ID (for local temp storage)
         user_id: Firebase user ID (provided by Firebase function)
         file_uid: Unique identifier for this generation (provided by Firebase function)
+        output_format: "png", "jpeg", "webp" or "avif" (default: IMAGE_OUTPUT_FORMAT)
+        quality: 1-100 quality for lossy formats
+        compression_preset: "fast", "balanced" or "small" encoder effort
         
     Returns:
         List of public URLs to access the images
@@ -230,15 +901,21 @@ def save_and_upload_images_cloud(images: List, job_id: str, user_id: str,
     print(f"🔧 [DEBUG] Cloud storage type: {cloud_storage.storage_type}")
     
     image_urls = []
+    image_renditions = []
+    
+    # Encode all images in parallel on the encoder pool
+    encoded_images = encode_images(images, output_format, quality, compression_preset)
+    
+    # Smaller renditions (preview, thumbnail) are only worth producing when they can be uploaded
+    rendition_specs = parse_renditions() if cloud_storage.backend is not None else []
+    encoded_renditions = encode_renditions(images, rendition_specs, quality) if rendition_specs else [{} for _ in images]
     
-    for index, image in enumerate(images):
+    # Each image's upload, ACL change and ready mark run on the shared upload pool; every task
+    # gets a copy of this job's context so its Firestore writes join the job's batch
+    image_futures = []
+    for index, encoded in enumerate(encoded_images):
         print(f"🔧 [DEBUG] Processing image {index+1}/{len(images)}")
-        
-        # Convert PIL image to bytes
-        img_buffer = BytesIO()
-        image.save(img_buffer, format='PNG')
-        img_bytes = img_buffer.getvalue()
-        print(f"🔧 [DEBUG] Image {index} converted to {len(img_bytes)} bytes")
+        print(f"🔧 [DEBUG] Image {index} encoded to {len(encoded.data)} bytes ({encoded.content_type})")
         
         # For multiple images, append index to file_uid
         if len(images) > 1:
@@ -246,40 +923,21 @@ def save_and_upload_images_cloud(images: List, job_id: str, user_id: str,
         else:
             image_file_uid = file_uid
         
-        # Upload to cloud storage
-        try:
-            print(f"🔧 [DEBUG] Uploading image {index} with file_uid={image_file_uid}")
-            image_url = cloud_storage.upload_file(
-                file_data=img_bytes,
-                filename="",  # Not used anymore
-                content_type="image/png",
-                user_id=user_id,
-                file_uid=image_file_uid
-            )
-            print(f"✅ [DEBUG] Image {index} uploaded successfully: {image_url}")
-            image_urls.append(image_url)
-            
-            # Mark image as ready in Firestore
-            cloud_storage.mark_media_ready(user_id, image_file_uid, "images")
-            
-        except Exception as e:
-            print(f"❌ [DEBUG] Failed to upload image {index}: {type(e).__name__}: {e}")
-            print(f"❌ Failed to upload image {index}: {e}")
-            # Update Firestore with error status for this image
-            error_data = {
-                "generated": False,
-                "error": True,
-                "status": "failed",
-                "error_message": str(e),
-                "error_type": type(e).__name__,
-                "failed_at": firestore.SERVER_TIMESTAMP,
-                "modified": firestore.SERVER_TIMESTAMP
-            }
-            cloud_storage.update_generation_status(user_id, image_file_uid, error_data, "images")
-            
-            # Fallback to base64
-            image_data = base64.b64encode(img_bytes).decode("utf-8")
-            image_urls.append(f"data:image/png;base64,{image_data}")
+        # Renditions upload concurrently with the full-size image
+        rendition_futures = _upload_renditions(encoded_renditions[index], user_id, image_file_uid)
+        image_future = _UPLOAD_POOL.submit(
+            copy_context().run, _upload_image, index, encoded, user_id, image_file_uid
+        )
+        image_futures.append((image_future, rendition_futures))
+    
+    # Collect in submission order so URLs line up with the input images
+    upload_seconds = []
+    for index, (image_future, rendition_futures) in enumerate(image_futures):
+        image_url, seconds = image_future.result()
+        image_urls.append(image_url)
+        upload_seconds.append(round(seconds, 3))
+        image_renditions.append(_collect_rendition_urls(rendition_futures, f"image {index}"))
+    print(f"📤 Image upload latency (s): {upload_seconds}")
     
     # Update main document with final data
     try:
@@ -287,10 +945,12 @@ def save_and_upload_images_cloud(images: List, job_id: str, user_id: str,
             "generated": True,
             "error": False,
             "image_urls": image_urls,
+            "image_renditions": image_renditions,
+            "image_upload_seconds": upload_seconds,
             "status": "completed",
             "image_count": len(images),
-            "completed_at": firestore.SERVER_TIMESTAMP,
-            "modified": firestore.SERVER_TIMESTAMP
+            "completed_at": _server_timestamp(),
+            "modified": _server_timestamp()
         }
         cloud_storage.update_generation_status(user_id, file_uid, generation_data, "images")
     except Exception as e:
@@ -303,8 +963,8 @@ def save_and_upload_images_cloud(images: List, job_id: str, user_id: str,
                 "status": "failed",
                 "error_message": f"Failed to update final status: {str(e)}",
                 "error_type": type(e).__name__,
-                "failed_at": firestore.SERVER_TIMESTAMP,
-                "modified": firestore.SERVER_TIMESTAMP
+                "failed_at": _server_timestamp(),
+                "modified": _server_timestamp()
             }
             cloud_storage.update_generation_status(user_id, file_uid, error_data, "images")
         except:
@@ -313,8 +973,59 @@ def save_and_upload_images_cloud(images: List, job_id: str, user_id: str,
     return image_urls
 
 
+class VideoUploadStream:
+    """
+    ``on_chunk`` consumer for the video encoder that uploads the MP4 while it is being encoded
+    
+    Encoded bytes are kept (the job still needs them for the base64 fallback) and forwarded
+    to a resumable upload on a private single-thread executor, so chunks go out in order and
+    a slow network never stalls ffmpeg's output pipe. If the upload cannot be opened or a
+    chunk fails for good, streaming stops and ``finish`` returns None so the caller falls
+    back to a regular upload of the buffered bytes.
+    """
+    
+    def __init__(self, user_id: str, file_uid: str, content_type: str = "video/mp4"):
+        self.buffer = bytearray()
+        self.upload = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="video-upload")
+        self._pending = None
+        try:
+            self.upload = cloud_storage.open_upload(content_type, user_id, file_uid)
+        except Exception as e:
+            print(f"⚠️ Streaming upload unavailable, uploading after encoding: {e}")
+    
+    def __call__(self, chunk: bytes):
+        self.buffer += chunk
+        if self.upload is not None:
+            self._pending = self._executor.submit(self._write, chunk)
+    
+    def _write(self, chunk: bytes):
+        if self.upload is None:
+            return
+        try:
+            self.upload.write(chunk)
+        except Exception as e:
+            print(f"⚠️ Streaming upload failed, uploading after encoding: {e}")
+            self.upload = None
+    
+    def finish(self) -> Optional[str]:
+        """Complete the upload and return its public URL, or None if streaming failed"""
+        if self._pending is not None:
+            self._pending.result()
+        self._executor.shutdown(wait=True)
+        if self.upload is None:
+            return None
+        try:
+            return cloud_storage.complete_upload(self.upload)
+        except Exception as e:
+            print(f"⚠️ Streaming upload failed to complete: {e}")
+            return None
+
+
 def save_and_upload_video_cloud(video_frames: List, job_id: str, user_id: str,
-                               file_uid: str, fps: int = 15) -> str:
+                               file_uid: str, fps: int = 15, video_bytes: Optional[bytes] = None,
+                               previews: Optional[Dict[str, Any]] = None,
+                               video_url: Optional[str] = None) -> str:
     """
     Save video to cloud storage and return URL
     This function is called by RunPod after Firebase function creates initial request
@@ -325,49 +1036,39 @@ def save_and_upload_video_cloud(video_frames: List, job_id: str, user_id: str,
         user_id: Firebase user ID (provided by Firebase function)
         file_uid: Unique identifier for this generation (provided by Firebase function)
         fps: Frames per second
+        video_bytes: Already-encoded MP4 (skips encoding the frames)
+        previews: {name: EncodedImage} poster / animated previews, uploaded concurrently with
+            the MP4 as {file_uid}_{name}.{ext}
+        video_url: URL of an MP4 already uploaded while encoding (see VideoUploadStream)
         
     Returns:
         Public URL to access the video
     """
-    import tempfile
-    from diffusers.utils import export_to_video
-    
     print(f"🔧 [DEBUG] save_and_upload_video_cloud called with {len(video_frames)} frames, user_id={user_id}, file_uid={file_uid}")
     print(f"🔧 [DEBUG] Cloud storage type: {cloud_storage.storage_type}")
     
-    temp_video_path = None
-    video_bytes = None
-    
     try:
-        # Create temporary file for video export
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
-            temp_video_path = temp_file.name
+        # Stream frames through the encoder straight into memory (no temp file round-trip)
+        if video_bytes is None:
+            video_bytes = encode_video(video_frames, fps=fps)
+        print(f"🔧 [DEBUG] Video encoded to {len(video_bytes)} bytes")
         
-        print(f"🔧 [DEBUG] Exporting video to temp path: {temp_video_path}")
-        # Export video using diffusers utility
-        export_to_video(video_frames, temp_video_path, fps=fps)
+        # Previews upload on the shared pool while the MP4 uploads here
+        preview_futures = _upload_renditions(previews or {}, user_id, file_uid, "video")
         
-        # Read video file as bytes
-        with open(temp_video_path, 'rb') as video_file:
-            video_bytes = video_file.read()
-        
-        print(f"🔧 [DEBUG] Video exported to {len(video_bytes)} bytes")
-        
-        # Clean up temp file
-        os.unlink(temp_video_path)
-        temp_video_path = None  # Mark as cleaned up
-        
-        # Upload to cloud storage
-        print(f"🔧 [DEBUG] Uploading video to cloud storage")
-        video_url = cloud_storage.upload_file(
-            file_data=video_bytes,
-            filename="",  # Not used anymore
-            content_type="video/mp4",
-            user_id=user_id,
-            file_uid=file_uid
-        )
+        # Upload to cloud storage unless it was streamed up during encoding
+        if video_url is None:
+            print(f"🔧 [DEBUG] Uploading video to cloud storage")
+            video_url = cloud_storage.upload_file(
+                file_data=video_bytes,
+                filename="",  # Not used anymore
+                content_type="video/mp4",
+                user_id=user_id,
+                file_uid=file_uid
+            )
         
         print(f"✅ [DEBUG] Video uploaded successfully: {video_url}")
+        video_previews = _collect_rendition_urls(preview_futures, "video")
         
         # Mark media as ready and update with final URL
         cloud_storage.mark_media_ready(user_id, file_uid, "videos")
@@ -377,10 +1078,11 @@ def save_and_upload_video_cloud(video_frames: List, job_id: str, user_id: str,
             "generated": True,
             "error": False,
             "video_url": video_url,
+            "video_previews": video_previews,
             "status": "completed",
             "fps": fps,
-            "completed_at": firestore.SERVER_TIMESTAMP,
-            "modified": firestore.SERVER_TIMESTAMP
+            "completed_at": _server_timestamp(),
+            "modified": _server_timestamp()
         }
         cloud_storage.update_generation_status(user_id, file_uid, generation_data, "videos")
         
@@ -389,13 +1091,6 @@ def save_and_upload_video_cloud(video_frames: List, job_id: str, user_id: str,
     except Exception as e:
         print(f"❌ Failed to upload video: {e}")
         
-        # Clean up temp file if it exists
-        if temp_video_path and os.path.exists(temp_video_path):
-            try:
-                os.unlink(temp_video_path)
-            except:
-                pass
-        
         # Update Firestore with error status
         error_data = {
             "generated": False,
@@ -403,8 +1098,8 @@ def save_and_upload_video_cloud(video_frames: List, job_id: str, user_id: str,
             "status": "failed",
             "error_message": str(e),
             "error_type": type(e).__name__,
-            "failed_at": firestore.SERVER_TIMESTAMP,
-            "modified": firestore.SERVER_TIMESTAMP
+            "failed_at": _server_timestamp(),
+            "modified": _server_timestamp()
         }
         cloud_storage.update_generation_status(user_id, file_uid, error_data, "videos")
         
@@ -0,0 +1,39 @@
+"""
+Shared pytest fixtures for the worker's tests
+"""
+
+import types
+
+import pytest
+
+import cloud_storage as cloud_storage_module
+from test_firestore_batching import FakeFirestore
+from test_image_renditions import FakeBucket
+
+
+@pytest.fixture
+def fake_cloud(monkeypatch):
+    """
+    Point the global cloud_storage manager at an in-memory Firestore and bucket
+
+    Call it as ``storage, db, bucket = fake_cloud(...)``: ``bucket`` / ``db`` replace the
+    default fakes, other keywords are set on the manager afterwards (e.g. ``journal_path``).
+    Status writes go straight to the fake Firestore unless a journal path is given, and no
+    image renditions are made unless IMAGE_RENDITIONS is set again.
+    """
+    def use(bucket=None, db=None, **overrides):
+        storage = cloud_storage_module.cloud_storage
+        db = FakeFirestore() if db is None else db
+        bucket = FakeBucket() if bucket is None else bucket
+        monkeypatch.setattr(storage, "storage_type", "firebase")
+        monkeypatch.setattr(storage, "storage_bucket", bucket)
+        monkeypatch.setattr(storage, "firestore_db", db)
+        monkeypatch.setattr(storage, "journal_path", "")
+        monkeypatch.setattr(storage, "_journal", None)
+        monkeypatch.setattr(cloud_storage_module, "firestore",
+                            types.SimpleNamespace(SERVER_TIMESTAMP="SERVER_TIMESTAMP"), raising=False)
+        monkeypatch.setenv("IMAGE_RENDITIONS", "")
+        for name, value in overrides.items():
+            monkeypatch.setattr(storage, name, value)
+        return storage, db, bucket
+    return use
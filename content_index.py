@@ -0,0 +1,110 @@
+"""
+Content Index for SDXL Worker
+Index of stored objects by content hash, so an output identical to one already uploaded (a
+retried job, a repeated seed, a spooled fallback) is linked to the existing object instead of
+being sent again
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_DEDUP_ENABLED = os.environ.get("UPLOAD_DEDUP", "true").lower() in ("1", "true", "yes")
+# Smaller objects are cheaper to upload again than to look up remotely
+DEDUP_MIN_BYTES = int(os.environ.get("DEDUP_MIN_BYTES", "16384"))
+DEDUP_INDEX_SIZE = int(os.environ.get("DEDUP_INDEX_SIZE", "4096"))
+
+
+class ContentIndex:
+    """
+    Stored objects keyed by (owner, content MD5)
+
+    A bounded in-process LRU sits in front of an optional remote index shared by all workers:
+    ``remote_get(owner, checksum)`` returns an entry or None, ``remote_put(owner, checksum,
+    entry)`` stores one; both may raise, which counts as a miss / is logged. Entries are dicts
+    with at least the object's ``path``. Recording a new object at a path drops local entries
+    that pointed at the content it replaced.
+    """
+
+    def __init__(self, max_entries: int = DEDUP_INDEX_SIZE,
+                 remote_get: Optional[Callable[[str, str], Optional[Dict[str, Any]]]] = None,
+                 remote_put: Optional[Callable[[str, str, Dict[str, Any]], None]] = None):
+        self.max_entries = max_entries
+        self.remote_get = remote_get
+        self.remote_put = remote_put
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._paths: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+        self.remote_errors = 0
+
+    def lookup(self, owner: str, checksum: str,
+               remote: bool = True) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """(entry, "local" / "remote"), or (None, None) when the content is not known; ``remote``
+        False checks the local LRU only"""
+        key = (owner, checksum)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.local_hits += 1
+                return entry, "local"
+
+        entry = None
+        if remote and self.remote_get is not None:
+            try:
+                entry = self.remote_get(owner, checksum)
+            except Exception as e:
+                with self._lock:
+                    self.remote_errors += 1
+                print(f"⚠️ Content index lookup failed: {e}")
+        with self._lock:
+            if entry is None or "path" not in entry:
+                self.misses += 1
+                return None, None
+            self.remote_hits += 1
+            self._store(key, entry)
+        return entry, "remote"
+
+    def record(self, owner: str, checksum: str, entry: Dict[str, Any]):
+        """Index an object that was just stored, locally and remotely"""
+        with self._lock:
+            self._store((owner, checksum), entry)
+        if self.remote_put is not None:
+            try:
+                self.remote_put(owner, checksum, entry)
+            except Exception as e:
+                print(f"⚠️ Content index update failed: {e}")
+
+    def forget(self, owner: str, checksum: str):
+        """Drop a local entry whose object turned out to be gone or changed"""
+        with self._lock:
+            entry = self._entries.pop((owner, checksum), None)
+            if entry is not None:
+                self._paths.pop((owner, entry["path"]), None)
+
+    def _store(self, key: Tuple[str, str], entry: Dict[str, Any]):
+        path_key = (key[0], entry["path"])
+        replaced = self._paths.get(path_key)
+        if replaced is not None and replaced != key:
+            self._entries.pop(replaced, None)
+        self._paths[path_key] = key
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._paths.pop((evicted_key[0], evicted["path"]), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "local_hits": self.local_hits,
+                "remote_hits": self.remote_hits,
+                "misses": self.misses,
+                "remote_errors": self.remote_errors,
+            }
@@ -0,0 +1,186 @@
+"""
+Denoising Checkpoints for SDXL Worker
+Saves Wan denoising state (latents, step, scheduler history, RNG) to the volume every few steps
+so a preempted or requeued job with the same file_uid resumes instead of starting over
+"""
+
+import os
+import json
+import time
+import hashlib
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import torch
+
+DEFAULT_CHECKPOINT_DIR = os.environ.get("DENOISE_CHECKPOINT_DIR", "/runpod-volume/checkpoints")
+# 0 disables checkpointing
+DEFAULT_CHECKPOINT_EVERY = int(os.environ.get("DENOISE_CHECKPOINT_EVERY", "5"))
+
+# Multistep solver history (UniPC) and step counters; missing attributes are skipped, so
+# single-step schedulers (flow-match Euler) only carry their step index
+SCHEDULER_STATE_KEYS = ("_step_index", "model_outputs", "timestep_list", "lower_order_nums",
+                        "last_sample", "this_order")
+
+
+def checkpoint_signature(**params) -> str:
+    """Hash of the generation parameters; a checkpoint only resumes an identical request"""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _to_device(value, device):
+    if isinstance(value, torch.Tensor):
+        return value.detach().to(device, copy=True)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_device(item, device) for item in value)
+    return value
+
+
+def capture_scheduler_state(scheduler) -> Dict[str, Any]:
+    return {key: _to_device(getattr(scheduler, key), "cpu") for key in SCHEDULER_STATE_KEYS if hasattr(scheduler, key)}
+
+
+def restore_scheduler_state(scheduler, state: Dict[str, Any], device):
+    for key, value in state.items():
+        setattr(scheduler, key, _to_device(value, device))
+
+
+class DenoiseCheckpointer:
+    """
+    ``callback_on_step_end`` hook that writes a checkpoint every ``every_n_steps`` steps
+
+    Checkpoints are written to a temporary file and renamed over the previous one, so a
+    worker killed mid-write leaves the last complete checkpoint in place. ``resume`` loads a
+    matching checkpoint and makes the pipeline continue from its step.
+    """
+
+    def __init__(self, file_uid: str, signature: str, total_steps: int,
+                 every_n_steps: int = DEFAULT_CHECKPOINT_EVERY, directory: str = DEFAULT_CHECKPOINT_DIR):
+        self.path = os.path.join(directory, f"{file_uid}.pt")
+        self.signature = signature
+        self.total_steps = total_steps
+        self.every_n_steps = every_n_steps
+        self.start_step = 0
+
+        self.saves = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self._started = None
+        self._elapsed = 0.0
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """The saved checkpoint for this request, or None if there is none or it does not match"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            checkpoint = torch.load(self.path, map_location="cpu", weights_only=False)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+        if checkpoint.get("signature") != self.signature:
+            print(f"⚠️ Ignoring checkpoint {self.path}: saved for different generation parameters")
+            return None
+        return checkpoint
+
+    def save(self, pipe, step: int, latents: torch.Tensor):
+        start = time.perf_counter()
+        state = {
+            "signature": self.signature,
+            "step": step,
+            "latents": latents.detach().to("cpu", copy=True),
+            "scheduler": capture_scheduler_state(pipe.scheduler),
+            "rng": {
+                "cpu": torch.get_rng_state(),
+                "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+            },
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as checkpoint_file:
+            torch.save(state, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, self.path)
+
+        self.saves += 1
+        self.bytes = os.path.getsize(self.path)
+        self.seconds += time.perf_counter() - start
+
+    def __call__(self, pipe, step: int, timestep, callback_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if self._started is None:
+            self._started = time.perf_counter()
+        completed = self.start_step + step + 1
+        # Nothing to resume after the final step
+        if self.every_n_steps > 0 and completed % self.every_n_steps == 0 and completed < self.total_steps:
+            try:
+                self.save(pipe, completed, callback_kwargs["latents"])
+            except Exception as e:
+                print(f"⚠️ Failed to write denoising checkpoint at step {completed}: {e}")
+        self._elapsed = time.perf_counter() - self._started
+        return callback_kwargs
+
+    @contextmanager
+    def resume(self, pipe):
+        """
+        Load a matching checkpoint and, while the context is open, make ``pipe`` continue from it
+
+        The scheduler's ``set_timesteps`` is wrapped for the call: after computing the full
+        schedule it restores the solver history and hands the pipeline's loop only the remaining
+        timesteps. The solver indexes its schedule by absolute step, so the full schedule is put
+        back before the first ``step``. Yields the saved latents (pass them as ``latents=``) or
+        None when starting fresh.
+        """
+        checkpoint = self.load()
+        if checkpoint is None:
+            yield None
+            return
+
+        scheduler = pipe.scheduler
+        step = checkpoint["step"]
+        original_set_timesteps = scheduler.set_timesteps
+        original_step = scheduler.step
+        full_timesteps = None
+
+        def first_step(*args, **kwargs):
+            scheduler.timesteps = full_timesteps
+            del scheduler.step
+            return original_step(*args, **kwargs)
+
+        def set_timesteps(*args, **kwargs):
+            nonlocal full_timesteps
+            original_set_timesteps(*args, **kwargs)
+            full_timesteps = scheduler.timesteps
+            restore_scheduler_state(scheduler, checkpoint["scheduler"], full_timesteps.device)
+            # The pipeline reads scheduler.timesteps right after this call to build its loop
+            scheduler.timesteps = full_timesteps[step:]
+            scheduler.step = first_step
+
+        torch.set_rng_state(checkpoint["rng"]["cpu"])
+        if checkpoint["rng"]["cuda"] and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(checkpoint["rng"]["cuda"])
+
+        self.start_step = step
+        print(f"♻️ Resuming denoising from checkpoint at step {step}/{self.total_steps}")
+        scheduler.set_timesteps = set_timesteps
+        try:
+            yield checkpoint["latents"]
+        finally:
+            vars(scheduler).pop("set_timesteps", None)
+            vars(scheduler).pop("step", None)
+
+    def clear(self):
+        """Remove the checkpoint once the job has finished"""
+        for path in (self.path, f"{self.path}.tmp"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "every_n_steps": self.every_n_steps,
+            "resumed_from_step": self.start_step,
+            "saves": self.saves,
+            "seconds": round(self.seconds, 3),
+            "mb": round(self.bytes / 1e6, 1),
+            "overhead_pct": round(self.seconds / self._elapsed * 100, 2) if self._elapsed else 0.0,
+        }
@@ -0,0 +1,331 @@
+"""
+Persistent Embedding Store for SDXL Worker
+Memory-mapped key-value store on the shared RunPod volume for prompt embeddings and VAE latents,
+so a freshly scaled-up worker can reuse encoder work done by earlier workers
+"""
+
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import fcntl
+import hashlib
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+# Record layout (all records are 64-byte aligned so array payloads can be viewed in place):
+#   magic (4s) | header_len (I) | payload_len (Q) | crc32 of header+payload (I) | header JSON | payload
+RECORD_MAGIC = b"EMB1"
+RECORD_PREFIX = struct.Struct("<4sIQI")
+RECORD_ALIGNMENT = 64
+
+DEFAULT_STORE_DIR = "/runpod-volume/embedding-cache"
+DEFAULT_MAX_MB = 2048
+
+# After compaction the log is trimmed to this fraction of the size cap, so a busy
+# worker does not compact again on the very next write
+COMPACT_TARGET_RATIO = 0.75
+
+
+def _align(size: int) -> int:
+    return (size + RECORD_ALIGNMENT - 1) // RECORD_ALIGNMENT * RECORD_ALIGNMENT
+
+
+class EmbeddingStore:
+    """
+    Append-only, memory-mapped store shared by every worker mounting the same volume
+
+    Writers append records under an exclusive file lock; readers map the log and
+    index it incrementally without taking the lock. Compaction rewrites the live
+    entries into a fresh file (evicting least recently used ones beyond the size
+    cap) and atomically swaps it in, which other workers detect by inode change.
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.data_path = os.path.join(root, "store.log")
+        self.lock_path = os.path.join(root, "store.lock")
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._file = None
+        self._mmap = None
+        self._inode = None
+        self._scanned = 0
+        # key -> (record start, payload start, header dict, record end)
+        self._index: Dict[str, Tuple[int, int, Dict[str, Any], int]] = {}
+        self._verified = set()
+        self._last_used: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Build a stable key from model identifiers and inputs (prompt text, image URL, size...)"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(repr(part).encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def _reopen(self):
+        """(Re)open the log file, e.g. after another worker compacted it"""
+        self._mmap = None
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._index = {}
+        self._verified = set()
+        self._scanned = 0
+        self._inode = None
+        if os.path.exists(self.data_path):
+            self._file = open(self.data_path, "rb")
+            self._inode = os.fstat(self._file.fileno()).st_ino
+
+    def _refresh(self):
+        """Pick up records appended (or a compacted log swapped in) by any worker"""
+        try:
+            current_inode = os.stat(self.data_path).st_ino
+        except FileNotFoundError:
+            current_inode = None
+
+        if current_inode != self._inode:
+            self._reopen()
+        if not self._file:
+            return
+
+        size = os.fstat(self._file.fileno()).st_size
+        if size <= self._scanned:
+            return
+        if self._mmap is None or len(self._mmap) < size:
+            # Old maps are dropped rather than closed so arrays handed out earlier stay valid
+            self._mmap = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+        self._scan(size)
+
+    def _scan(self, size: int):
+        """Index records between the last scanned offset and ``size``"""
+        offset = self._scanned
+        view = self._mmap
+        while offset + RECORD_PREFIX.size <= size:
+            magic, header_len, payload_len, crc = RECORD_PREFIX.unpack_from(view, offset)
+            if magic != RECORD_MAGIC:
+                print(f"⚠️ Embedding store: corrupt record at offset {offset}, ignoring tail")
+                break
+            header_start = offset + RECORD_PREFIX.size
+            payload_start = _align(header_start + header_len)
+            record_end = _align(payload_start + payload_len)
+            if payload_start + payload_len > size:
+                # Another worker is still writing this record
+                break
+            try:
+                header = json.loads(view[header_start:header_start + header_len].decode("utf-8"))
+            except ValueError:
+                print(f"⚠️ Embedding store: unreadable header at offset {offset}, ignoring tail")
+                break
+            header["crc"] = crc
+            header["header_len"] = header_len
+            header["payload_len"] = payload_len
+            self._index[header["key"]] = (offset, payload_start, header, record_end)
+            offset = record_end
+        self._scanned = offset
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Look up a stored entry
+
+        Args:
+            key: Key built with ``make_key``
+
+        Returns:
+            Dict of read-only arrays viewed directly from the mapped log, or None on a miss
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self._refresh()
+                entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            record_start, payload_start, header, _ = entry
+            if key not in self._verified:
+                # Checksums are verified on first use rather than while scanning, so a cold
+                # worker can index a multi-GB log without reading every payload
+                header_start = record_start + RECORD_PREFIX.size
+                body = self._mmap[header_start:header_start + header["header_len"]]
+                payload = self._mmap[payload_start:payload_start + header["payload_len"]]
+                if zlib.crc32(payload, zlib.crc32(body)) != header["crc"]:
+                    print(f"⚠️ Embedding store: checksum mismatch for {key[:12]}, treating as miss")
+                    del self._index[key]
+                    self.misses += 1
+                    return None
+                self._verified.add(key)
+
+            arrays = {}
+            for spec in header["arrays"]:
+                arrays[spec["name"]] = np.frombuffer(
+                    self._mmap,
+                    dtype=np.dtype(spec["dtype"]),
+                    count=int(np.prod(spec["shape"], dtype=np.int64)),
+                    offset=payload_start + spec["offset"],
+                ).reshape(spec["shape"])
+            self._last_used[key] = time.time()
+            self.hits += 1
+            return arrays
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def _encode_record(self, key: str, arrays: Dict[str, np.ndarray]) -> bytes:
+        specs = []
+        chunks = []
+        payload_len = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            padded = _align(array.nbytes)
+            specs.append({
+                "name": name,
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": payload_len,
+            })
+            chunks.append(array.tobytes())
+            chunks.append(b"\x00" * (padded - array.nbytes))
+            payload_len += padded
+
+        header = json.dumps({"key": key, "ts": time.time(), "arrays": specs}).encode("utf-8")
+        payload = b"".join(chunks)
+        crc = zlib.crc32(payload, zlib.crc32(header))
+        prefix = RECORD_PREFIX.pack(RECORD_MAGIC, len(header), payload_len, crc)
+        head = prefix + header
+        return head + b"\x00" * (_align(len(head)) - len(head)) + payload
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]) -> bool:
+        """
+        Append an entry; the newest record for a key wins
+
+        Args:
+            key: Key built with ``make_key``
+            arrays: Named arrays to store (e.g. prompt_embeds, pooled_prompt_embeds)
+
+        Returns:
+            True if the entry was written
+        """
+        record = self._encode_record(key, arrays)
+        if len(record) > self.max_bytes:
+            return False
+
+        with self._lock, open(self.lock_path, "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.data_path, "ab") as data_file:
+                    data_file.write(record)
+                    data_file.flush()
+                    size = data_file.tell()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            self._last_used[key] = time.time()
+
+        if size > self.max_bytes:
+            self.compact()
+        return True
+
+    def compact(self) -> int:
+        """
+        Rewrite the log with only the newest record per key, evicting least recently
+        used entries until the log fits under the size cap
+
+        Returns:
+            Number of bytes reclaimed
+        """
+        with self._lock, open(self.lock_path, "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if not self._file:
+                    return 0
+                old_size = self._scanned
+
+                def recency(item):
+                    key, (_, _, header, _) = item
+                    return max(header["ts"], self._last_used.get(key, 0.0))
+
+                # Most recently used first; keep as many as fit under the target size
+                budget = int(self.max_bytes * COMPACT_TARGET_RATIO)
+                kept: List[Tuple[int, int]] = []
+                used = 0
+                for key, (record_start, _, _, record_end) in sorted(self._index.items(), key=recency, reverse=True):
+                    length = record_end - record_start
+                    if used + length > budget:
+                        continue
+                    kept.append((record_start, record_end))
+                    used += length
+
+                temp_path = f"{self.data_path}.compact-{os.getpid()}"
+                with open(temp_path, "wb") as out:
+                    for record_start, record_end in sorted(kept):
+                        out.write(self._mmap[record_start:record_end])
+                    out.flush()
+                    os.fsync(out.fileno())
+                os.replace(temp_path, self.data_path)
+                self._reopen()
+                self._refresh()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        reclaimed = old_size - self._scanned
+        print(f"🧹 Embedding store compacted: {len(self._index)} entries, {reclaimed / 1e6:.1f} MB reclaimed")
+        return reclaimed
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, log size and hit/miss counters for logging"""
+        with self._lock:
+            self._refresh()
+            return {
+                "entries": len(self._index),
+                "bytes": self._scanned,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_store: Optional[EmbeddingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store() -> Optional[EmbeddingStore]:
+    """
+    Shared store instance, or None when disabled or the volume is not mounted
+
+    Configured with EMBEDDING_STORE_DIR, EMBEDDING_STORE_MAX_MB and
+    EMBEDDING_STORE_ENABLED (set to "false" to disable).
+    """
+    global _store
+    if os.environ.get("EMBEDDING_STORE_ENABLED", "true").lower() == "false":
+        return None
+
+    with _store_lock:
+        if _store is None:
+            root = os.environ.get("EMBEDDING_STORE_DIR", DEFAULT_STORE_DIR)
+            if not os.path.isdir(os.path.dirname(root.rstrip("/")) or "/"):
+                return None
+            try:
+                max_mb = int(os.environ.get("EMBEDDING_STORE_MAX_MB", DEFAULT_MAX_MB))
+                _store = EmbeddingStore(root, max_bytes=max_mb * 1024 * 1024)
+                print(f"✅ Embedding store ready at {root} ({_store.stats()['entries']} entries)")
+            except Exception as e:
+                print(f"⚠️ Embedding store unavailable: {e}")
+                return None
+        return _store
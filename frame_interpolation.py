@@ -0,0 +1,139 @@
+"""
+Frame Interpolation for SDXL Worker
+Synthesizes in-between video frames on CPU to raise output fps without extra diffusion steps
+"""
+
+import time
+from typing import Iterator, Optional
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:  # opencv-python is optional; "flow" falls back to "blend" without it
+    cv2 = None
+
+INTERPOLATION_METHODS = ("blend", "flow")
+MAX_INTERPOLATION_FACTOR = 4
+# Optical flow is estimated at this fraction of the frame size, then upscaled
+FLOW_SCALE = 0.5
+
+
+def is_flow_available() -> bool:
+    return cv2 is not None
+
+
+def blend_frames(a: np.ndarray, b: np.ndarray, factor: int) -> np.ndarray:
+    """
+    The ``factor - 1`` cross-faded frames between a and b, computed together in integer math
+
+    Returns:
+        (factor - 1, H, W, 3) uint8 array
+    """
+    weights = np.arange(1, factor, dtype=np.uint16)[:, None, None, None]
+    a16 = a.astype(np.uint16)[None]
+    b16 = b.astype(np.uint16)[None]
+    return ((a16 * (factor - weights) + b16 * weights + factor // 2) // factor).astype(np.uint8)
+
+
+def _flow_maps(src_gray: np.ndarray, dst_gray: np.ndarray, shape) -> np.ndarray:
+    """Dense Farneback flow from src to dst, estimated downscaled and returned at full size"""
+    height, width = shape
+    small = (max(8, int(width * FLOW_SCALE)), max(8, int(height * FLOW_SCALE)))
+    flow = cv2.calcOpticalFlowFarneback(
+        cv2.resize(src_gray, small, interpolation=cv2.INTER_AREA),
+        cv2.resize(dst_gray, small, interpolation=cv2.INTER_AREA),
+        None, 0.5, 3, 15, 3, 5, 1.2, 0,
+    )
+    flow = cv2.resize(flow, (width, height), interpolation=cv2.INTER_LINEAR)
+    flow[..., 0] *= width / small[0]
+    flow[..., 1] *= height / small[1]
+    return flow
+
+
+def flow_frames(a: np.ndarray, b: np.ndarray, factor: int) -> np.ndarray:
+    """
+    In-between frames by warping both neighbours along Farneback optical flow and blending
+
+    Returns:
+        (factor - 1, H, W, 3) uint8 array
+    """
+    height, width = a.shape[:2]
+    gray_a = cv2.cvtColor(a, cv2.COLOR_RGB2GRAY)
+    gray_b = cv2.cvtColor(b, cv2.COLOR_RGB2GRAY)
+    flow_ab = _flow_maps(gray_a, gray_b, (height, width))
+    flow_ba = _flow_maps(gray_b, gray_a, (height, width))
+
+    grid_x, grid_y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+    output = np.empty((factor - 1, height, width, 3), dtype=np.uint8)
+    for k in range(1, factor):
+        t = k / factor
+        # Backward warps: sample a a fraction t back along a->b, and b (1 - t) back along b->a
+        warped_a = cv2.remap(a, grid_x - t * flow_ab[..., 0], grid_y - t * flow_ab[..., 1],
+                             cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        warped_b = cv2.remap(b, grid_x - (1 - t) * flow_ba[..., 0], grid_y - (1 - t) * flow_ba[..., 1],
+                             cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        output[k - 1] = cv2.addWeighted(warped_a, 1 - t, warped_b, t, 0)
+    return output
+
+
+class InterpolatedFrames:
+    """
+    Lazy sequence of frames with ``factor - 1`` synthesized frames between each source pair
+
+    Frames are produced while they are consumed (e.g. by the streaming video encoder), so
+    only one pair's in-between frames exist at a time. Source frames are passed through as
+    views. ``seconds`` accumulates the time spent synthesizing.
+    """
+
+    def __init__(self, frames, factor: int = 2, method: str = "blend"):
+        if method not in INTERPOLATION_METHODS:
+            raise ValueError(f"Unknown interpolation method '{method}', expected one of {INTERPOLATION_METHODS}")
+        if method == "flow" and not is_flow_available():
+            print("⚠️ opencv-python not installed, using blend interpolation instead of optical flow")
+            method = "blend"
+
+        self.frames = frames
+        self.factor = max(1, min(int(factor), MAX_INTERPOLATION_FACTOR))
+        self.method = method
+        self.seconds = 0.0
+
+    def __len__(self) -> int:
+        return (len(self.frames) - 1) * self.factor + 1 if len(self.frames) else 0
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        # Consumed as an iterator so lazily generated sources (long videos) work too
+        frames = iter(self.frames)
+        previous = next(frames, None)
+        if previous is None:
+            return
+        synthesize = flow_frames if self.method == "flow" else blend_frames
+        yield previous
+        for current in frames:
+            if self.factor > 1:
+                start = time.perf_counter()
+                in_between = synthesize(previous, current, self.factor)
+                self.seconds += time.perf_counter() - start
+                yield from in_between
+            yield current
+            previous = current
+
+    def stats(self) -> dict:
+        return {"factor": self.factor, "method": self.method, "seconds": round(self.seconds, 3)}
+
+
+def interpolate_frames(frames, factor: int = 2, method: str = "blend", fps: Optional[int] = None):
+    """
+    Wrap decoded frames for interpolation
+
+    Args:
+        frames: (T, H, W, 3) uint8 array, or any sized iterable of such frames
+        factor: Output frames per source frame interval (1-4)
+        method: "blend" (cross-fade) or "flow" (optical-flow warping, needs opencv-python)
+        fps: Source fps, multiplied by the factor in the return value
+
+    Returns:
+        (InterpolatedFrames, output fps)
+    """
+    interpolated = InterpolatedFrames(frames, factor, method)
+    return interpolated, (fps or 0) * interpolated.factor
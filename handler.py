@@ -3,6 +3,8 @@ import base64
 from io import BytesIO
 from PIL import Image
 import uuid
+from contextlib import nullcontext
+from functools import lru_cache
 
 import torch
 from diffusers import (
@@ -13,7 +15,7 @@ from diffusers import (
     AutoencoderKLWan,  # For Wan2.1 VAE
     WanPipeline,       # For Wan2.1 T2V
 )
-from diffusers.utils import load_image, export_to_video
+from diffusers.utils import load_image
 
 from diffusers import (
     PNDMScheduler,
@@ -26,18 +28,45 @@ from diffusers import (
 )
 
 import runpod
-from runpod.serverless.utils import rp_upload, rp_cleanup
 from runpod.serverless.utils.rp_validator import validate
 
 from schemas import INPUT_SCHEMA
+from embedding_store import get_embedding_store
+from image_encoding import encode_images
+from video_encoding import encode_video, encode_video_output
+from video_decoding import decode_wan_latents, get_vae_dtype
+from frame_interpolation import interpolate_frames
+from video_upscaling import UpscaledFrames, generation_size, resolve_quality
+from video_previews import VideoPreviewTap
+from long_video import LongVideoGenerator, WINDOW_FRAMES, MAX_LONG_VIDEO_FRAMES, chain_callbacks
+from denoise_checkpoint import DenoiseCheckpointer, checkpoint_signature, DEFAULT_CHECKPOINT_EVERY
+from memory_stats import PeakHostMemory
+from postprocess import PostProcessStage
+from storage_backends import S3StorageBackend
+from retry_policy import RETRY_METRICS
+from live_preview import LivePreviewReporter
 from cloud_storage import (
     cloud_storage, 
     save_and_upload_images_cloud, 
-    save_and_upload_video_cloud
+    save_and_upload_video_cloud,
+    publish_live_preview,
+    VideoUploadStream,
+    WriteCoalescer,
+    STATUS_WRITE_DEADLINE
 )
 
 torch.cuda.empty_cache()
 
+# Firebase credentials and clients are set up on a background thread while the models load;
+# the first job that needs them waits for it
+cloud_storage.start_background_init()
+
+# WanPipeline default denoising steps (not overridden by requests)
+WAN_INFERENCE_STEPS = 50
+
+# Image outputs are encoded and uploaded here while the GPU moves on to the next job
+POSTPROCESS = PostProcessStage()
+
 # ---- Add this function after your imports ----
 def decode_base64_image(data_uri):
     """
@@ -158,14 +187,14 @@ class ModelHandler:
             
             print(f"📁 Found local Wan2.1-14B at: {local_wan_path}")
             
-            # Load VAE from local path only
+            # Load VAE from local path only (WAN_VAE_DTYPE=bfloat16 halves decode memory)
             wan_vae = AutoencoderKLWan.from_pretrained(
                 local_wan_path,
                 subfolder="vae",
-                torch_dtype=torch.float32,
+                torch_dtype=get_vae_dtype(),
                 local_files_only=True,  # Force local loading only
             )
-            print("  ✅ VAE loaded successfully")
+            print(f"  ✅ VAE loaded successfully ({wan_vae.dtype})")
             
             # Load pipeline from local path only
             wan_t2v = WanPipeline.from_pretrained(
@@ -228,7 +257,88 @@ class ModelHandler:
 MODELS = ModelHandler()
 
 
-def _save_and_upload_images(images, job_id, user_id=None, file_uid=None, use_cloud_storage=False):
+def _get_cached_prompt_embeds(pipe, model_name, prompt, negative_prompt=None):
+    """
+    Encode a prompt with the pipeline's text encoders, reusing embeddings stored on the
+    shared volume by this or any earlier worker
+    """
+    device = pipe._execution_device
+    store = get_embedding_store()
+    key = store.make_key(model_name, "prompt_embeds", prompt, negative_prompt) if store else None
+
+    cached = store.get(key) if store else None
+    if cached is not None:
+        print(f"⚡ Prompt embeddings cache hit ({model_name})")
+        return {name: torch.from_numpy(array.copy()).to(device) for name, array in cached.items()}
+
+    (
+        prompt_embeds,
+        negative_prompt_embeds,
+        pooled_prompt_embeds,
+        negative_pooled_prompt_embeds,
+    ) = pipe.encode_prompt(
+        prompt=prompt,
+        device=device,
+        num_images_per_prompt=1,
+        do_classifier_free_guidance=True,
+        negative_prompt=negative_prompt,
+    )
+    embeds = {
+        "prompt_embeds": prompt_embeds,
+        "negative_prompt_embeds": negative_prompt_embeds,
+        "pooled_prompt_embeds": pooled_prompt_embeds,
+        "negative_pooled_prompt_embeds": negative_pooled_prompt_embeds,
+    }
+
+    if store:
+        try:
+            store.put(key, {
+                name: tensor.detach().to("cpu", dtype=torch.float16).numpy()
+                for name, tensor in embeds.items()
+            })
+        except Exception as e:
+            print(f"⚠️ Failed to store prompt embeddings: {e}")
+    return embeds
+
+
+def _get_cached_init_latents(pipe, model_name, image_url, init_image):
+    """
+    VAE-encode an img2img starting image, reusing latents stored on the shared volume.
+    The returned 4-channel latents are accepted by the SDXL img2img pipeline in place of the image.
+    """
+    device = pipe._execution_device
+    store = get_embedding_store()
+    key = store.make_key(model_name, "init_latents", image_url, init_image.size) if store else None
+
+    cached = store.get(key) if store else None
+    if cached is not None:
+        print(f"⚡ Init image latents cache hit ({model_name})")
+        return torch.from_numpy(cached["latents"].copy()).to(device, dtype=pipe.vae.dtype)
+
+    image_tensor = pipe.image_processor.preprocess(init_image).to(device, dtype=pipe.vae.dtype)
+    latents = pipe.vae.encode(image_tensor).latent_dist.mode() * pipe.vae.config.scaling_factor
+
+    if store:
+        try:
+            store.put(key, {"latents": latents.detach().to("cpu", dtype=torch.float16).numpy()})
+        except Exception as e:
+            print(f"⚠️ Failed to store init image latents: {e}")
+    return latents
+
+
+@lru_cache(maxsize=1)
+def _get_bucket_backend():
+    """
+    S3 backend for BUCKET_ENDPOINT_URL, or None when it is not set. Only the client and its
+    connection pool are shared by all jobs; the monthly bucket is resolved on every upload.
+    """
+    if not os.environ.get("BUCKET_ENDPOINT_URL", False):
+        return None
+    return S3StorageBackend.from_env()
+
+
+def _save_and_upload_images(images, job_id, user_id=None, file_uid=None, use_cloud_storage=False,
+                            output_format=None, output_quality=None, compression_preset=None):
     """Save and upload images with optional cloud storage"""
     
     # Use cloud storage if enabled and metadata provided
@@ -236,7 +346,12 @@ def _save_and_upload_images(images, job_id, user_id=None, file_uid=None, use_clo
         print(f"📤 Uploading {len(images)} images to cloud storage for user {user_id}")
         try:
             print(f"🔧 [DEBUG] Calling save_and_upload_images_cloud with user_id={user_id}, file_uid={file_uid}")
-            result = save_and_upload_images_cloud(images, job_id, user_id, file_uid)
+            result = save_and_upload_images_cloud(
+                images, job_id, user_id, file_uid,
+                output_format=output_format,
+                quality=output_quality,
+                compression_preset=compression_preset,
+            )
             print(f"✅ [DEBUG] Cloud upload successful: {result}")
             return result
         except Exception as e:
@@ -247,33 +362,112 @@ def _save_and_upload_images(images, job_id, user_id=None, file_uid=None, use_clo
     
     # Original base64/bucket upload logic (fallback)
     print(f"📱 [DEBUG] Using fallback for images")
-    os.makedirs(f"/{job_id}", exist_ok=True)
-    image_urls = []
-    for index, image in enumerate(images):
-        image_path = os.path.join(f"/{job_id}", f"{index}.png")
-        image.save(image_path)
-
-        if os.environ.get("BUCKET_ENDPOINT_URL", False):
-            image_url = rp_upload.upload_image(job_id, image_path)
-            image_urls.append(image_url)
-        else:
-            with open(image_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode("utf-8")
-                image_urls.append(f"data:image/png;base64,{image_data}")
+    encoded_images = encode_images(images, output_format, output_quality, compression_preset)
+
+    # The S3-compatible bucket rp_upload would use, straight from memory on a pooled client
+    bucket_backend = _get_bucket_backend()
+    if bucket_backend is not None:
+        return [
+            bucket_backend.upload(f"{job_id}/{index}{encoded.extension}", encoded.data, encoded.content_type)
+            for index, encoded in enumerate(encoded_images)
+        ]
+
+    return [
+        f"data:{encoded.content_type};base64,{base64.b64encode(encoded.data).decode('utf-8')}"
+        for encoded in encoded_images
+    ]
 
-    rp_cleanup.clean([f"/{job_id}"])
-    return image_urls
+
+def _finish_image_job(output, job, job_input, task_type, preview_reporter):
+    """Post-processing stage of an image job: encode, upload and record completion"""
+    # Import firestore here to avoid circular import issues
+    from firebase_admin import firestore
+
+    user_id = job_input.get("user_id")
+    file_uid = job_input.get("file_uid")
+    use_cloud_storage = job_input.get("use_cloud_storage", False)
+    
+    try:
+        # Upload images with cloud storage support
+        image_urls = _save_and_upload_images(
+            output, 
+            job["id"],
+            user_id=user_id,
+            file_uid=file_uid, 
+            use_cloud_storage=use_cloud_storage,
+            output_format=job_input.get("output_format"),
+            output_quality=job_input.get("output_quality"),
+            compression_preset=job_input.get("compression_preset")
+        )
+
+        # Prepare complete generation data for Firestore
+        generation_data = {
+            "generated": True,
+            "error": False,
+            "images": image_urls,
+            "image_url": image_urls[0],
+            "seed": job_input["seed"],
+            "preview_stats": preview_reporter.stats() if preview_reporter else None,
+            "task_type": task_type,
+            "status": "completed",
+            "completed_at": firestore.SERVER_TIMESTAMP,
+            "modified": firestore.SERVER_TIMESTAMP,
+            "file_uid": file_uid,
+            "user_id": user_id
+        }
+
+        # Update database with completion status
+        if use_cloud_storage and user_id and file_uid:
+            success = cloud_storage.update_generation_status(user_id, file_uid, generation_data, "images")
+            if success:
+                print(f"✅ Database updated for user {user_id}, file {file_uid}")
+            else:
+                print(f"⚠️ Failed to update database for user {user_id}, file {file_uid}")
+
+        print(f"✅ Image generation completed: {len(image_urls)} images")
+        return image_urls
+        
+    except Exception as e:
+        error_msg = f"Error during image upload: {e}"
+        print(f"❌ {error_msg}")
+        import traceback
+        traceback.print_exc()
+        
+        if use_cloud_storage and user_id and file_uid:
+            error_data = {
+                "generated": False,
+                "error": True,
+                "status": "failed",
+                "error_message": error_msg,
+                "error_type": type(e).__name__,
+                "failed_at": firestore.SERVER_TIMESTAMP,
+                "modified": firestore.SERVER_TIMESTAMP
+            }
+            cloud_storage.update_generation_status(user_id, file_uid, error_data, "images")
+        raise
+    
+    finally:
+        # The generation thread already committed its writes; commit this stage's batch
+        cloud_storage.flush_writes()
+        print(f"📦 Post-processing stage: {POSTPROCESS.stats()}")
+        if cloud_storage.backend is not None:
+            print(f"📤 Storage backend: {cloud_storage.backend.stats()}, dedup index: {cloud_storage.dedup_stats()}")
 
 
-def _save_and_upload_video(video_frames, job_id, fps=15, user_id=None, file_uid=None, use_cloud_storage=False):
-    """Save and upload video with optional cloud storage"""
+def _save_and_upload_video(video_frames, job_id, fps=15, user_id=None, file_uid=None, use_cloud_storage=False,
+                           video_bytes=None, previews=None, video_url=None):
+    """
+    Save and upload video with optional cloud storage (video_bytes skips re-encoding the frames,
+    video_url skips uploading an MP4 already streamed up during encoding)
+    """
     
     # Use cloud storage if enabled and metadata provided
     if use_cloud_storage and user_id and file_uid:
         print(f"📤 Uploading video to cloud storage for user {user_id}")
         try:
             print(f"🔧 [DEBUG] Calling save_and_upload_video_cloud with user_id={user_id}, file_uid={file_uid}")
-            result = save_and_upload_video_cloud(video_frames, job_id, user_id, file_uid, fps)
+            result = save_and_upload_video_cloud(video_frames, job_id, user_id, file_uid, fps,
+                                                 video_bytes=video_bytes, previews=previews, video_url=video_url)
             print(f"✅ [DEBUG] Cloud upload successful: {result}")
             return result
         except Exception as e:
@@ -284,19 +478,67 @@ def _save_and_upload_video(video_frames, job_id, fps=15, user_id=None, file_uid=
     
     # Original base64 logic (fallback)
     print(f"📱 [DEBUG] Using base64 fallback for video")
-    os.makedirs(f"/{job_id}", exist_ok=True)
-    video_path = os.path.join(f"/{job_id}", "video.mp4")
     
-    # Export video using diffusers utility
-    export_to_video(video_frames, video_path, fps=fps)
+    # Encode straight into memory - no video.mp4 written and read back
+    if video_bytes is None:
+        video_bytes = encode_video(video_frames, fps=fps)
     
     # Always return base64 encoded video (consistent with images)
-    with open(video_path, "rb") as video_file:
-        video_data = base64.b64encode(video_file.read()).decode("utf-8")
-        video_url = f"data:video/mp4;base64,{video_data}"
-    
-    rp_cleanup.clean([f"/{job_id}"])
-    return video_url
+    video_data = base64.b64encode(video_bytes).decode("utf-8")
+    return f"data:video/mp4;base64,{video_data}"
+
+
+def _make_preview_reporter(job_input, task_type, user_id, file_uid, use_cloud_storage):
+    """Build the live preview callback for this job, or None when previews are off"""
+    every_n_steps = job_input.get("preview_every_n_steps")
+    if not every_n_steps or not (use_cloud_storage and user_id and file_uid):
+        return None
+
+    if task_type == "text2video":
+        media_type, latent_format, total_steps = "videos", "wan", WAN_INFERENCE_STEPS
+    else:
+        media_type, latent_format = "images", "sdxl"
+        refiner_steps = int(job_input["refiner_inference_steps"] * job_input["strength"])
+        if task_type == "text2img":
+            # The base pass stops at denoising_end=high_noise_frac and hands over to the refiner
+            total_steps = int(job_input["num_inference_steps"] * job_input["high_noise_frac"]) + refiner_steps
+        elif task_type == "img2img":
+            total_steps = refiner_steps
+        else:
+            total_steps = job_input["num_inference_steps"]
+
+    print(f"👀 Live previews every {every_n_steps} steps for {user_id}/{file_uid}")
+    return LivePreviewReporter(
+        publish=lambda jpeg_bytes, step, total: publish_live_preview(
+            jpeg_bytes, user_id, file_uid, step, total, media_type
+        ),
+        latent_format=latent_format,
+        every_n_steps=every_n_steps,
+        total_steps=total_steps,
+    )
+
+
+def _make_denoise_checkpointer(job_input, file_uid, negative_prompt, video_params, requested_seed):
+    """
+    Build the checkpoint hook for a single-window video, or None when checkpointing is off
+
+    ``requested_seed`` is the request's own seed: a random seed drawn for an attempt is left
+    out of the signature, so a requeued job without one still resumes its checkpoint.
+    """
+    if DEFAULT_CHECKPOINT_EVERY <= 0 or not file_uid:
+        return None
+    checkpointer = DenoiseCheckpointer(
+        file_uid,
+        checkpoint_signature(prompt=job_input["prompt"], negative_prompt=negative_prompt,
+                             seed=requested_seed, steps=WAN_INFERENCE_STEPS, **video_params),
+        total_steps=WAN_INFERENCE_STEPS,
+    )
+    try:
+        os.makedirs(os.path.dirname(checkpointer.path), exist_ok=True)
+    except OSError as e:
+        print(f"⚠️ Denoising checkpoints disabled: {e}")
+        return None
+    return checkpointer
 
 
 def make_scheduler(name, config):
@@ -432,6 +674,7 @@ def test_firebase_debug(job_input):
     result = {
         "status": "debug_complete",
         "firebase_initialized": cloud_storage.storage_type == "firebase",
+        "cloud_storage_init_seconds": cloud_storage.init_seconds,
         "upload_successful": success,
         "test_url": test_url if 'test_url' in locals() else None,
         "environment_ok": bool(firebase_key and firebase_bucket),
@@ -521,6 +764,9 @@ def generate_image(job):
             "status": "failed"
         }
     
+    # Firestore writes of this job are merged per document and committed in batches
+    job_writes = WriteCoalescer()
+    
     # Update Firestore status to "processing" immediately
     if use_cloud_storage and user_id and file_uid:
         # Import firestore here to avoid circular import issues
@@ -537,17 +783,19 @@ def generate_image(job):
             "task_type": "text2video" if is_video_request else "text2image"
         }
         
-        success = cloud_storage.update_generation_status(user_id, file_uid, processing_data, media_type)
+        with cloud_storage.coalesce_writes(job_writes):
+            success = cloud_storage.update_generation_status(user_id, file_uid, processing_data, media_type)
+            success = cloud_storage.flush_writes() and success
         if success:
             print(f"✅ Status updated to 'processing' for {user_id}/{file_uid}")
         else:
             print(f"⚠️ Failed to update status to 'processing'")
     
     # Start background processing thread
-    def background_process():
+    def run_task():
         try:
             print(f"🔄 Starting background processing for {user_id}/{file_uid}")
-            _process_generation_task(job, job_input)
+            return _process_generation_task(job, job_input)
         except Exception as e:
             print(f"❌ Background processing failed: {e}")
             import traceback
@@ -569,12 +817,34 @@ def generate_image(job):
                 }
                 success = cloud_storage.update_generation_status(user_id, file_uid, error_data, media_type)
                 if success:
-                    print(f"✅ Error status updated in Firestore for {user_id}/{file_uid}")
+                    print(f"📝 Error status recorded for {user_id}/{file_uid}")
                 else:
                     print(f"❌ Failed to update error status in Firestore for {user_id}/{file_uid}")
             else:
                 print("⚠️ Cannot update error status - missing cloud storage parameters")
     
+    def report_writes(_=None):
+        if use_cloud_storage and user_id and file_uid:
+            # The handler has already returned: deliver the final status before the worker can be scaled down
+            media_type = "videos" if job_input.get("num_frames") else "images"
+            if not cloud_storage.finish_job_writes(user_id, file_uid, media_type, STATUS_WRITE_DEADLINE):
+                print(f"⚠️ Final status of {user_id}/{file_uid} is still queued in the status journal")
+        if use_cloud_storage:
+            print(f"🗃️ Firestore for {user_id}/{file_uid}: {job_writes.stats()}, "
+                  f"journal: {cloud_storage.journal_stats()}")
+            print(f"🔁 Retries so far: {RETRY_METRICS.snapshot()}")
+            if cloud_storage.spool_stats() is not None:
+                print(f"📥 Payload spool: {cloud_storage.spool_stats()}")
+    
+    def background_process():
+        with cloud_storage.coalesce_writes(job_writes):
+            postprocess = run_task()
+        # Image jobs finish on the post-processing stage; report once their writes are in
+        if postprocess is not None:
+            postprocess.add_done_callback(report_writes)
+        else:
+            report_writes()
+    
     # Start background thread
     thread = threading.Thread(target=background_process, daemon=True)
     thread.start()
@@ -599,6 +869,7 @@ def _process_generation_task(job, job_input):
     starting_image = job_input.get("image_url")
     mask_url = job_input.get("mask_url")
 
+    requested_seed = job_input["seed"]
     if job_input["seed"] is None:
         job_input["seed"] = int.from_bytes(os.urandom(2), "big")
 
@@ -638,12 +909,17 @@ def _process_generation_task(job, job_input):
         print(f"[Background] Video parameters: {job_input.get('num_frames')} frames, {job_input.get('video_width', 832)}x{job_input.get('video_height', 480)}")
     else:
         # Image generation - validate no video parameters are present
-        video_params = ['num_frames', 'video_height', 'video_width', 'video_guidance_scale', 'fps']
+        video_params = ['num_frames', 'video_height', 'video_width', 'video_guidance_scale', 'fps',
+                        'frame_interpolation', 'interpolation_method', 'video_profile', 'video_codec',
+                        'video_quality']
         present_video_params = [p for p in video_params if job_input.get(p) is not None]
         if present_video_params:
             raise ValueError(f"Video parameters {present_video_params} not allowed for {task_type} requests")
         print(f"[Background] Image parameters: {job_input.get('width', 1024)}x{job_input.get('height', 1024)}")
 
+    # Optional live previews of intermediate latents
+    preview_reporter = _make_preview_reporter(job_input, task_type, user_id, file_uid, use_cloud_storage)
+
     # Route to appropriate pipeline
     if task_type == 'text2video':  # Video generation
         print("[Background] Mode: Text-to-Video (Wan2.1-T2V-1.3B)", flush=True)
@@ -676,15 +952,20 @@ def _process_generation_task(job, job_input):
                 "guidance_scale": job_input.get("video_guidance_scale", 5.0),
             }
             
-            # Clamp parameters for 1.3B model compatibility
-            if video_params["num_frames"] > 81:
-                video_params["num_frames"] = 81
+            # Clamp parameters; beyond one 81-frame window, long-video mode generates overlapping windows
+            if video_params["num_frames"] > MAX_LONG_VIDEO_FRAMES:
+                video_params["num_frames"] = MAX_LONG_VIDEO_FRAMES
             elif video_params["num_frames"] < 16:
                 video_params["num_frames"] = 16
                 
             if video_params["guidance_scale"] > 10.0:
                 video_params["guidance_scale"] = 10.0
             
+            # Lower quality tiers run Wan at reduced resolution and upscale the frames afterwards
+            quality = resolve_quality(job_input.get("video_quality"))
+            output_size = (video_params["height"], video_params["width"])
+            video_params["height"], video_params["width"] = generation_size(*output_size, quality)
+            
             # Enhanced negative prompt for video generation
             video_negative_prompt = job_input.get("negative_prompt", "")
             if not video_negative_prompt:
@@ -696,28 +977,123 @@ def _process_generation_task(job, job_input):
             
             print(f"[Background] Starting video generation with params: {video_params}")
             
-            with torch.inference_mode():
-                video_result = MODELS.wan_t2v(
-                    prompt=job_input["prompt"],
-                    negative_prompt=video_negative_prompt,
-                    **video_params
+            with PeakHostMemory() as host_memory:
+                long_video, checkpointer = None, None
+                if video_params["num_frames"] > WINDOW_FRAMES:
+                    # Long-video mode: overlapping windows are generated as the encoder consumes them
+                    def on_window(index, num_windows, frames_done):
+                        print(f"🪟 Window {index + 1}/{num_windows} done ({frames_done}/{video_params['num_frames']} frames)")
+                        if preview_reporter:
+                            preview_reporter.next_stage()
+                        if use_cloud_storage and user_id and file_uid:
+                            cloud_storage.update_progress(user_id, file_uid, {
+                                "windows_done": index + 1,
+                                "windows_total": num_windows,
+                                "frames_done": frames_done,
+                                "frames_total": video_params["num_frames"],
+                            }, "videos")
+                    
+                    long_video = LongVideoGenerator(
+                        MODELS.wan_t2v,
+                        prompt=job_input["prompt"],
+                        negative_prompt=video_negative_prompt,
+                        num_frames=video_params["num_frames"],
+                        height=video_params["height"],
+                        width=video_params["width"],
+                        guidance_scale=video_params["guidance_scale"],
+                        seed=job_input["seed"],
+                        step_callback=preview_reporter,
+                        on_window=on_window,
+                    )
+                    if preview_reporter:
+                        preview_reporter.total_steps *= len(long_video.windows)
+                    video_frames = long_video
+                else:
+                    # Checkpoint every few steps so a requeued job resumes instead of restarting
+                    checkpointer = _make_denoise_checkpointer(job_input, file_uid, video_negative_prompt, video_params,
+                                                              requested_seed)
+                    with torch.inference_mode(), (checkpointer.resume(MODELS.wan_t2v) if checkpointer
+                                                  else nullcontext()) as resume_latents:
+                        if preview_reporter and checkpointer:
+                            preview_reporter.step_offset = checkpointer.start_step
+                        video_result = MODELS.wan_t2v(
+                            prompt=job_input["prompt"],
+                            negative_prompt=video_negative_prompt,
+                            num_inference_steps=WAN_INFERENCE_STEPS,
+                            generator=generator,
+                            latents=resume_latents,
+                            callback_on_step_end=chain_callbacks(checkpointer, preview_reporter),
+                            output_type="latent",
+                            **video_params
+                        )
+                        
+                        # Decode straight to one (frames, H, W, 3) uint8 buffer instead of float frames
+                        video_frames = decode_wan_latents(MODELS.wan_t2v.vae, video_result.frames)
+                        del video_result
+                
+                # Upscale reduced-resolution tiers in batches as the encoder consumes them
+                upscaled = None
+                source_frames = video_frames
+                if (video_params["height"], video_params["width"]) != output_size:
+                    upscaled = source_frames = UpscaledFrames(video_frames, output_size)
+                
+                # Optionally synthesize in-between frames; they are produced as the encoder consumes them
+                fps = job_input.get("fps", 15)
+                output_frames, output_fps, interpolation = source_frames, fps, None
+                if (job_input.get("frame_interpolation") or 1) > 1:
+                    output_frames, output_fps = interpolate_frames(
+                        source_frames,
+                        factor=job_input["frame_interpolation"],
+                        method=job_input.get("interpolation_method") or "blend",
+                        fps=fps,
+                    )
+                    interpolation = output_frames
+                
+                # Encode once here so a failed upload falls back to base64 without regenerating.
+                # The preview tap builds the poster / animated preview from the same frames meanwhile.
+                # With Firebase, the MP4 is also uploaded in chunks while ffmpeg is still producing it.
+                preview_tap = VideoPreviewTap(output_frames, fps=output_fps)
+                upload_stream = None
+                if use_cloud_storage and user_id and file_uid and cloud_storage.backend is not None:
+                    upload_stream = VideoUploadStream(user_id, file_uid)
+                encoded_video = encode_video_output(
+                    preview_tap,
+                    fps=output_fps,
+                    on_chunk=upload_stream,
+                    profile=job_input.get("video_profile"),
+                    codec=job_input.get("video_codec"),
                 )
+                video_bytes = bytes(upload_stream.buffer) if upload_stream else encoded_video.data
+                streamed_url = upload_stream.finish() if upload_stream else None
+                video_previews = preview_tap.results()
                 
-            # Get video frames
-            video_frames = video_result.frames[0]
-            
-            # Upload video with cloud storage support
-            fps = job_input.get("fps", 15)
-            video_url = _save_and_upload_video(
-                video_frames, 
-                job["id"], 
-                fps=fps,
-                user_id=user_id,
-                file_uid=file_uid,
-                use_cloud_storage=use_cloud_storage
-            )
+                # Upload video with cloud storage support
+                video_url = _save_and_upload_video(
+                    output_frames, 
+                    job["id"], 
+                    fps=output_fps,
+                    user_id=user_id,
+                    file_uid=file_uid,
+                    use_cloud_storage=use_cloud_storage,
+                    video_bytes=video_bytes,
+                    previews=video_previews,
+                    video_url=streamed_url
+                )
+            
+            if upscaled is not None:
+                print(f"🔍 Upscaled {video_params['width']}x{video_params['height']} -> "
+                      f"{output_size[1]}x{output_size[0]} ({quality}) in {upscaled.seconds:.2f}s")
+            if interpolation is not None:
+                print(f"🎞️ Interpolated {len(video_frames)} -> {len(output_frames)} frames "
+                      f"({interpolation.method}, {interpolation.seconds:.2f}s), {fps} -> {output_fps} fps")
+            frame_buffer_mb = round(long_video.window_bytes / 1e6, 1) if long_video else round(video_frames.nbytes / 1e6, 1)
+            print(f"📈 Peak host memory for video: {host_memory.peak_mb} MB (+{host_memory.growth_mb} MB), "
+                  f"frame buffer {frame_buffer_mb} MB")
             
             print(f"✅ Video generated successfully: {video_url}")
+            if checkpointer:
+                print(f"💾 Denoising checkpoints: {checkpointer.stats()}")
+                checkpointer.clear()
             
             # Prepare complete generation data for Firestore
             generation_data = {
@@ -726,13 +1102,33 @@ def _process_generation_task(job, job_input):
                 "videos": [video_url],
                 "video_url": video_url,
                 "video_info": {
-                    "frames": len(video_frames),
-                    "width": video_params["width"],
-                    "height": video_params["height"],
-                    "fps": fps,
-                    "duration_seconds": len(video_frames) / fps
+                    "frames": len(output_frames),
+                    "width": output_size[1],
+                    "height": output_size[0],
+                    "fps": output_fps,
+                    "duration_seconds": len(output_frames) / output_fps,
+                    "quality": {
+                        "tier": quality,
+                        "generated_width": video_params["width"],
+                        "generated_height": video_params["height"],
+                        "upscale": upscaled.stats() if upscaled is not None else None,
+                    },
+                    "interpolation": interpolation.stats() if interpolation is not None else None,
+                    "long_video": long_video.stats() if long_video else None,
+                    "checkpoint": checkpointer.stats() if checkpointer else None,
+                    "encoding": {
+                        "codec": encoded_video.codec,
+                        "profile": encoded_video.profile,
+                        "muxing": encoded_video.muxing,
+                        "seconds": round(encoded_video.seconds, 2),
+                        "bytes": len(video_bytes),
+                        "bitrate_kbps": round(len(video_bytes) * 8 / 1000 / (len(output_frames) / output_fps), 1),
+                    },
+                    "frame_buffer_mb": frame_buffer_mb,
+                    "peak_host_memory_mb": host_memory.peak_mb,
                 },
                 "seed": job_input["seed"],
+                "preview_stats": preview_reporter.stats() if preview_reporter else None,
                 "task_type": "text2video",
                 "status": "completed",
                 "completed_at": firestore.SERVER_TIMESTAMP,
@@ -816,29 +1212,37 @@ def _process_generation_task(job, job_input):
                 num_inference_steps=job_input["num_inference_steps"],
                 guidance_scale=job_input["guidance_scale"],
                 generator=generator,
+                callback_on_step_end=preview_reporter,
             )
             output = inpaint_result.images
 
         elif task_type == 'img2img':
             print("[Background] Pipeline: SDXL Refiner (Img2Img)", flush=True)
             init_image = load_image(starting_image).convert("RGB")
+            init_latents = _get_cached_init_latents(MODELS.refiner, "sdxl-refiner", starting_image, init_image)
+            refiner_embeds = _get_cached_prompt_embeds(MODELS.refiner, "sdxl-refiner", job_input["prompt"])
             
             refiner_result = MODELS.refiner(
-                prompt=job_input["prompt"],
                 num_inference_steps=job_input["refiner_inference_steps"],
                 strength=job_input["strength"],
-                image=init_image,
+                image=init_latents,
                 generator=generator,
+                callback_on_step_end=preview_reporter,
+                **refiner_embeds,
             )
             output = refiner_result.images
 
         else:  # task_type == 'text2img'
             print("[Background] Pipeline: SDXL Base + Refiner (Text2Img)", flush=True)
             
+            # Prompt embeddings are shared across workers through the embedding store
+            base_embeds = _get_cached_prompt_embeds(
+                MODELS.base, "sdxl-base", job_input["prompt"], job_input.get("negative_prompt")
+            )
+            refiner_embeds = _get_cached_prompt_embeds(MODELS.refiner, "sdxl-refiner", job_input["prompt"])
+
             # Generate latent image using base pipeline
             base_result = MODELS.base(
-                prompt=job_input["prompt"],
-                negative_prompt=job_input.get("negative_prompt"),
                 height=job_input["height"],
                 width=job_input["width"],
                 num_inference_steps=job_input["num_inference_steps"],
@@ -846,8 +1250,12 @@ def _process_generation_task(job, job_input):
                 denoising_end=job_input["high_noise_frac"],
                 output_type="latent",
                 generator=generator,
+                callback_on_step_end=preview_reporter,
+                **base_embeds,
             )
             image = base_result.images
+            if preview_reporter:
+                preview_reporter.next_stage()
 
             # Ensure latent images have correct dtype for refiner
             if hasattr(image, 'dtype') and hasattr(image, 'to'):
@@ -857,47 +1265,18 @@ def _process_generation_task(job, job_input):
             
             # Refine the image
             refiner_result = MODELS.refiner(
-                prompt=job_input["prompt"],
                 num_inference_steps=job_input["refiner_inference_steps"],
                 strength=job_input["strength"],
                 image=image,
                 generator=generator,
+                callback_on_step_end=preview_reporter,
+                **refiner_embeds,
             )
             output = refiner_result.images
 
-        # Upload images with cloud storage support
-        image_urls = _save_and_upload_images(
-            output, 
-            job["id"],
-            user_id=user_id,
-            file_uid=file_uid, 
-            use_cloud_storage=use_cloud_storage
-        )
-
-        # Prepare complete generation data for Firestore
-        generation_data = {
-            "generated": True,
-            "error": False,
-            "images": image_urls,
-            "image_url": image_urls[0],
-            "seed": job_input["seed"],
-            "task_type": task_type,
-            "status": "completed",
-            "completed_at": firestore.SERVER_TIMESTAMP,
-            "modified": firestore.SERVER_TIMESTAMP,
-            "file_uid": file_uid,
-            "user_id": user_id
-        }
-
-        # Update database with completion status
-        if use_cloud_storage and user_id and file_uid:
-            success = cloud_storage.update_generation_status(user_id, file_uid, generation_data, "images")
-            if success:
-                print(f"✅ Database updated for user {user_id}, file {file_uid}")
-            else:
-                print(f"⚠️ Failed to update database for user {user_id}, file {file_uid}")
-
-        print(f"✅ Image generation completed: {len(image_urls)} images")
+        # Encoding, upload and the completion write happen on the post-processing stage;
+        # this thread is done with the job as soon as it is handed off
+        return POSTPROCESS.submit(_finish_image_job, output, job, job_input, task_type, preview_reporter)
 
     except torch.cuda.OutOfMemoryError as e:
         error_msg = f"CUDA Out of Memory during image generation: {e}"
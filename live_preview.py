@@ -0,0 +1,171 @@
+"""
+Live Previews for SDXL Worker
+Decodes intermediate latents during denoising with a cheap linear latent-to-RGB approximation
+and publishes small JPEGs, keeping preview cost under a fixed share of generation time
+"""
+
+import os
+import time
+import contextvars
+from io import BytesIO
+from typing import Optional, Callable, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# Linear projections from latent channels to RGB (as used by ComfyUI's Latent2RGB previewer)
+LATENT_RGB_FACTORS = {
+    "sdxl": (
+        [
+            [0.3651, 0.4232, 0.4341],
+            [-0.2533, -0.0042, 0.1068],
+            [0.1076, 0.1111, -0.0362],
+            [-0.3165, -0.2492, -0.2188],
+        ],
+        [0.1084, -0.0175, -0.0011],
+    ),
+    "wan": (
+        [
+            [-0.1299, -0.1692, 0.2932],
+            [0.0671, 0.0406, 0.0442],
+            [0.3568, 0.2548, 0.1747],
+            [0.0372, 0.2344, 0.1420],
+            [0.0313, 0.0189, -0.0328],
+            [0.0296, -0.0956, -0.0665],
+            [-0.3477, -0.4059, -0.2925],
+            [0.0166, 0.1902, 0.1975],
+            [-0.0412, 0.0267, -0.1364],
+            [-0.1293, 0.0740, 0.1636],
+            [0.0680, 0.3019, 0.1128],
+            [0.0032, 0.0581, 0.0639],
+            [-0.1251, 0.0927, 0.1699],
+            [0.0060, -0.0633, 0.0005],
+            [0.3477, 0.2275, 0.2950],
+            [0.1984, 0.0913, 0.1861],
+        ],
+        [-0.1835, -0.0868, -0.3360],
+    ),
+}
+
+DEFAULT_MAX_OVERHEAD_PCT = float(os.environ.get("PREVIEW_MAX_OVERHEAD_PCT", "2.0"))
+DEFAULT_MIN_INTERVAL_S = float(os.environ.get("PREVIEW_MIN_INTERVAL_S", "2.0"))
+DEFAULT_MAX_SIZE = int(os.environ.get("PREVIEW_MAX_SIZE", "256"))
+PREVIEW_JPEG_QUALITY = 70
+
+# JPEG encoding and publishing happen here so the denoising loop only pays for the decode
+_PREVIEW_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="live-preview")
+
+
+def latents_to_preview_image(latents, latent_format: str = "sdxl", max_size: int = DEFAULT_MAX_SIZE) -> Image.Image:
+    """
+    Approximate RGB from latents without running the VAE
+
+    Args:
+        latents: (B, C, H, W) image latents or (B, C, T, H, W) video latents (middle frame is used)
+        latent_format: "sdxl" or "wan"
+        max_size: Longest edge of the returned image
+
+    Returns:
+        Small PIL image
+    """
+    import torch
+
+    factors, bias = LATENT_RGB_FACTORS[latent_format]
+    latent = latents[0].detach().float()
+    if latent.ndim == 4:
+        latent = latent[:, latent.shape[1] // 2]
+
+    factors = torch.tensor(factors, device=latent.device, dtype=torch.float32)
+    bias = torch.tensor(bias, device=latent.device, dtype=torch.float32)
+    rgb = torch.einsum("chw,cr->hwr", latent, factors) + bias
+    rgb = ((rgb + 1.0) / 2.0).clamp(0, 1).mul(255).to(torch.uint8).cpu().numpy()
+
+    image = Image.fromarray(rgb)
+    scale = max_size / max(image.size)
+    return image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BILINEAR)
+
+
+class LivePreviewReporter:
+    """
+    ``callback_on_step_end`` hook that publishes a preview every N denoising steps
+
+    A preview is skipped when the previous one is still being published, when fewer than
+    ``min_interval`` seconds have passed (to throttle storage/Firestore writes), or when it
+    would push the time spent decoding previews above ``max_overhead_pct`` of the elapsed
+    generation time.
+    """
+
+    def __init__(self, publish: Callable[[bytes, int, int], Any], latent_format: str = "sdxl",
+                 every_n_steps: int = 5, total_steps: Optional[int] = None,
+                 max_overhead_pct: Optional[float] = None, min_interval: Optional[float] = None,
+                 max_size: Optional[int] = None, decode: Optional[Callable] = None):
+        self.publish = publish
+        self.latent_format = latent_format
+        self.every_n_steps = max(1, every_n_steps)
+        self.total_steps = total_steps
+        self.max_overhead_pct = DEFAULT_MAX_OVERHEAD_PCT if max_overhead_pct is None else max_overhead_pct
+        self.min_interval = DEFAULT_MIN_INTERVAL_S if min_interval is None else min_interval
+        self.max_size = max_size or DEFAULT_MAX_SIZE
+        self.decode = decode or latents_to_preview_image
+
+        # Steps of earlier pipeline stages (e.g. SDXL base before refiner)
+        self.step_offset = 0
+        self.current_step = 0
+        self.started = time.perf_counter()
+        self.preview_seconds = 0.0
+        self.last_cost = 0.0
+        self.last_publish = 0.0
+        self.in_flight = None
+        self.published = 0
+        self.skipped = 0
+
+    def next_stage(self):
+        """Continue step numbering in the next pipeline (e.g. refiner after base)"""
+        self.step_offset = self.current_step
+
+    def __call__(self, pipe, step: int, timestep, callback_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        self.current_step = self.step_offset + step + 1
+        if (step + 1) % self.every_n_steps != 0:
+            return callback_kwargs
+
+        now = time.perf_counter()
+        elapsed = now - self.started
+        budget = elapsed * self.max_overhead_pct / 100.0
+        if (now - self.last_publish < self.min_interval
+                or (self.in_flight is not None and not self.in_flight.done())
+                or self.preview_seconds + self.last_cost > budget):
+            self.skipped += 1
+            return callback_kwargs
+
+        try:
+            start = time.perf_counter()
+            image = self.decode(callback_kwargs["latents"], self.latent_format, self.max_size)
+            self.last_cost = time.perf_counter() - start
+            self.preview_seconds += self.last_cost
+
+            # Run in this job's context so its Firestore writes are attributed to the job
+            self.in_flight = _PREVIEW_POOL.submit(contextvars.copy_context().run, self._encode_and_publish,
+                                                  image, self.current_step)
+            self.last_publish = now
+        except Exception as e:
+            print(f"⚠️ Live preview failed at step {step}: {e}")
+        return callback_kwargs
+
+    def _encode_and_publish(self, image: Image.Image, step: int):
+        buffer = BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=PREVIEW_JPEG_QUALITY)
+        try:
+            self.publish(buffer.getvalue(), step, self.total_steps)
+            self.published += 1
+        except Exception as e:
+            print(f"⚠️ Failed to publish live preview for step {step}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Preview counts and measured overhead, for logging and the final Firestore document"""
+        elapsed = time.perf_counter() - self.started
+        return {
+            "previews_published": self.published,
+            "previews_skipped": self.skipped,
+            "preview_seconds": round(self.preview_seconds, 4),
+            "preview_overhead_pct": round(100.0 * self.preview_seconds / elapsed, 3) if elapsed > 0 else 0.0,
+        }
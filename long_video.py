@@ -0,0 +1,199 @@
+"""
+Long Video Generation for SDXL Worker
+Generates clips longer than Wan's 81-frame window as overlapping windows, each conditioned
+on the tail latents of the previous one, and streams the blended frames out window by window
+"""
+
+import os
+import time
+from typing import Callable, Iterator, List, Optional
+
+import numpy as np
+import torch
+
+from video_decoding import decode_wan_latents
+
+WINDOW_FRAMES = 81
+MAX_LONG_VIDEO_FRAMES = 401
+# Latent frames shared by consecutive windows (each latent frame is 4 video frames)
+DEFAULT_OVERLAP_LATENTS = int(os.environ.get("LONG_VIDEO_OVERLAP_LATENTS", "4"))
+TEMPORAL_RATIO = 4
+SPATIAL_RATIO = 8
+
+
+def overlap_frames(overlap_latents: int) -> int:
+    """Video frames covered by the overlapping latent frames"""
+    return 1 + TEMPORAL_RATIO * (overlap_latents - 1)
+
+
+def plan_windows(total_frames: int, window_frames: int = WINDOW_FRAMES,
+                 overlap_latents: int = DEFAULT_OVERLAP_LATENTS) -> List[int]:
+    """
+    Frame counts of the windows needed for ``total_frames``
+
+    Every window shares ``overlap_frames(overlap_latents)`` frames with the previous one; the
+    last window is shortened (to a valid 4k+1 length) to avoid generating unused frames.
+    """
+    overlap = overlap_frames(overlap_latents)
+    windows = [min(total_frames, window_frames)]
+    produced = windows[0]
+    while produced < total_frames:
+        needed = total_frames - produced + overlap
+        frames = min(window_frames, 4 * ((needed - 1 + 3) // 4) + 1)
+        windows.append(max(frames, overlap + TEMPORAL_RATIO))
+        produced += windows[-1] - overlap
+    return windows
+
+
+def crossfade(previous: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """Blend two aligned (N, H, W, 3) uint8 stacks, fading linearly from previous to current"""
+    count = len(previous)
+    weights = (np.arange(1, count + 1, dtype=np.float32) / (count + 1))[:, None, None, None]
+    return np.rint(previous * (1.0 - weights) + current * weights).astype(np.uint8)
+
+
+def chain_callbacks(*callbacks) -> Optional[Callable]:
+    """Combine several ``callback_on_step_end`` hooks into one (None entries are skipped)"""
+    callbacks = [callback for callback in callbacks if callback is not None]
+    if not callbacks:
+        return None
+
+    def chained(pipe, step, timestep, callback_kwargs):
+        for callback in callbacks:
+            callback_kwargs = callback(pipe, step, timestep, callback_kwargs)
+        return callback_kwargs
+
+    return chained
+
+
+class TailConditioning:
+    """
+    ``callback_on_step_end`` hook that pins the first latent frames of a window to the
+    previous window's final latents, re-noised to the scheduler's current noise level, so the
+    window continues the previous one (latent replacement, as in inpainting)
+    """
+
+    def __init__(self, tail: torch.Tensor, noise: torch.Tensor):
+        self.tail = tail
+        self.noise = noise
+
+    def __call__(self, pipe, step, timestep, callback_kwargs):
+        latents = callback_kwargs["latents"]
+        scheduler = pipe.scheduler
+        index = min(scheduler.step_index, len(scheduler.sigmas) - 1)
+        sigma = scheduler.sigmas[index].to(latents.device, torch.float32)
+
+        # Flow-matching forward process: x_sigma = (1 - sigma) * x_0 + sigma * noise
+        count = self.tail.shape[2]
+        noised = (1.0 - sigma) * self.tail.float() + sigma * self.noise.float()
+        latents[:, :, :count] = noised.to(latents.dtype)
+        callback_kwargs["latents"] = latents
+        return callback_kwargs
+
+
+class LongVideoGenerator:
+    """
+    Lazy sequence of frames for a long clip
+
+    Iterating runs one Wan window at a time: each window is generated to latents, decoded to
+    uint8, its overlap with the previous window is cross-faded, and the finished frames are
+    yielded before the next window starts. Only one window of latents and frames is alive at
+    any time, so memory stays flat regardless of the total length.
+    """
+
+    def __init__(self, pipe, prompt: str, negative_prompt: str, num_frames: int, height: int, width: int,
+                 guidance_scale: float, seed: int, overlap_latents: int = DEFAULT_OVERLAP_LATENTS,
+                 step_callback: Optional[Callable] = None,
+                 on_window: Optional[Callable[[int, int, int], None]] = None):
+        self.pipe = pipe
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self.num_frames = min(num_frames, MAX_LONG_VIDEO_FRAMES)
+        self.height = height
+        self.width = width
+        self.guidance_scale = guidance_scale
+        self.seed = seed
+        self.overlap_latents = overlap_latents
+        self.step_callback = step_callback
+        self.on_window = on_window
+
+        self.windows = plan_windows(self.num_frames, overlap_latents=overlap_latents)
+        self.window_seconds = []
+        # Largest decoded window held in memory
+        self.window_bytes = 0
+
+    def __len__(self) -> int:
+        return self.num_frames
+
+    def _window_latents(self, index: int, frames: int, tail: Optional[torch.Tensor]):
+        device = self.pipe._execution_device
+        shape = (1, self.pipe.transformer.config.in_channels, (frames - 1) // TEMPORAL_RATIO + 1,
+                 self.height // SPATIAL_RATIO, self.width // SPATIAL_RATIO)
+        generator = torch.Generator(device=device).manual_seed(self.seed + index)
+        noise = torch.randn(shape, generator=generator, device=device, dtype=torch.float32)
+
+        callback = self.step_callback
+        if tail is not None:
+            callback = chain_callbacks(TailConditioning(tail, noise[:, :, :tail.shape[2]].clone()), callback)
+
+        result = self.pipe(
+            prompt=self.prompt,
+            negative_prompt=self.negative_prompt,
+            height=self.height,
+            width=self.width,
+            num_frames=frames,
+            guidance_scale=self.guidance_scale,
+            latents=noise,
+            callback_on_step_end=callback,
+            output_type="latent",
+        )
+        return result.frames
+
+    @torch.inference_mode()
+    def _generate_window(self, index: int, frames: int, tail: Optional[torch.Tensor]):
+        latents = self._window_latents(index, frames, tail)
+        next_tail = latents[:, :, -self.overlap_latents:].clone()
+        decoded = decode_wan_latents(self.pipe.vae, latents)
+        del latents
+        return decoded, next_tail
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        overlap = overlap_frames(self.overlap_latents)
+        held, tail = None, None
+        emitted = 0
+
+        for index, frames in enumerate(self.windows):
+            start = time.perf_counter()
+            decoded, tail = self._generate_window(index, frames, tail)
+            self.window_seconds.append(time.perf_counter() - start)
+            self.window_bytes = max(self.window_bytes, decoded.nbytes)
+
+            if held is not None:
+                head = crossfade(held, decoded[:overlap])
+                body = decoded[overlap:]
+            else:
+                head = decoded[:0]
+                body = decoded
+
+            last = index == len(self.windows) - 1
+            if not last:
+                held = body[-overlap:].copy()
+                body = body[:-overlap]
+
+            for frame in (*head, *body):
+                if emitted == self.num_frames:
+                    break
+                yield frame
+                emitted += 1
+
+            if self.on_window is not None:
+                self.on_window(index, len(self.windows), emitted)
+            del decoded, head, body
+
+    def stats(self) -> dict:
+        return {
+            "windows": len(self.windows),
+            "window_frames": self.windows,
+            "overlap_frames": overlap_frames(self.overlap_latents),
+            "window_seconds": [round(seconds, 1) for seconds in self.window_seconds],
+        }
@@ -0,0 +1,91 @@
+"""
+Host Memory Statistics for SDXL Worker
+Measures the peak resident memory of the worker process over a block of work
+"""
+
+import threading
+from typing import Optional
+
+
+def _read_status_kb(field: str) -> Optional[int]:
+    """Read a kB value such as VmRSS or VmHWM from /proc/self/status (Linux only)"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS counter (VmHWM) for this process"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class PeakHostMemory:
+    """
+    Context manager recording the peak RSS of this process while the block runs
+
+    Uses the kernel's resettable high-water mark where available and falls back to
+    sampling RSS on a background thread. The measurement is process-wide, so work from
+    other threads running at the same time is included.
+
+    Usage:
+        with PeakHostMemory() as memory:
+            ...
+        print(memory.peak_mb)
+    """
+
+    def __init__(self, sample_interval: float = 0.05):
+        self.sample_interval = sample_interval
+        self.start_kb = None
+        self.peak_kb = None
+        self._use_hwm = False
+        self._finished = False
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def __enter__(self):
+        self._use_hwm = _reset_peak_rss()
+        self.start_kb = _read_status_kb("VmRSS") or 0
+        self.peak_kb = self.start_kb
+        if not self._use_hwm:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            self.peak_kb = max(self.peak_kb, _read_status_kb("VmRSS") or 0)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+        self.update()
+        self._finished = True
+        return False
+
+    def update(self) -> int:
+        """Refresh and return the peak so far in kB (can be called inside the block)"""
+        if self._finished:
+            return self.peak_kb
+        current = _read_status_kb("VmHWM" if self._use_hwm else "VmRSS") or 0
+        self.peak_kb = max(self.peak_kb or 0, current)
+        return self.peak_kb
+
+    @property
+    def peak_mb(self) -> float:
+        return round(self.update() / 1024, 1)
+
+    @property
+    def growth_mb(self) -> float:
+        """Peak above the RSS at the start of the block"""
+        return round((self.update() - self.start_kb) / 1024, 1)
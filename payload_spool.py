@@ -0,0 +1,234 @@
+"""
+Payload Spool for SDXL Worker
+Local retry queue for outputs that could not be uploaded: the bytes are kept on disk and a
+background thread keeps retrying the upload, so a failed upload never has to be stored
+inline (as base64) in a Firestore document
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from retry_policy import RETRY_METRICS, is_transient, jittered_delay
+from worker_lock import WORKER_ID, orphans, release, try_lock
+
+# On the network volume, so spooled outputs outlive the container; each worker spools into
+# its own subdirectory. Empty disables the spool (oversized payloads that cannot be stored
+# anywhere are dropped)
+DEFAULT_SPOOL_DIR = os.environ.get("PAYLOAD_SPOOL_DIR", "/runpod-volume/payload-spool")
+DEFAULT_SPOOL_BACKOFF = float(os.environ.get("PAYLOAD_SPOOL_BACKOFF", "2"))
+DEFAULT_SPOOL_MAX_BACKOFF = float(os.environ.get("PAYLOAD_SPOOL_MAX_BACKOFF", "300"))
+DEFAULT_SPOOL_MAX_ATTEMPTS = int(os.environ.get("PAYLOAD_SPOOL_MAX_ATTEMPTS", "50"))
+
+
+class PayloadSpool:
+    """
+    Durable queue of payloads waiting to be uploaded, one pair of files per entry
+
+    Entries live in ``{directory}/{worker_id}``, which the spool holds an exclusive lock on
+    while open. On start it takes over the entries of the other worker subdirectories whose
+    lock is free (their worker is gone), so payloads spooled by a worker that was scaled
+    down are still delivered. ``put`` writes the bytes (``{key}.bin``) and then their metadata (``{key}.json``, moved
+    into place last, so a crash mid-write leaves no half entry). A daemon thread hands due
+    entries to ``deliver`` (a callable taking ``(data, meta)`` and raising on failure) and
+    removes them once it returns. Transient failures are retried with jittered exponential
+    backoff; an entry that fails permanently, or ``max_attempts`` times, is moved to the
+    ``dead/`` subdirectory and passed to ``on_dead_letter(meta, error)``. Entries left by a
+    previous run are picked up on start. Putting a key that is already queued replaces it.
+    """
+
+    def __init__(self, directory: str, deliver: Callable[[bytes, Dict[str, Any]], None],
+                 backoff: float = DEFAULT_SPOOL_BACKOFF, max_backoff: float = DEFAULT_SPOOL_MAX_BACKOFF,
+                 max_attempts: int = DEFAULT_SPOOL_MAX_ATTEMPTS,
+                 on_dead_letter: Optional[Callable[[Dict[str, Any], Exception], None]] = None,
+                 worker_id: str = WORKER_ID):
+        self.directory = os.path.join(directory, worker_id)
+        self.deliver = deliver
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.on_dead_letter = on_dead_letter
+        self.dead_directory = os.path.join(self.directory, "dead")
+        os.makedirs(self.directory, exist_ok=True)
+        self._owner_lock = try_lock(self.directory)
+        if self._owner_lock is None:
+            raise RuntimeError(f"payload spool {self.directory} is in use by another process")
+        self.adopted = self._adopt_orphans(directory)
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        # key -> [attempts, next attempt, version]
+        self._schedule: Dict[str, List[float]] = {}
+        self._version = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                self._schedule[name[:-len(".json")]] = [0, 0.0, 0]
+
+        self.spooled = 0
+        self.delivered = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.bytes = 0
+
+        self._thread = threading.Thread(target=self._run, name="payload-spool", daemon=True)
+        self._thread.start()
+
+    def _adopt_orphans(self, root: str) -> int:
+        """Move the entries of spools left by gone workers into this one; returns the entries taken over"""
+        adopted = 0
+        for orphan in orphans(root, self.directory):
+            if not os.path.isdir(orphan):
+                continue
+            moved = 0
+            for source, target in ((orphan, self.directory),
+                                   (os.path.join(orphan, "dead"), self.dead_directory)):
+                if not os.path.isdir(source):
+                    continue
+                os.makedirs(target, exist_ok=True)
+                # Data before metadata: an entry is only picked up once its .json is in place
+                for name in sorted(os.listdir(source), key=lambda name: name.endswith(".json")):
+                    if name.endswith((".bin", ".json")):
+                        os.replace(os.path.join(source, name), os.path.join(target, name))
+                        moved += source == orphan and name.endswith(".json")
+            shutil.rmtree(orphan, ignore_errors=True)
+            adopted += moved
+            print(f"📥 Took over {moved} spooled payload(s) from {orphan}")
+        return adopted
+
+    def _paths(self, key: str):
+        base = os.path.join(self.directory, key)
+        return base + ".bin", base + ".json"
+
+    def put(self, key: str, data: bytes, meta: Dict[str, Any]):
+        """Queue ``data`` for delivery; ``key`` must be a valid file name"""
+        data_path, meta_path = self._paths(key)
+        with open(data_path + ".tmp", "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        with self._wake:
+            os.replace(data_path + ".tmp", data_path)
+            os.replace(meta_path + ".tmp", meta_path)
+            self._version += 1
+            self._schedule[key] = [0, 0.0, self._version]
+            self.spooled += 1
+            self.bytes += len(data)
+            self._wake.notify()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._schedule)
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """Wait until every queued payload has been delivered; False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self.pending():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+        self._thread.join(timeout=5)
+        release(self.directory, self._owner_lock)
+
+    def _due(self):
+        """A key ready for delivery, and seconds until the next one is due (None: queue empty)"""
+        now = time.time()
+        if not self._schedule:
+            return None, None
+        key, (_, next_attempt, _) = min(self._schedule.items(), key=lambda item: item[1][1])
+        if next_attempt <= now:
+            return key, 0.0
+        return None, next_attempt - now
+
+    def _run(self):
+        while True:
+            with self._wake:
+                key, wait = self._due()
+                while key is None and not self._closed:
+                    self._wake.wait(timeout=wait)
+                    key, wait = self._due()
+                if self._closed:
+                    return
+                attempts, _, version = self._schedule[key]
+
+            data_path, meta_path = self._paths(key)
+            meta = None
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                with open(data_path, "rb") as f:
+                    data = f.read()
+                self.deliver(data, meta)
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                    current = self._schedule.get(key, [0, 0, None])[2] == version
+                    retry = is_transient(e) and attempts + 1 < self.max_attempts
+                    if current and retry:
+                        delay = jittered_delay(self.backoff, attempts + 1, self.max_backoff)
+                        self._schedule[key] = [attempts + 1, time.time() + delay, version]
+                if not current:
+                    continue
+                if retry:
+                    RETRY_METRICS.record("payload_spool", retries=1)
+                    print(f"⚠️ Spooled payload {key} could not be delivered, will retry: {e}")
+                else:
+                    self._dead_letter(key, version, meta, e)
+                continue
+
+            with self._lock:
+                # Re-queued during delivery: deliver the new bytes too
+                if self._schedule.get(key, [0, 0, None])[2] != version:
+                    continue
+                del self._schedule[key]
+                for path in (meta_path, data_path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                self.delivered += 1
+
+    def _dead_letter(self, key: str, version: int, meta: Optional[Dict[str, Any]], error: Exception):
+        """Stop retrying ``key``: keep its files under ``dead/`` for inspection or a manual retry"""
+        with self._lock:
+            if self._schedule.get(key, [0, 0, None])[2] != version:
+                return
+            del self._schedule[key]
+            os.makedirs(self.dead_directory, exist_ok=True)
+            for path in self._paths(key):
+                try:
+                    os.replace(path, os.path.join(self.dead_directory, os.path.basename(path)))
+                except OSError:
+                    pass
+            self.dead_lettered += 1
+        print(f"❌ Gave up on spooled payload {key}, moved to {self.dead_directory}: {error}")
+        if self.on_dead_letter is not None and meta is not None:
+            try:
+                self.on_dead_letter(meta, error)
+            except Exception as e:
+                print(f"⚠️ Dead-letter handler for spooled payload {key} failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "spooled": self.spooled,
+                "delivered": self.delivered,
+                "failures": self.failures,
+                "dead_lettered": self.dead_lettered,
+                "adopted": self.adopted,
+                "pending": len(self._schedule),
+                "bytes": self.bytes,
+            }
@@ -0,0 +1,87 @@
+"""
+Post-processing Stage for SDXL Worker
+Finished outputs are handed from the generation thread to a small pool of workers that
+encode, upload and write the job's status, so the accelerator can start the next job while
+the previous one is still being uploaded
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Callable, Dict
+
+DEFAULT_POSTPROCESS_WORKERS = int(os.environ.get("POSTPROCESS_WORKERS", "2"))
+# Jobs handed off but not yet finished; further hand-offs wait, so decoded outputs cannot
+# pile up in host memory behind a slow uploader
+DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("POSTPROCESS_MAX_IN_FLIGHT", "4"))
+
+
+class PostProcessStage:
+    """
+    Bounded hand-off between the generation stage and post-processing workers
+
+    ``submit`` returns as soon as the job is accepted; it only blocks while ``max_in_flight``
+    jobs are already queued or running. Each job runs in a copy of the submitting thread's
+    context, so context-bound state (the job's Firestore write batch) follows it.
+    """
+
+    def __init__(self, workers: int = DEFAULT_POSTPROCESS_WORKERS, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.workers = max(1, workers)
+        self.max_in_flight = max(self.workers, max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="postprocess")
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.wait_seconds = 0.0
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Queue ``fn(*args, **kwargs)`` for a post-processing worker"""
+        start = time.perf_counter()
+        self._slots.acquire()
+        with self._lock:
+            self.wait_seconds += time.perf_counter() - start
+            self.submitted += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return self._pool.submit(self._run, copy_context(), fn, args, kwargs)
+        except Exception:
+            self._release(failed=True)
+            raise
+
+    def _run(self, context, fn, args, kwargs):
+        # The slot is freed before the future resolves, so waiters see up-to-date stats
+        failed = True
+        try:
+            result = context.run(fn, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self._release(failed)
+
+    def _release(self, failed: bool):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.failed += int(failed)
+        self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_in_flight": self.max_in_flight,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
@@ -0,0 +1,179 @@
+"""
+Resumable Uploads for SDXL Worker
+Chunked uploads over the Google Cloud Storage resumable protocol: bytes are sent in fixed-size
+chunks as they become available, and a failed chunk is retried from the offset the server
+confirms instead of restarting the whole object
+"""
+
+import os
+import time
+from typing import Any, Optional
+
+from retry_policy import RETRY_METRICS, jittered_delay
+
+# GCS requires every chunk except the last to be a multiple of 256 KiB
+CHUNK_ALIGNMENT = 256 * 1024
+DEFAULT_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+DEFAULT_CHUNK_RETRIES = int(os.environ.get("UPLOAD_CHUNK_RETRIES", "5"))
+DEFAULT_RETRY_BACKOFF = float(os.environ.get("UPLOAD_RETRY_BACKOFF", "0.5"))
+# Objects at least this large use a resumable session instead of a single request
+RESUMABLE_THRESHOLD = int(os.environ.get("UPLOAD_RESUMABLE_THRESHOLD", str(DEFAULT_CHUNK_SIZE)))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RESUME_INCOMPLETE = 308
+
+
+def aligned_chunk_size(chunk_size: int) -> int:
+    """Round a chunk size down to the 256 KiB granularity GCS accepts (at least one unit)"""
+    return max(CHUNK_ALIGNMENT, chunk_size // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+
+
+class ResumableUploadError(Exception):
+    """A chunk could not be delivered within its retries, or the server rejected it"""
+
+
+class ResumableUpload:
+    """
+    Upload to a resumable session URL, fed incrementally with ``write`` and completed with
+    ``finish``
+
+    Only whole chunks are sent before ``finish``, so at most one chunk plus the unsent tail is
+    buffered; data passed to ``write`` in chunk-sized slices is sent without being copied into
+    the buffer. ``transport`` is a requests-style session (``put(url, data=, headers=)``), e.g.
+    the authorized session of the storage client.
+    """
+
+    def __init__(self, session_url: str, transport: Any, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_retries: int = DEFAULT_CHUNK_RETRIES, backoff: float = DEFAULT_RETRY_BACKOFF):
+        self.session_url = session_url
+        self.transport = transport
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.offset = 0
+        self.finished = False
+        self.response = None
+        self._buffer = bytearray()
+
+        self.chunks = 0
+        self.retries = 0
+        self.seconds = 0.0
+
+    def write(self, data) -> None:
+        """Queue bytes for upload, sending every complete chunk"""
+        view = memoryview(data).cast("B")
+        if self._buffer:
+            take = min(len(view), self.chunk_size - len(self._buffer))
+            self._buffer += view[:take]
+            view = view[take:]
+            if len(self._buffer) < self.chunk_size:
+                return
+            self._send(memoryview(self._buffer))
+            self._buffer = bytearray()
+
+        while len(view) >= self.chunk_size:
+            self._send(view[:self.chunk_size])
+            view = view[self.chunk_size:]
+        self._buffer += view
+
+    def finish(self) -> Any:
+        """Send the remaining bytes as the final chunk and return the server's response"""
+        if not self.finished:
+            self._send(memoryview(self._buffer), final=True)
+            self._buffer = bytearray()
+        return self.response
+
+    def _content_range(self, start: int, length: int, total: Optional[int]) -> str:
+        size = "*" if total is None else str(total)
+        if length == 0:
+            return f"bytes */{size}"
+        return f"bytes {start}-{start + length - 1}/{size}"
+
+    def _committed_offset(self, response) -> int:
+        """Bytes the server holds, from the Range header of a 308 response"""
+        committed = response.headers.get("Range")
+        if not committed:
+            return 0
+        return int(committed.split("-")[-1]) + 1
+
+    def _query_offset(self, total: Optional[int]):
+        """Ask the session how much it has received (empty PUT)"""
+        response = self.transport.put(self.session_url, data=b"",
+                                      headers={"Content-Range": self._content_range(0, 0, total)})
+        if response.status_code in (200, 201):
+            return None, response
+        if response.status_code != RESUME_INCOMPLETE:
+            raise ResumableUploadError(f"Upload status query failed with HTTP {response.status_code}")
+        return self._committed_offset(response), response
+
+    def _send(self, chunk: memoryview, final: bool = False) -> None:
+        """Deliver ``chunk`` (starting at self.offset), retrying from the confirmed offset"""
+        start_time = time.perf_counter()
+        chunk_start = self.offset
+        end = chunk_start + len(chunk)
+        total = end if final else None
+        attempts = 0
+
+        while True:
+            sent = self.offset - chunk_start
+            remaining = chunk[sent:]
+            try:
+                response = self.transport.put(
+                    self.session_url,
+                    data=bytes(remaining),
+                    headers={"Content-Range": self._content_range(self.offset, len(remaining), total)},
+                )
+                status = response.status_code
+                if status in (200, 201):
+                    self.offset, self.finished, self.response = end, True, response
+                    break
+                if status == RESUME_INCOMPLETE:
+                    previous, self.offset = self.offset, self._committed_offset(response)
+                    if self.offset >= end and not final:
+                        break
+                    if self.offset > previous:
+                        # Partially accepted: send the rest of the chunk without counting a retry
+                        continue
+                    error = "no bytes accepted"
+                elif status not in RETRYABLE_STATUS:
+                    raise ResumableUploadError(f"Chunk at offset {self.offset} rejected with HTTP {status}")
+                else:
+                    error = f"HTTP {status}"
+            except ResumableUploadError:
+                raise
+            except Exception as e:  # connection reset, timeout, ...
+                error = str(e)
+
+            attempts += 1
+            self.retries += 1
+            if attempts > self.max_retries:
+                raise ResumableUploadError(f"Chunk at offset {chunk_start} failed after {attempts} attempts: {error}")
+            RETRY_METRICS.record("upload_chunk", retries=1)
+            print(f"⚠️ Upload chunk at offset {self.offset} failed ({error}), retry {attempts}/{self.max_retries}")
+            time.sleep(jittered_delay(self.backoff, attempts))
+
+            try:
+                committed, response = self._query_offset(total)
+            except ResumableUploadError:
+                raise
+            except Exception:
+                continue  # the status query failed too; resend from the last known offset
+            if committed is None:
+                self.offset, self.finished, self.response = end, True, response
+                break
+            self.offset = committed
+            if self.offset >= end and not final:
+                break
+
+        self.chunks += 1
+        self.seconds += time.perf_counter() - start_time
+
+    def stats(self) -> dict:
+        return {
+            "bytes": self.offset,
+            "chunks": self.chunks,
+            "chunk_size": self.chunk_size,
+            "retries": self.retries,
+            "seconds": round(self.seconds, 3),
+        }
@@ -0,0 +1,122 @@
+"""
+Retry Policy for SDXL Worker
+Retries of uploads and status writes: only transient failures (timeouts, dropped connections,
+HTTP 408/429/5xx) are retried, with full-jitter exponential backoff inside a per-call
+deadline, and every retry is counted in process-wide metrics
+"""
+
+import os
+import time
+import random
+import threading
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "8"))
+
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+# Exception class names of the HTTP / cloud client libraries that mean "try again"
+# (requests, urllib3, botocore, google.api_core), matched without importing them
+TRANSIENT_ERROR_NAMES = {
+    "ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout", "ChunkedEncodingError", "ProtocolError",
+    "ReadTimeoutError", "ConnectTimeoutError", "EndpointConnectionError", "ConnectionClosedError",
+    "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "TooManyRequests",
+    "GatewayTimeout", "BadGateway", "Aborted",
+}
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether retrying the call that raised ``error`` can succeed"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if {cls.__name__ for cls in type(error).__mro__} & TRANSIENT_ERROR_NAMES:
+        return True
+    status = getattr(error, "code", None)
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):  # botocore ClientError
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode", status)
+    elif response is not None:  # requests HTTPError
+        status = getattr(response, "status_code", status)
+    return isinstance(status, int) and status in TRANSIENT_STATUS
+
+
+def request_timeout(remaining: Optional[float]) -> Dict[str, float]:
+    """``timeout=`` keyword for a client call, bounded by what is left of the call's deadline"""
+    return {} if remaining is None else {"timeout": max(1.0, remaining)}
+
+
+def jittered_delay(base: float, retry: int, max_delay: float = DEFAULT_RETRY_MAX_DELAY,
+                   rng: Optional[random.Random] = None) -> float:
+    """Full-jitter backoff before the ``retry``-th retry: uniform in [0, min(max, base * 2^(retry-1))]"""
+    return (rng or random).uniform(0, min(max_delay, base * (2 ** (retry - 1))))
+
+
+class RetryMetrics:
+    """Per-operation counters: calls, attempts, retries, calls that gave up, deadlines hit"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def record(self, operation: str, **counts: int):
+        with self._lock:
+            counters = self._counters.setdefault(operation, {
+                "calls": 0, "attempts": 0, "retries": 0, "gave_up": 0, "deadline_exceeded": 0,
+            })
+            for name, count in counts.items():
+                counters[name] = counters.get(name, 0) + count
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {operation: dict(counters) for operation, counters in self._counters.items()}
+
+
+# Shared by every policy in the process
+RETRY_METRICS = RetryMetrics()
+
+
+class RetryPolicy:
+    """
+    Run a call with up to ``max_retries`` retries of transient failures
+
+    ``call(fn)`` invokes ``fn(attempt, remaining)`` with the 1-based attempt number and the
+    seconds left before ``deadline`` (None without one), so the callee can bound its own
+    request timeout and check whether an earlier attempt already took effect. No retry starts
+    once its backoff would cross the deadline.
+    """
+
+    def __init__(self, operation: str, max_retries: int, base_delay: float,
+                 max_delay: float = DEFAULT_RETRY_MAX_DELAY, deadline: Optional[float] = None,
+                 metrics: RetryMetrics = RETRY_METRICS, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic, rng: Optional[random.Random] = None):
+        self.operation = operation
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.metrics = metrics
+        self.sleep = sleep
+        self.clock = clock
+        self.rng = rng
+
+    def call(self, fn: Callable[[int, Optional[float]], Any]) -> Any:
+        start = self.clock()
+        retries = 0
+        self.metrics.record(self.operation, calls=1)
+        while True:
+            remaining = None if self.deadline is None else max(0.0, self.deadline - (self.clock() - start))
+            self.metrics.record(self.operation, attempts=1)
+            try:
+                return fn(retries + 1, remaining)
+            except Exception as e:
+                if not is_transient(e) or retries >= self.max_retries:
+                    self.metrics.record(self.operation, gave_up=1)
+                    raise
+                delay = jittered_delay(self.base_delay, retries + 1, self.max_delay, self.rng)
+                if self.deadline is not None and self.clock() - start + delay >= self.deadline:
+                    self.metrics.record(self.operation, gave_up=1, deadline_exceeded=1)
+                    raise
+                retries += 1
+                self.metrics.record(self.operation, retries=1)
+                print(f"⚠️ {self.operation} failed ({type(e).__name__}: {e}), "
+                      f"retry {retries}/{self.max_retries} in {delay:.2f}s")
+                self.sleep(delay)
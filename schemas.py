@@ -106,6 +106,32 @@ INPUT_SCHEMA = {
         'required': False,
         'default': False
     },
+    # OUTPUT IMAGE ENCODING (defaults come from IMAGE_OUTPUT_FORMAT / IMAGE_OUTPUT_QUALITY / IMAGE_COMPRESSION_PRESET)
+    'output_format': {
+        'type': str,
+        'required': False,
+        'default': None,
+        'constraints': lambda x: x is None or x in ['png', 'jpeg', 'jpg', 'webp', 'avif']
+    },
+    'output_quality': {
+        'type': int,
+        'required': False,
+        'default': None,
+        'constraints': lambda x: x is None or (1 <= x <= 100)
+    },
+    'compression_preset': {
+        'type': str,
+        'required': False,
+        'default': None,
+        'constraints': lambda x: x is None or x in ['fast', 'balanced', 'small']
+    },
+    # LIVE PREVIEWS (cloud storage only): publish an approximate preview every N denoising steps
+    'preview_every_n_steps': {
+        'type': int,
+        'required': False,
+        'default': None,
+        'constraints': lambda x: x is None or (1 <= x <= 100)
+    },
     # VIDEO PARAMETERS (for text2video task_type only)
     'video_height': {
         'type': int,
@@ -121,7 +147,8 @@ INPUT_SCHEMA = {
         'type': int,
         'required': False,
         'default': None,  # Only set for video requests - NO DEFAULT!
-        'constraints': lambda x: x is None or (16 <= x <= 81)
+        # Above 81 (one Wan window) long-video mode generates overlapping windows
+        'constraints': lambda x: x is None or (16 <= x <= 401)
     },
     'video_guidance_scale': {
         'type': float,
@@ -133,4 +160,37 @@ INPUT_SCHEMA = {
         'required': False,
         'default': 15,  # Fixed: all videos are 15 FPS
     },
+    # Video encoder profile / codec (defaults: VIDEO_ENCODER_PROFILE / VIDEO_CODEC)
+    'video_profile': {
+        'type': str,
+        'required': False,
+        'default': None,
+        'constraints': lambda x: x is None or x in ['fast-preview', 'balanced', 'archive']
+    },
+    'video_codec': {
+        'type': str,
+        'required': False,
+        'default': None,
+        'constraints': lambda x: x is None or x in ['h264', 'h265', 'vp9', 'av1']
+    },
+    # Generate at a fraction of the resolution and upscale on CPU: draft (1/2), fast (3/4), full
+    'video_quality': {
+        'type': str,
+        'required': False,
+        'default': None,
+        'constraints': lambda x: x is None or x in ['draft', 'fast', 'full']
+    },
+    # Synthesize in-between frames on CPU: output fps = fps * frame_interpolation
+    'frame_interpolation': {
+        'type': int,
+        'required': False,
+        'default': None,
+        'constraints': lambda x: x is None or (1 <= x <= 4)
+    },
+    'interpolation_method': {
+        'type': str,
+        'required': False,
+        'default': None,
+        'constraints': lambda x: x is None or x in ['blend', 'flow']
+    },
 }
@@ -0,0 +1,328 @@
+"""
+Status Journal for SDXL Worker
+Write-behind journal for Firestore status updates: updates are appended to a local SQLite
+file and delivered by a background flusher with retry and backoff, so a slow or unreachable
+Firestore never blocks generation and no final status is lost
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from retry_policy import RETRY_METRICS, is_transient, jittered_delay
+from worker_lock import WORKER_ID, orphans, release, try_lock
+
+# On the persistent volume so queued updates survive the container; one file per worker
+# (SQLite must not be shared between hosts), journals of gone workers are taken over on
+# start. Empty disables the journal (status writes go straight to Firestore)
+DEFAULT_JOURNAL_PATH = os.environ.get("STATUS_JOURNAL_PATH", f"/runpod-volume/status-journal/{WORKER_ID}.sqlite")
+DEFAULT_JOURNAL_BACKOFF = float(os.environ.get("STATUS_JOURNAL_BACKOFF", "0.5"))
+DEFAULT_JOURNAL_MAX_BACKOFF = float(os.environ.get("STATUS_JOURNAL_MAX_BACKOFF", "60"))
+# Failed deliveries of one update before it is moved to the dead-letter table
+DEFAULT_JOURNAL_MAX_ATTEMPTS = int(os.environ.get("STATUS_JOURNAL_MAX_ATTEMPTS", "30"))
+# Firestore accepts at most 500 writes per batch
+JOURNAL_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending (
+    path TEXT PRIMARY KEY,
+    fields TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dead_letter (
+    path TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT NOT NULL,
+    created REAL NOT NULL,
+    failed REAL NOT NULL
+)
+"""
+
+
+def merge_fields(target: Dict[str, Any], fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply ``fields`` onto ``target`` the way Firestore's set(merge=True) does: nested maps merge"""
+    for key, value in fields.items():
+        if isinstance(value, dict):
+            existing = target.get(key)
+            target[key] = merge_fields(dict(existing) if isinstance(existing, dict) else {}, value)
+        else:
+            target[key] = value
+    return target
+
+
+class StatusJournal:
+    """
+    Durable queue of document updates, one row per document
+
+    ``append`` merges an update into the document's pending row, so superseded updates
+    collapse into one write. A daemon thread delivers due rows through ``deliver`` (a callable
+    taking ``[(path, fields)]`` and raising on failure) in batches. A batch that fails
+    transiently is retried with jittered exponential backoff; one that fails permanently is
+    retried row by row, so a single rejected document does not hold back the others. A row
+    that fails permanently, or ``max_attempts`` times, moves to the ``dead_letter`` table
+    (see ``requeue_dead_letters``). A row is only removed once the version that was delivered
+    is still the latest, so an update arriving mid-delivery is never dropped.
+
+    The journal holds an exclusive lock on its file while open. On start it takes over the
+    rows of other ``*.sqlite`` journals in its directory whose lock is free (their worker is
+    gone), so updates queued by a worker that was scaled down are still delivered.
+
+    ``sentinels`` maps names to non-JSON values (Firestore's SERVER_TIMESTAMP) so they
+    survive the round-trip through the file.
+    """
+
+    def __init__(self, path: str, deliver: Callable[[List[Tuple[str, Dict[str, Any]]]], None],
+                 sentinels: Optional[Dict[str, Any]] = None, backoff: float = DEFAULT_JOURNAL_BACKOFF,
+                 max_backoff: float = DEFAULT_JOURNAL_MAX_BACKOFF, max_attempts: int = DEFAULT_JOURNAL_MAX_ATTEMPTS):
+        self.path = path
+        self.deliver = deliver
+        self.sentinels = sentinels or {}
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._owner_lock = try_lock(path)
+        if self._owner_lock is None:
+            raise RuntimeError(f"status journal {path} is in use by another process")
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL's shared-memory index does not work on network filesystems such as the
+        # persistent volume; a truncated rollback journal does
+        self._db.execute("PRAGMA journal_mode=TRUNCATE")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+
+        self.appended = 0
+        self.collapsed = 0
+        self.delivered = 0
+        self.batches = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.max_lag = 0.0
+        self.adopted = self._adopt_orphans(directory or ".")
+
+        self._thread = threading.Thread(target=self._run, name="status-journal", daemon=True)
+        self._thread.start()
+
+    def _encode(self, fields: Dict[str, Any]) -> str:
+        def default(value):
+            for name, sentinel in self.sentinels.items():
+                if value is sentinel:
+                    return {"$sentinel": name}
+            raise TypeError(f"{type(value).__name__} cannot be journaled")
+        return json.dumps(fields, default=default)
+
+    def _decode(self, text: str) -> Dict[str, Any]:
+        def hook(obj):
+            if len(obj) == 1 and "$sentinel" in obj:
+                return self.sentinels[obj["$sentinel"]]
+            return obj
+        return json.loads(text, object_hook=hook)
+
+    def append(self, path: str, fields: Dict[str, Any]):
+        """Queue an update of the document at ``path`` (raises TypeError for non-JSON values)"""
+        self.append_many([(path, fields)])
+
+    def append_many(self, updates: List[Tuple[str, Dict[str, Any]]]):
+        """Queue several document updates in one durable transaction"""
+        self._append_encoded([(path, self._encode(fields)) for path, fields in updates])
+
+    def _append_encoded(self, encoded: List[Tuple[str, str]]):
+        now = time.time()
+        with self._wake:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for path, text in encoded:
+                    row = self._db.execute("SELECT fields FROM pending WHERE path = ?", (path,)).fetchone()
+                    if row is None:
+                        self._db.execute(
+                            "INSERT INTO pending (path, fields, version, next_attempt, created) VALUES (?, ?, 1, ?, ?)",
+                            (path, text, now, now))
+                    else:
+                        merged = merge_fields(json.loads(row[0]), json.loads(text))
+                        self._db.execute("UPDATE pending SET fields = ?, version = version + 1 WHERE path = ?",
+                                         (json.dumps(merged), path))
+                        self.collapsed += 1
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self.appended += len(encoded)
+            self._wake.notify()
+
+    def _adopt_orphans(self, directory: str) -> int:
+        """Move the rows of journals left by gone workers into this one; returns the updates taken over"""
+        adopted = 0
+        for orphan in orphans(directory, self.path, ".sqlite"):
+            try:
+                source = sqlite3.connect(orphan)
+                try:
+                    rows = source.execute("SELECT path, fields FROM pending ORDER BY created").fetchall()
+                    dead = source.execute("SELECT path, fields, attempts, error, created, failed "
+                                          "FROM dead_letter").fetchall()
+                finally:
+                    source.close()
+            except sqlite3.Error as e:
+                print(f"⚠️ Could not take over status journal {orphan}: {e}")
+                continue
+            self._append_encoded(rows)
+            with self._lock:
+                self._db.executemany("INSERT INTO dead_letter (path, fields, attempts, error, created, failed) "
+                                     "VALUES (?, ?, ?, ?, ?, ?)", dead)
+            for suffix in ("", "-journal", "-wal", "-shm"):
+                try:
+                    os.remove(orphan + suffix)
+                except OSError:
+                    pass
+            adopted += len(rows)
+            print(f"📒 Took over {len(rows)} queued update(s) from {orphan}")
+        return adopted
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """Wait until every queued update has been delivered; False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self.pending():
+            if time.monotonic() >= deadline:
+                return False
+            with self._wake:
+                self._wake.notify()
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+        self._thread.join(timeout=5)
+        self._db.close()
+        release(self.path, self._owner_lock)
+
+    def _due(self):
+        """Rows ready for delivery, and seconds until the next one is due (None: queue empty)"""
+        now = time.time()
+        rows = self._db.execute(
+            "SELECT path, fields, version, attempts, created FROM pending WHERE next_attempt <= ? "
+            "ORDER BY created LIMIT ?", (now, JOURNAL_BATCH_SIZE)).fetchall()
+        upcoming = self._db.execute("SELECT MIN(next_attempt) FROM pending").fetchone()[0]
+        return rows, None if upcoming is None else max(0.0, upcoming - now)
+
+    def _run(self):
+        while True:
+            with self._wake:
+                rows, wait = self._due()
+                while not rows and not self._closed:
+                    self._wake.wait(timeout=wait)
+                    rows, wait = self._due()
+                if self._closed:
+                    return
+
+            try:
+                self._deliver_rows(rows)
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                if is_transient(e) or len(rows) == 1:
+                    self._failed(rows, e)
+                    continue
+                # Permanent rejection: find the row(s) responsible, deliver the rest
+                print(f"⚠️ Status journal batch of {len(rows)} update(s) rejected ({e}), retrying one by one")
+                for row in rows:
+                    try:
+                        self._deliver_rows([row])
+                    except Exception as row_error:
+                        self._failed([row], row_error)
+
+    def _deliver_rows(self, rows):
+        self.deliver([(path, self._decode(fields)) for path, fields, _, _, _ in rows])
+        with self._lock:
+            now = time.time()
+            for path, _, version, _, created in rows:
+                # A newer version appended during delivery stays queued
+                self._db.execute("DELETE FROM pending WHERE path = ? AND version = ?", (path, version))
+                self.max_lag = max(self.max_lag, now - created)
+            self.delivered += len(rows)
+            self.batches += 1
+
+    def _failed(self, rows, error: Exception):
+        """Back off the rows, or dead-letter those that cannot succeed"""
+        transient = is_transient(error)
+        dead = 0
+        with self._lock:
+            now = time.time()
+            for path, fields, version, attempts, created in rows:
+                if transient and attempts + 1 < self.max_attempts:
+                    delay = jittered_delay(self.backoff, attempts + 1, self.max_backoff)
+                    self._db.execute("UPDATE pending SET attempts = attempts + 1, next_attempt = ? WHERE path = ?",
+                                     (now + delay, path))
+                    continue
+                self._db.execute("BEGIN IMMEDIATE")
+                self._db.execute("INSERT INTO dead_letter (path, fields, attempts, error, created, failed) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)",
+                                 (path, fields, attempts + 1, f"{type(error).__name__}: {error}", created, now))
+                self._db.execute("DELETE FROM pending WHERE path = ? AND version = ?", (path, version))
+                self._db.execute("COMMIT")
+                dead += 1
+            self.dead_lettered += dead
+        if dead:
+            print(f"❌ Status journal gave up on {dead} update(s), moved to dead_letter: {error}")
+        if dead < len(rows):
+            RETRY_METRICS.record("status_journal", retries=1)
+            print(f"⚠️ Status journal delivery of {len(rows) - dead} update(s) failed, will retry: {error}")
+
+    def deliver_now(self, path: str) -> bool:
+        """Deliver the queued update of one document now, ignoring its backoff; False if it is still queued"""
+        with self._lock:
+            row = self._db.execute("SELECT path, fields, version, attempts, created FROM pending WHERE path = ?",
+                                   (path,)).fetchone()
+        if row is None:
+            return True
+        try:
+            self._deliver_rows([row])
+            return True
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            self._failed([row], e)
+            return False
+
+    def requeue_dead_letters(self) -> int:
+        """Queue dead-lettered updates again (e.g. after fixing what rejected them); returns how many"""
+        with self._lock:
+            rows = self._db.execute("SELECT rowid, path, fields FROM dead_letter ORDER BY rowid").fetchall()
+        for rowid, path, fields in rows:
+            self.append(path, self._decode(fields))
+            with self._lock:
+                self._db.execute("DELETE FROM dead_letter WHERE rowid = ?", (rowid,))
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        pending = self.pending()
+        with self._lock:
+            dead_letters = self._db.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+            return {
+                "appended": self.appended,
+                "collapsed": self.collapsed,
+                "delivered": self.delivered,
+                "batches": self.batches,
+                "failures": self.failures,
+                "dead_letters": dead_letters,
+                "adopted": self.adopted,
+                "pending": pending,
+                "max_lag_seconds": round(self.max_lag, 3),
+            }
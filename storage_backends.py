@@ -0,0 +1,543 @@
+"""
+Storage Backends for SDXL Worker
+Object storage behind one interface: Firebase Storage, S3-compatible buckets, a local
+filesystem directory and an in-memory fake for tests and benchmarks. Every backend shares the
+same concurrency limit, retry policy and upload statistics, so the upload layer can be
+measured and tuned locally without live services.
+"""
+
+import os
+import time
+import base64
+import random
+import hashlib
+import threading
+from collections import deque
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from resumable_upload import (
+    ResumableUpload, RESUMABLE_THRESHOLD, DEFAULT_CHUNK_SIZE, DEFAULT_RETRY_BACKOFF, aligned_chunk_size,
+)
+from retry_policy import RetryPolicy, request_timeout
+
+# S3-compatible storage is optional
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    S3_AVAILABLE = True
+except ImportError:
+    S3_AVAILABLE = False
+
+# "firebase", "s3", "filesystem" or "memory"; unset keeps Firebase when it is configured
+DEFAULT_STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "")
+# Concurrent object uploads per backend (and HTTP connections kept in its pool)
+DEFAULT_STORAGE_CONCURRENCY = int(os.environ.get("STORAGE_MAX_CONCURRENCY",
+                                                 os.environ.get("UPLOAD_CONCURRENCY", "8")))
+# Extra attempts for an upload that failed transiently, all within the upload deadline (seconds)
+DEFAULT_STORAGE_RETRIES = int(os.environ.get("STORAGE_RETRIES", "4"))
+DEFAULT_UPLOAD_DEADLINE = float(os.environ.get("STORAGE_UPLOAD_DEADLINE", "120"))
+DEFAULT_LOCAL_STORAGE_DIR = os.environ.get("STORAGE_LOCAL_DIR", "/runpod-volume/outputs")
+# Base URL objects are served from (filesystem / S3); S3 falls back to presigned URLs
+DEFAULT_PUBLIC_BASE_URL = os.environ.get("STORAGE_PUBLIC_BASE_URL", "")
+
+# How Firebase objects get a readable URL: "predefined_acl" (public-read ACL set by the upload
+# request itself), "bucket_public" (the bucket grants public read; nothing per object),
+# "signed" (V4 signed URLs computed locally) or "make_public" (an ACL call after each upload)
+DEFAULT_URL_STRATEGY = os.environ.get("STORAGE_URL_STRATEGY", "predefined_acl")
+URL_STRATEGIES = ("predefined_acl", "bucket_public", "signed", "make_public")
+# Signed URL lifetime (V4 signatures allow at most 7 days)
+DEFAULT_SIGNED_URL_EXPIRY = int(os.environ.get("STORAGE_SIGNED_URL_EXPIRY", str(7 * 24 * 3600)))
+# Per-upload latencies kept for the percentiles in stats()
+LATENCY_SAMPLES = 1024
+
+# S3 multipart parts must be at least 5 MiB, except the last
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+# Presigned URL lifetime, as RunPod's rp_upload uses
+S3_PRESIGNED_EXPIRY = 7 * 24 * 3600
+
+
+def content_md5(data) -> str:
+    """Hex MD5 of an object, as GCS and S3 report it for single-request uploads"""
+    return hashlib.md5(data).hexdigest()
+
+
+class StorageBackend:
+    """
+    Base class: ``upload`` puts one object and returns its URL; ``open_upload`` /
+    ``complete_upload`` stream an object whose size is not known up front
+
+    Subclasses implement ``_put`` and, to make retries idempotent, ``_stored`` / ``_existing``.
+    ``upload`` holds one of ``max_concurrency`` slots for the duration of the transfer and
+    retries transient failures with jittered backoff within ``deadline``. Object names are
+    deterministic, and before a retry the object is looked up by its MD5: when the attempt
+    that "failed" (e.g. timed out waiting for the response) stored it after all, the retry
+    only finishes the job instead of sending the bytes again. The default streaming upload
+    buffers in memory and puts the object on completion.
+    """
+
+    name = "base"
+
+    def __init__(self, max_concurrency: int = DEFAULT_STORAGE_CONCURRENCY,
+                 max_retries: int = DEFAULT_STORAGE_RETRIES, backoff: float = DEFAULT_RETRY_BACKOFF,
+                 deadline: Optional[float] = DEFAULT_UPLOAD_DEADLINE):
+        self.max_concurrency = max(1, max_concurrency)
+        self.retry = RetryPolicy(f"{self.name}_upload", max_retries, backoff, deadline=deadline)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+
+        self.objects = 0
+        self.bytes = 0
+        self.retries = 0
+        self.resumed = 0
+        self.deduplicated = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def upload(self, path: str, data: bytes, content_type: str, checksum: Optional[str] = None) -> str:
+        """Store ``data`` at ``path`` and return its URL (``checksum``: its MD5, if already known)"""
+        checksum = checksum or content_md5(data)
+
+        def attempt(number: int, remaining: Optional[float]) -> str:
+            if number > 1:
+                self._record(retries=1)
+                if self._stored(path, checksum):
+                    self._record(resumed=1)
+                    return self._existing(path, **request_timeout(remaining))
+            return self._put(path, data, content_type, **request_timeout(remaining))
+
+        with self._slots:
+            start = time.perf_counter()
+            try:
+                url = self.retry.call(attempt)
+            except Exception:
+                self._record(failures=1)
+                raise
+            self._record(objects=1, bytes=len(data), seconds=time.perf_counter() - start)
+        return url
+
+    def stored(self, path: str, checksum: str) -> bool:
+        """Whether ``path`` holds an object with this MD5 (a metadata request, no data)"""
+        try:
+            return self._stored(path, checksum)
+        except Exception as e:
+            print(f"⚠️ Could not check {path}: {e}")
+            return False
+
+    def link(self, path: str) -> str:
+        """URL of the object already stored at ``path``, for an upload of identical content"""
+        with self._slots:
+            url = self.retry.call(lambda attempt, remaining: self._existing(path, **request_timeout(remaining)))
+        self._record(deduplicated=1)
+        return url
+
+    def _put(self, path: str, data: bytes, content_type: str, timeout: Optional[float] = None) -> str:
+        raise NotImplementedError
+
+    def _stored(self, path: str, checksum: str) -> bool:
+        """Whether ``path`` already holds an object with this MD5"""
+        return False
+
+    def _existing(self, path: str, timeout: Optional[float] = None) -> str:
+        """URL of an object that is already stored (finishing whatever ``_put`` does after storing)"""
+        raise NotImplementedError
+
+    def open_upload(self, path: str, content_type: str, size: Optional[int] = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """Start a streaming upload; feed it with ``write`` and pass it to ``complete_upload``"""
+        return BufferedUpload(path, content_type)
+
+    def complete_upload(self, upload) -> str:
+        """Finish a streaming upload and return the object's URL"""
+        return self.upload(upload.path, bytes(upload.buffer), upload.content_type)
+
+    def _record(self, objects: int = 0, bytes: int = 0, retries: int = 0, resumed: int = 0,
+                deduplicated: int = 0, failures: int = 0, seconds: float = 0.0):
+        with self._lock:
+            self.objects += objects
+            self.bytes += bytes
+            self.retries += retries
+            self.resumed += resumed
+            self.deduplicated += deduplicated
+            self.failures += failures
+            self.seconds += seconds
+            if objects:
+                self._latencies.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "objects": self.objects,
+                "mb": round(self.bytes / 1e6, 2),
+                "retries": self.retries,
+                "resumed": self.resumed,
+                "deduplicated": self.deduplicated,
+                "failures": self.failures,
+                "seconds": round(self.seconds, 3),
+                "upload_ms_p50": _percentile_ms(self._latencies, 0.5),
+                "upload_ms_p95": _percentile_ms(self._latencies, 0.95),
+                "max_concurrency": self.max_concurrency,
+            }
+
+
+def _percentile_ms(samples, fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 1)
+
+
+class BufferedUpload:
+    """Streaming upload collected in memory and stored in one piece on completion"""
+
+    def __init__(self, path: str, content_type: str):
+        self.path = path
+        self.content_type = content_type
+        self.buffer = bytearray()
+
+    def write(self, data) -> None:
+        self.buffer += data
+
+
+class FirebaseStorageBackend(StorageBackend):
+    """
+    Firebase Storage (Google Cloud Storage) bucket
+
+    Objects of at least ``RESUMABLE_THRESHOLD`` bytes and streamed uploads use the chunked
+    resumable protocol. All requests share the storage client's authorized HTTP session, whose
+    connection pool is sized to ``max_concurrency``. ``url_strategy`` (see URL_STRATEGIES)
+    decides how objects become readable; every strategy but "make_public" needs no request
+    beyond the upload itself.
+    """
+
+    name = "firebase"
+
+    def __init__(self, bucket, url_strategy: str = DEFAULT_URL_STRATEGY,
+                 signed_url_expiry: int = DEFAULT_SIGNED_URL_EXPIRY, **kwargs):
+        if url_strategy not in URL_STRATEGIES:
+            raise ValueError(f"Unknown URL strategy: {url_strategy} (expected one of {', '.join(URL_STRATEGIES)})")
+        super().__init__(**kwargs)
+        self.bucket = bucket
+        self.url_strategy = url_strategy
+        self.signed_url_expiry = signed_url_expiry
+        session = getattr(getattr(bucket, "client", None), "_http", None)
+        if hasattr(session, "mount"):
+            from requests.adapters import HTTPAdapter
+            session.mount("https://", HTTPAdapter(pool_connections=self.max_concurrency,
+                                                  pool_maxsize=self.max_concurrency))
+
+    def _put(self, path: str, data: bytes, content_type: str, timeout: Optional[float] = None) -> str:
+        # Large objects (videos) go up in chunks that are retried individually
+        if len(data) >= RESUMABLE_THRESHOLD:
+            upload = self.open_upload(path, content_type, size=len(data))
+            upload.write(data)
+            return self._finish(upload)
+
+        blob = self.bucket.blob(path)
+        blob.upload_from_string(data, content_type=content_type, **self._acl(), **request_timeout(timeout))
+        print(f"✅ Uploaded to Firebase Storage: {path}")
+        return self._url(blob, timeout)
+
+    def _acl(self) -> Dict[str, str]:
+        """Upload keyword that makes the object public in the same request"""
+        return {"predefined_acl": "publicRead"} if self.url_strategy == "predefined_acl" else {}
+
+    def _url(self, blob, timeout: Optional[float] = None) -> str:
+        """URL of an uploaded object under the URL strategy"""
+        if self.url_strategy == "make_public":
+            blob.make_public(**request_timeout(timeout))
+        elif self.url_strategy == "signed":
+            # Signed with the service account's private key, no request
+            return blob.generate_signed_url(version="v4", method="GET",
+                                            expiration=timedelta(seconds=self.signed_url_expiry))
+        return blob.public_url
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "url_strategy": self.url_strategy}
+
+    def _stored(self, path: str, checksum: str) -> bool:
+        blob = self.bucket.get_blob(path)
+        return blob is not None and blob.md5_hash == base64.b64encode(bytes.fromhex(checksum)).decode()
+
+    def _existing(self, path: str, timeout: Optional[float] = None) -> str:
+        # A predefined ACL was applied atomically with the upload that stored the object
+        blob = self.bucket.blob(path)
+        print(f"✅ Already in Firebase Storage: {path}")
+        return self._url(blob, timeout)
+
+    def open_upload(self, path: str, content_type: str, size: Optional[int] = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> ResumableUpload:
+        blob = self.bucket.blob(path)
+        session_url = blob.create_resumable_upload_session(content_type=content_type, size=size, **self._acl())
+        upload = ResumableUpload(session_url, self.bucket.client._http, aligned_chunk_size(chunk_size))
+        upload.blob = blob
+        return upload
+
+    def complete_upload(self, upload: ResumableUpload) -> str:
+        start = time.perf_counter()
+        url = self._finish(upload)
+        self._record(objects=1, bytes=upload.offset, seconds=time.perf_counter() - start)
+        return url
+
+    def _finish(self, upload: ResumableUpload) -> str:
+        upload.finish()
+        print(f"✅ Uploaded to Firebase Storage: {upload.blob.name} in {upload.chunks} chunks "
+              f"({upload.retries} retries, {upload.seconds:.2f}s)")
+        return self._url(upload.blob)
+
+
+class S3MultipartUpload:
+    """Streaming upload to S3 as a multipart upload; parts are sent as they fill up"""
+
+    def __init__(self, backend: "S3StorageBackend", path: str, content_type: str, part_size: int):
+        self.backend = backend
+        self.path = path
+        self.content_type = content_type
+        self.part_size = max(S3_MIN_PART_SIZE, part_size)
+        # Every part goes to the bucket the upload was started in
+        self.bucket_name = backend.bucket_name
+        self.upload_id = backend.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=path, ContentType=content_type)["UploadId"]
+        self.parts = []
+        self.offset = 0
+        self._buffer = bytearray()
+
+    def write(self, data) -> None:
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            self._send(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+
+    def _send(self, data: bytes):
+        number = len(self.parts) + 1
+        response = self.backend.client.upload_part(
+            Bucket=self.bucket_name, Key=self.path, UploadId=self.upload_id,
+            PartNumber=number, Body=data)
+        self.parts.append({"PartNumber": number, "ETag": response["ETag"]})
+        self.offset += len(data)
+
+    def finish(self):
+        if self._buffer or not self.parts:
+            self._send(bytes(self._buffer))
+            self._buffer = bytearray()
+        return self.backend.client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=self.path, UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts})
+
+    def abort(self):
+        self.backend.client.abort_multipart_upload(
+            Bucket=self.bucket_name, Key=self.path, UploadId=self.upload_id)
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    S3-compatible bucket (AWS S3, R2, MinIO, ...), configured like RunPod's rp_upload
+
+    URLs are ``public_base_url/key`` when the bucket is served publicly, otherwise presigned
+    GET URLs valid for 7 days. The boto3 client is shared by all threads with a connection pool
+    of ``max_concurrency``; botocore's own retries are disabled in favour of the shared policy.
+    Without a ``bucket_name``, each upload goes to rp_upload's bucket for the current month
+    ("MM-YY"), so a long-lived backend follows month boundaries.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket_name: Optional[str] = None, endpoint_url: Optional[str] = None,
+                 access_key_id: Optional[str] = None, secret_access_key: Optional[str] = None,
+                 region: Optional[str] = None, public_base_url: str = DEFAULT_PUBLIC_BASE_URL,
+                 client: Any = None, **kwargs):
+        super().__init__(**kwargs)
+        self.fixed_bucket_name = bucket_name
+        self.public_base_url = public_base_url.rstrip("/")
+        if client is None:
+            if not S3_AVAILABLE:
+                raise ImportError("S3 storage requires boto3. Install with: pip install boto3")
+            client = boto3.session.Session().client(
+                "s3",
+                endpoint_url=endpoint_url,
+                aws_access_key_id=access_key_id,
+                aws_secret_access_key=secret_access_key,
+                region_name=region,
+                config=BotoConfig(signature_version="s3v4", max_pool_connections=self.max_concurrency,
+                                  retries={"max_attempts": 1},
+                                  read_timeout=self.retry.deadline or 60),
+            )
+        self.client = client
+
+    @property
+    def bucket_name(self) -> str:
+        return self.fixed_bucket_name or time.strftime("%m-%y")
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "S3StorageBackend":
+        """The bucket rp_upload would use: BUCKET_ENDPOINT_URL / BUCKET_ACCESS_KEY_ID / BUCKET_SECRET_ACCESS_KEY"""
+        return cls(
+            bucket_name=os.environ.get("BUCKET_NAME") or None,
+            endpoint_url=os.environ.get("BUCKET_ENDPOINT_URL"),
+            access_key_id=os.environ.get("BUCKET_ACCESS_KEY_ID"),
+            secret_access_key=os.environ.get("BUCKET_SECRET_ACCESS_KEY"),
+            region=os.environ.get("BUCKET_REGION"),
+            **kwargs,
+        )
+
+    def url_for(self, path: str, bucket_name: Optional[str] = None) -> str:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{path}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket_name or self.bucket_name, "Key": path},
+            ExpiresIn=S3_PRESIGNED_EXPIRY)
+
+    def _put(self, path: str, data: bytes, content_type: str, timeout: Optional[float] = None) -> str:
+        bucket_name = self.bucket_name
+        self.client.put_object(Bucket=bucket_name, Key=path, Body=data, ContentType=content_type)
+        print(f"✅ Uploaded to S3 bucket {bucket_name}: {path}")
+        return self.url_for(path, bucket_name)
+
+    def _stored(self, path: str, checksum: str) -> bool:
+        try:
+            head = self.client.head_object(Bucket=self.bucket_name, Key=path)
+        except Exception:
+            return False
+        return head.get("ETag", "").strip('"') == checksum
+
+    def _existing(self, path: str, timeout: Optional[float] = None) -> str:
+        return self.url_for(path)
+
+    def open_upload(self, path: str, content_type: str, size: Optional[int] = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> S3MultipartUpload:
+        return S3MultipartUpload(self, path, content_type, chunk_size)
+
+    def complete_upload(self, upload: S3MultipartUpload) -> str:
+        start = time.perf_counter()
+        try:
+            upload.finish()
+        except Exception:
+            upload.abort()
+            raise
+        self._record(objects=1, bytes=upload.offset, seconds=time.perf_counter() - start)
+        return self.url_for(upload.path, upload.bucket_name)
+
+
+class FileUpload:
+    """Streaming upload written to ``{target}.part`` and renamed into place on completion"""
+
+    def __init__(self, path: str, target: str, content_type: str):
+        self.path = path
+        self.target = target
+        self.content_type = content_type
+        self.offset = 0
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        self._file = open(f"{target}.part", "wb")
+
+    def write(self, data) -> None:
+        self._file.write(data)
+        self.offset += len(data)
+
+    def finish(self):
+        self._file.close()
+        os.replace(f"{self.target}.part", self.target)
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Directory on local disk or a mounted volume; objects are written atomically
+
+    URLs are ``public_base_url/path`` when the directory is served, otherwise file:// URLs.
+    """
+
+    name = "filesystem"
+
+    def __init__(self, root: str = DEFAULT_LOCAL_STORAGE_DIR, public_base_url: str = DEFAULT_PUBLIC_BASE_URL,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.root = root
+        self.public_base_url = public_base_url.rstrip("/")
+
+    def url_for(self, path: str) -> str:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{path}"
+        return f"file://{os.path.abspath(os.path.join(self.root, path))}"
+
+    def _put(self, path: str, data: bytes, content_type: str, timeout: Optional[float] = None) -> str:
+        upload = FileUpload(path, os.path.join(self.root, path), content_type)
+        upload.write(data)
+        upload.finish()
+        return self.url_for(path)
+
+    def _stored(self, path: str, checksum: str) -> bool:
+        try:
+            with open(os.path.join(self.root, path), "rb") as stored:
+                return content_md5(stored.read()) == checksum
+        except OSError:
+            return False
+
+    def _existing(self, path: str, timeout: Optional[float] = None) -> str:
+        return self.url_for(path)
+
+    def open_upload(self, path: str, content_type: str, size: Optional[int] = None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> FileUpload:
+        return FileUpload(path, os.path.join(self.root, path), content_type)
+
+    def complete_upload(self, upload: FileUpload) -> str:
+        start = time.perf_counter()
+        upload.finish()
+        self._record(objects=1, bytes=upload.offset, seconds=time.perf_counter() - start)
+        return self.url_for(upload.path)
+
+
+class MemoryStorageBackend(StorageBackend):
+    """
+    In-memory object store that simulates a network: each upload takes ``latency`` seconds
+    plus its size over ``bandwidth_mbps``, and fails with probability ``failure_rate``
+    """
+
+    name = "memory"
+
+    def __init__(self, latency: float = 0.0, bandwidth_mbps: Optional[float] = None,
+                 failure_rate: float = 0.0, seed: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.bandwidth_mbps = bandwidth_mbps
+        self.failure_rate = failure_rate
+        self.store: Dict[str, Any] = {}
+        self._random = random.Random(seed)
+
+    def _put(self, path: str, data: bytes, content_type: str, timeout: Optional[float] = None) -> str:
+        transfer = len(data) * 8 / (self.bandwidth_mbps * 1e6) if self.bandwidth_mbps else 0.0
+        time.sleep(self.latency + transfer)
+        with self._lock:
+            failed = self._random.random() < self.failure_rate
+        if failed:
+            raise ConnectionError("simulated upload failure")
+        self.store[path] = (bytes(data), content_type)
+        return f"memory://{path}"
+
+    def _stored(self, path: str, checksum: str) -> bool:
+        stored = self.store.get(path)
+        return stored is not None and content_md5(stored[0]) == checksum
+
+    def _existing(self, path: str, timeout: Optional[float] = None) -> str:
+        return f"memory://{path}"
+
+
+def create_storage_backend(name: str, bucket: Any = None, **kwargs) -> Optional[StorageBackend]:
+    """
+    Build the backend called ``name`` ("firebase" needs the Firebase ``bucket``); returns None
+    for an empty name
+    """
+    name = (name or "").strip().lower()
+    if not name:
+        return None
+    if name == "firebase":
+        if bucket is None:
+            raise ValueError("Firebase storage backend needs an initialized Firebase bucket")
+        return FirebaseStorageBackend(bucket, **kwargs)
+    if name == "s3":
+        return S3StorageBackend.from_env(**kwargs)
+    if name in ("filesystem", "local"):
+        return LocalStorageBackend(**kwargs)
+    if name == "memory":
+        return MemoryStorageBackend(**kwargs)
+    raise ValueError(f"Unknown storage backend: {name}")
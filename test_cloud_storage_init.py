@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test lazy cloud storage initialization: nothing happens at construction, concurrent first
+uses share one initialization, and it can run ahead on a background thread
+"""
+
+import os
+import sys
+import time
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cloud_storage import CloudStorageManager
+
+
+class SlowManager(CloudStorageManager):
+    """Counts initializations, each taking ``seconds``"""
+    def __init__(self, seconds=0.2):
+        super().__init__()
+        self.seconds = seconds
+        self.initializations = 0
+
+    def _initialize(self):
+        self.initializations += 1
+        time.sleep(self.seconds)
+        super()._initialize()
+
+
+def test_first_use_initializes_once():
+    manager = SlowManager()
+    assert not manager.is_ready() and manager.initializations == 0
+
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(manager.storage_type)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert manager.initializations == 1 and manager.is_ready()
+    assert seen == ["local"] * 8
+
+
+def test_background_init_and_overrides():
+    manager = SlowManager()
+    start = time.perf_counter()
+    manager.start_background_init()
+    manager.start_background_init()
+    assert time.perf_counter() - start < 0.1
+    assert manager.wait_ready(5)
+    assert manager.initializations == 1
+
+    # Assignments made before initialization are not overwritten by it
+    early = SlowManager(seconds=0)
+    early.storage_type = "firebase"
+    assert early.storage_type == "firebase" and early.initializations == 1
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test content-hash deduplicated uploads: identical outputs are linked to the stored object
+instead of uploaded again, across jobs and (through the Firestore index) across workers
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cloud_storage as cloud_storage_module
+from content_index import ContentIndex
+from storage_backends import content_md5
+
+PAYLOAD = os.urandom(64 * 1024)
+
+
+def _fresh_index():
+    storage = cloud_storage_module.cloud_storage
+    return ContentIndex(remote_get=storage._get_index_entry, remote_put=storage._put_index_entry)
+
+
+def _upload(storage, file_uid, data=PAYLOAD, shared_dedup=False):
+    return storage.upload_file(data, "", "image/png", "user-1", file_uid, shared_dedup=shared_dedup)
+
+
+def test_index_lookup_order_and_replacement():
+    remote = {("u", "b"): {"path": "b.png"}}
+    index = ContentIndex(max_entries=2, remote_get=lambda owner, checksum: remote.get((owner, checksum)))
+    index.record("u", "a", {"path": "a.png"})
+    assert index.lookup("u", "a") == ({"path": "a.png"}, "local")
+    assert index.lookup("u", "b") == ({"path": "b.png"}, "remote")
+    assert index.lookup("u", "b")[1] == "local"
+    assert index.lookup("other", "a") == (None, None)
+    assert index.lookup("u", "x", remote=False) == (None, None)
+
+    # New content at a path invalidates what the path used to hold
+    index.record("u", "c", {"path": "b.png"})
+    assert index.lookup("u", "c")[1] == "local"
+    remote.clear()
+    assert index.lookup("u", "b") == (None, None)
+    assert index.stats()["entries"] == 2
+
+
+def test_duplicate_upload_is_linked(fake_cloud):
+    storage, db, bucket = fake_cloud(content_index=_fresh_index())
+
+    first = _upload(storage, "file-1")
+    second = _upload(storage, "file-2")
+
+    assert first == second == "https://storage.example/generating/user-1/image/file-1.png"
+    assert list(bucket.objects) == ["generating/user-1/image/file-1.png"]
+    assert storage.backend.stats()["deduplicated"] == 1
+    # Fresh outputs never read the Firestore index: the only round-trip is recording file-1
+    assert db.round_trips == 1
+    entry = db.documents[f"generations/user-1/content_index/{content_md5(PAYLOAD)}"]
+    assert entry["path"] == "generating/user-1/image/file-1.png" and entry["size"] == len(PAYLOAD)
+
+    # Small objects and in-place overwrites always upload
+    _upload(storage, "small-1", b"x" * 100)
+    _upload(storage, "small-2", b"x" * 100)
+    storage.upload_file(PAYLOAD, "", "image/png", "user-1", "file-3", dedup=False)
+    assert len(bucket.objects) == 4
+
+    # A local entry whose object is gone is dropped, and the bytes uploaded again
+    del bucket.objects["generating/user-1/image/file-1.png"]
+    assert _upload(storage, "file-4").endswith("/file-4.png")
+    assert "generating/user-1/image/file-4.png" in bucket.objects
+
+
+def test_remote_index_shared_and_verified(monkeypatch, fake_cloud):
+    """A fresh worker links through the Firestore index, but only to an object that still matches"""
+    storage, db, bucket = fake_cloud(content_index=_fresh_index())
+    _upload(storage, "file-1")
+
+    monkeypatch.setattr(storage, "content_index", _fresh_index())
+    assert _upload(storage, "file-2", shared_dedup=True).endswith("/file-1.png")
+    assert storage.content_index.stats()["remote_hits"] == 1
+
+    monkeypatch.setattr(storage, "content_index", _fresh_index())
+    del bucket.objects["generating/user-1/image/file-1.png"]
+    assert _upload(storage, "file-3", shared_dedup=True).endswith("/file-3.png")
+    assert "generating/user-1/image/file-3.png" in bucket.objects
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
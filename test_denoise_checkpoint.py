@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test denoising checkpoints: atomic saves every N steps and resuming mid-schedule
+"""
+
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from denoise_checkpoint import DenoiseCheckpointer, checkpoint_signature
+
+
+class FakeScheduler:
+    """Multistep-style scheduler: set_timesteps resets the solver history"""
+    def set_timesteps(self, num_inference_steps, device=None):
+        self.timesteps = torch.arange(num_inference_steps, 0, -1)
+        self._step_index = None
+        self.model_outputs = [None, None]
+        self.lower_order_nums = 0
+
+    def step(self, latents):
+        # Like UniPC, the solver looks up its schedule by absolute step index
+        assert (self._step_index or 0) < len(self.timesteps)
+        self._step_index = (self._step_index or 0) + 1
+        self.model_outputs = [self.model_outputs[1], latents.clone()]
+        self.lower_order_nums = min(self.lower_order_nums + 1, 2)
+        return latents + 1
+
+
+class FakePipe:
+    """Denoising loop shaped like WanPipeline.__call__"""
+    def __init__(self):
+        self.scheduler = FakeScheduler()
+
+    def __call__(self, num_inference_steps, latents=None, callback_on_step_end=None, stop_after=None):
+        self.scheduler.set_timesteps(num_inference_steps)
+        latents = torch.zeros(1, 4) if latents is None else latents
+        self.steps_run = 0
+        timesteps = self.scheduler.timesteps
+        for i, t in enumerate(timesteps):
+            if stop_after is not None and self.steps_run == stop_after:
+                raise RuntimeError("preempted")
+            latents = self.scheduler.step(latents)
+            self.steps_run += 1
+            if callback_on_step_end is not None:
+                callback_on_step_end(self, i, t, {"latents": latents})
+        return latents
+
+
+def test_resume_continues_from_last_checkpoint(tmp_path):
+    """A preempted run resumes at the last checkpoint with the scheduler history restored"""
+    signature = checkpoint_signature(prompt="fox", seed=1, steps=10)
+    pipe = FakePipe()
+    checkpointer = DenoiseCheckpointer("file-1", signature, total_steps=10, every_n_steps=3, directory=str(tmp_path))
+    with pytest.raises(RuntimeError):
+        pipe(10, callback_on_step_end=checkpointer, stop_after=7)
+    assert checkpointer.saves == 2
+    assert not os.path.exists(checkpointer.path + ".tmp")
+
+    resumed = DenoiseCheckpointer("file-1", signature, total_steps=10, every_n_steps=3, directory=str(tmp_path))
+    with resumed.resume(pipe) as latents:
+        assert resumed.start_step == 6
+        result = pipe(10, latents=latents, callback_on_step_end=resumed)
+    assert pipe.steps_run == 4
+    assert pipe.scheduler._step_index == 10
+    assert torch.equal(result, torch.full((1, 4), 10.0))
+    assert "set_timesteps" not in vars(pipe.scheduler) and "step" not in vars(pipe.scheduler)
+    assert len(pipe.scheduler.timesteps) == 10
+    assert resumed.stats()["resumed_from_step"] == 6
+
+    resumed.clear()
+    assert not os.path.exists(resumed.path)
+
+
+def test_mismatched_checkpoint_is_ignored(tmp_path):
+    pipe = FakePipe()
+    checkpointer = DenoiseCheckpointer("file-2", "a", total_steps=10, every_n_steps=2, directory=str(tmp_path))
+    pipe(10, callback_on_step_end=checkpointer)
+
+    other = DenoiseCheckpointer("file-2", "b", total_steps=10, every_n_steps=2, directory=str(tmp_path))
+    with other.resume(pipe) as latents:
+        assert latents is None
+    assert other.start_step == 0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test the persistent embedding store used to share prompt embeddings and VAE latents between workers
+"""
+
+import os
+import sys
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_store import EmbeddingStore
+
+
+def _sdxl_like_embeds(seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "prompt_embeds": rng.standard_normal((1, 77, 2048)).astype(np.float16),
+        "pooled_prompt_embeds": rng.standard_normal((1, 1280)).astype(np.float16),
+    }
+
+
+def _writer_process(root, index):
+    store = EmbeddingStore(root)
+    store.put(f"worker-{index}", _sdxl_like_embeds(index))
+
+
+def test_roundtrip_and_second_worker():
+    """An entry written by one worker is readable by a fresh instance on the same volume"""
+    print("🧪 Testing embedding store round-trip...")
+    with tempfile.TemporaryDirectory() as root:
+        embeds = _sdxl_like_embeds()
+        writer = EmbeddingStore(root)
+        key = writer.make_key("sdxl-base", "prompt_embeds", "a cat", None)
+        assert writer.put(key, embeds)
+
+        reader = EmbeddingStore(root)
+        cached = reader.get(key)
+        assert cached is not None
+        for name, array in embeds.items():
+            assert cached[name].dtype == array.dtype
+            assert np.array_equal(cached[name], array)
+            assert not cached[name].flags.writeable
+        assert reader.get("missing") is None
+        print(f"✅ Round-trip ok: {reader.stats()}")
+
+
+def test_newest_record_wins():
+    """Re-putting a key replaces the value seen by readers"""
+    with tempfile.TemporaryDirectory() as root:
+        store = EmbeddingStore(root)
+        store.put("k", {"x": np.zeros(4, dtype=np.float32)})
+        store.put("k", {"x": np.ones(4, dtype=np.float32)})
+        assert np.array_equal(EmbeddingStore(root).get("k")["x"], np.ones(4, dtype=np.float32))
+
+
+def test_compaction_evicts_least_recently_used():
+    """Exceeding the size cap compacts the log and drops the least recently used entries"""
+    print("🧪 Testing size cap and LRU eviction...")
+    with tempfile.TemporaryDirectory() as root:
+        record = {"x": np.zeros(64 * 1024, dtype=np.uint8)}
+        store = EmbeddingStore(root, max_bytes=6 * 70 * 1024)
+        for i in range(5):
+            store.put(f"entry-{i}", record)
+        # Touch the oldest entry so it survives eviction
+        assert store.get("entry-0") is not None
+        store.put("entry-5", record)
+        store.put("entry-6", record)
+
+        stats = store.stats()
+        assert stats["bytes"] <= store.max_bytes
+        assert store.get("entry-0") is not None
+        assert store.get("entry-6") is not None
+        assert store.get("entry-1") is None
+        print(f"✅ Compaction kept {stats['entries']} entries in {stats['bytes']} bytes")
+
+
+def test_reader_sees_compaction_by_other_worker():
+    """A reader holding an old mapping picks up a log swapped in by another worker"""
+    with tempfile.TemporaryDirectory() as root:
+        reader = EmbeddingStore(root)
+        writer = EmbeddingStore(root)
+        writer.put("a", {"x": np.arange(8, dtype=np.int32)})
+        old = reader.get("a")
+        writer.put("b", {"x": np.arange(4, dtype=np.int32)})
+        writer.compact()
+        assert np.array_equal(old["x"], np.arange(8, dtype=np.int32))
+        assert np.array_equal(reader.get("b")["x"], np.arange(4, dtype=np.int32))
+
+
+def test_partial_record_is_ignored():
+    """A record still being written (truncated tail) is not indexed"""
+    with tempfile.TemporaryDirectory() as root:
+        store = EmbeddingStore(root)
+        store.put("complete", {"x": np.ones(16, dtype=np.float32)})
+        with open(store.data_path, "ab") as data_file:
+            data_file.write(store._encode_record("partial", {"x": np.ones(1024, dtype=np.float32)})[:200])
+
+        reader = EmbeddingStore(root)
+        assert reader.get("complete") is not None
+        assert reader.get("partial") is None
+
+
+def test_concurrent_workers():
+    """Several processes appending at once never corrupt the log"""
+    print("🧪 Testing concurrent writers...")
+    with tempfile.TemporaryDirectory() as root:
+        processes = [multiprocessing.Process(target=_writer_process, args=(root, i)) for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        store = EmbeddingStore(root)
+        for i in range(4):
+            cached = store.get(f"worker-{i}")
+            assert cached is not None
+            assert np.array_equal(cached["prompt_embeds"], _sdxl_like_embeds(i)["prompt_embeds"])
+        print("✅ All concurrent writes readable")
+
+
+if __name__ == "__main__":
+    print("🚀 Embedding Store Tests")
+    print("=" * 50)
+    test_roundtrip_and_second_worker()
+    test_newest_record_wins()
+    test_compaction_evicts_least_recently_used()
+    test_reader_sees_compaction_by_other_worker()
+    test_partial_record_is_ignored()
+    test_concurrent_workers()
+    print("\n🎉 All embedding store tests passed!")
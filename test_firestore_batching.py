@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Test per-job Firestore write coalescing: updates to the same document merge, and a job's
+status writes go out as one batch per stage
+"""
+
+import os
+import sys
+import threading
+import types
+
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cloud_storage as cloud_storage_module
+from test_image_renditions import FakeBlob, FakeBucket
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def collection(self, name):
+        return FakeCollection(self.db, f"{self.path}/{name}")
+
+    def set(self, fields, merge=False, timeout=None):
+        self.db.round_trips += 1
+        self.db.apply(self.path, fields)
+
+    def get(self, timeout=None):
+        self.db.round_trips += 1
+        fields = self.db.documents.get(self.path)
+        return types.SimpleNamespace(exists=fields is not None, to_dict=lambda: dict(fields))
+
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def document(self, name):
+        return FakeDocument(self.db, f"{self.path}/{name}")
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, doc_ref, fields, merge=False):
+        self.writes.append((doc_ref.path, fields))
+
+    def commit(self, timeout=None):
+        self.db.round_trips += 1
+        if self.db.unavailable:
+            self.db.unavailable -= 1
+            raise ConnectionError("503 Service Unavailable")
+        for path, fields in self.writes:
+            self.db.apply(path, fields)
+
+
+class FakeFirestore:
+    """
+    Documents as nested dicts, with set(merge=True) semantics and a round-trip counter; the
+    next ``unavailable`` batch commits fail
+    """
+    def __init__(self):
+        self.documents = {}
+        self.round_trips = 0
+        self.unavailable = 0
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def document(self, path):
+        return FakeDocument(self, path)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def apply(self, path, fields):
+        cloud_storage_module._merge_fields(self.documents.setdefault(path, {}), fields)
+
+
+class ConcurrentBucket(FakeBucket):
+    """Uploads only complete once ``parties`` of them are in flight together; ``fail`` paths raise"""
+    def __init__(self, parties, fail=()):
+        super().__init__()
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.fail = set(fail)
+
+    def blob(self, path):
+        bucket = self
+        
+        class ConcurrentBlob(FakeBlob):
+            def upload_from_string(self, data, content_type=None, timeout=None, predefined_acl=None):
+                bucket.barrier.wait()
+                if self.path in bucket.fail:
+                    raise ConnectionError("upload reset")
+                super().upload_from_string(data, content_type)
+        
+        return ConcurrentBlob(self, path)
+
+
+def test_merge_fields_like_firestore():
+    merged = cloud_storage_module._merge_fields({"a": 1, "data": {"x": 1, "y": 1}}, {"data": {"y": 2}, "b": 3})
+    assert merged == {"a": 1, "data": {"x": 1, "y": 2}, "b": 3}
+
+
+def test_image_job_writes_one_batch(fake_cloud):
+    """Per-image ready marks and repeated main-document updates cost one round-trip"""
+    storage, db, _ = fake_cloud()
+    images = [Image.new("RGB", (64, 64), color) for color in ("red", "green", "blue")]
+
+    with storage.coalesce_writes() as writes:
+        urls = cloud_storage_module.save_and_upload_images_cloud(images, "job", "user-1", "file-1")
+        # What _process_generation_task writes afterwards with nearly the same data
+        storage.update_generation_status("user-1", "file-1", {"image_urls": urls, "seed": 7}, "images")
+        assert db.round_trips == 0
+
+    assert db.round_trips == 1
+    assert writes.stats() == {"writes": 5, "round_trips": 1, "batches": 1}
+    main = db.documents["generations/user-1/images/file-1"]
+    assert main["generation_data"]["image_count"] == 3 and main["generation_data"]["seed"] == 7
+    assert db.documents["generations/user-1/images/file-1_2"]["generated"] is True
+
+
+def test_image_uploads_run_concurrently(monkeypatch, fake_cloud):
+    """A job's images upload side by side, yet URLs keep input order and failures fall back"""
+    storage, db, _ = fake_cloud(ConcurrentBucket(3, fail={"generating/user-1/image/file-4_1.png"}))
+    # A retry would wait at the barrier alone; fail the upload on its first attempt
+    monkeypatch.setattr(storage.backend.retry, "max_retries", 0)
+    images = [Image.new("RGB", (64, 64), color) for color in ("red", "green", "blue")]
+
+    with storage.coalesce_writes() as writes:
+        urls = cloud_storage_module.save_and_upload_images_cloud(images, "job", "user-1", "file-4")
+
+    assert urls[0] == "https://storage.example/generating/user-1/image/file-4_0.png"
+    assert urls[1].startswith("data:image/png;base64,")
+    assert urls[2] == "https://storage.example/generating/user-1/image/file-4_2.png"
+    # Ready marks and the error write from pool threads still joined the job's batch
+    assert writes.stats()["round_trips"] == 1
+    assert db.documents["generations/user-1/images/file-4_1"]["generation_data"]["status"] == "failed"
+    assert db.documents["generations/user-1/images/file-4_2"]["generated"] is True
+    main = db.documents["generations/user-1/images/file-4"]["generation_data"]
+    assert len(main["image_upload_seconds"]) == 3
+
+
+def test_stage_boundaries_and_immediate_writes(fake_cloud):
+    """flush_writes commits a stage; live progress bypasses the queue but is counted"""
+    storage, db, _ = fake_cloud()
+
+    with storage.coalesce_writes() as writes:
+        storage.update_generation_status("user-1", "file-2", {"status": "processing"}, "videos")
+        assert storage.flush_writes()
+        storage.update_progress("user-1", "file-2", {"frames_done": 81}, "videos")
+        storage.mark_media_ready("user-1", "file-2", "videos")
+        storage.update_generation_status("user-1", "file-2", {"status": "completed"}, "videos")
+
+    assert writes.stats() == {"writes": 4, "round_trips": 3, "batches": 2}
+    document = db.documents["generations/user-1/videos/file-2"]
+    assert document["generation_data"]["status"] == "completed"
+    assert document["progress"] == {"frames_done": 81}
+
+    # Outside a job every write goes straight through
+    storage.mark_media_ready("user-1", "file-3", "videos")
+    assert db.round_trips == 4
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
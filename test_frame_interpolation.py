@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test CPU frame interpolation between decoded video frames
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import frame_interpolation
+from frame_interpolation import interpolate_frames, blend_frames, InterpolatedFrames
+
+
+def _clip(num_frames=5, height=32, width=48):
+    clip = np.zeros((num_frames, height, width, 3), dtype=np.uint8)
+    for i in range(num_frames):
+        clip[i, :, :, 0] = i * 40
+        clip[i, 8:16, 4 + i * 6:12 + i * 6, 1] = 255  # moving square
+    return clip
+
+
+def test_blend_frames_cross_fade():
+    a = np.zeros((2, 2, 3), dtype=np.uint8)
+    b = np.full((2, 2, 3), 90, dtype=np.uint8)
+    in_between = blend_frames(a, b, 3)
+    assert in_between.shape == (2, 2, 2, 3)
+    assert in_between[0, 0, 0, 0] == 30 and in_between[1, 0, 0, 0] == 60
+
+
+def test_interpolated_sequence_keeps_source_frames():
+    clip = _clip()
+    frames, fps = interpolate_frames(clip, factor=3, fps=15)
+    assert fps == 45
+    output = list(frames)
+    assert len(output) == len(frames) == 13
+    for i in range(len(clip)):
+        assert np.shares_memory(output[i * 3], clip)
+        assert np.array_equal(output[i * 3], clip[i])
+    assert output[1][0, 0, 0] == round(40 / 3)
+    assert frames.stats()["factor"] == 3
+
+    # The sequence can be consumed again (e.g. by the base64 fallback after a failed upload)
+    assert len(list(frames)) == 13
+
+
+def test_factor_one_and_limits():
+    clip = _clip()
+    frames, fps = interpolate_frames(clip, factor=1, fps=15)
+    assert fps == 15 and len(list(frames)) == len(clip)
+    assert InterpolatedFrames(clip, factor=10).factor == frame_interpolation.MAX_INTERPOLATION_FACTOR
+    with pytest.raises(ValueError):
+        InterpolatedFrames(clip, method="magic")
+
+
+def test_flow_method():
+    """Optical flow output has the right shape; without OpenCV it falls back to blending"""
+    clip = _clip()
+    frames, _ = interpolate_frames(clip, factor=2, method="flow")
+    output = list(frames)
+    assert len(output) == 9 and output[1].shape == clip[0].shape and output[1].dtype == np.uint8
+    assert frames.method == ("flow" if frame_interpolation.is_flow_available() else "blend")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
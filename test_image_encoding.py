@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test configurable output image encoding (PNG/JPEG/WebP/AVIF) and compression presets
+"""
+
+import os
+import sys
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from image_encoding import encode_image, encode_images, is_format_supported, resolve_encoding
+from schemas import INPUT_SCHEMA
+
+
+def _test_image(color=(200, 80, 40)):
+    image = Image.new("RGB", (256, 256), color=color)
+    for x in range(0, 256, 8):
+        image.putpixel((x, x), (x, 255 - x, 128))
+    return image
+
+
+def test_formats_roundtrip():
+    """Every supported format decodes back to an image of the same size"""
+    print("🧪 Testing output formats...")
+    for output_format, content_type in [("png", "image/png"), ("jpeg", "image/jpeg"),
+                                        ("webp", "image/webp"), ("avif", "image/avif")]:
+        if not is_format_supported(output_format):
+            print(f"   ⏭️ {output_format} not supported by this Pillow build")
+            continue
+        encoded = encode_image(_test_image(), output_format, quality=80)
+        assert encoded.content_type == content_type
+        decoded = Image.open(BytesIO(encoded.data))
+        assert decoded.size == (256, 256)
+        print(f"   ✅ {output_format}: {len(encoded.data)} bytes ({encoded.extension})")
+
+
+def test_default_is_png():
+    """Without request values or operator overrides, output stays PNG as before"""
+    encoded = encode_image(_test_image())
+    assert encoded.content_type == "image/png"
+    assert encoded.data.startswith(b"\x89PNG")
+
+
+def test_presets_and_aliases():
+    """Unknown presets fall back to balanced and 'jpg' is accepted as an alias"""
+    settings = resolve_encoding("jpg", None, "nonexistent")
+    assert settings["output_format"] == "jpeg"
+    assert settings["compression_preset"] == "balanced"
+
+    fast = encode_image(_test_image(), "png", compression_preset="fast")
+    small = encode_image(_test_image(), "png", compression_preset="small")
+    assert len(small.data) <= len(fast.data)
+
+
+def test_rgba_to_jpeg():
+    """Images with alpha are converted before JPEG encoding"""
+    encoded = encode_image(Image.new("RGBA", (64, 64), (0, 0, 255, 128)), "jpeg")
+    assert Image.open(BytesIO(encoded.data)).mode == "RGB"
+
+
+def test_parallel_encoding_preserves_order():
+    """encode_images returns results in input order"""
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
+    encoded = encode_images([Image.new("RGB", (32, 32), c) for c in colors], "png")
+    for color, result in zip(colors, encoded):
+        assert Image.open(BytesIO(result.data)).getpixel((0, 0)) == color
+
+
+def test_schema_constraints():
+    """Schema accepts the new encoding parameters and rejects invalid values"""
+    assert INPUT_SCHEMA['output_format']['constraints']('webp')
+    assert not INPUT_SCHEMA['output_format']['constraints']('gif')
+    assert INPUT_SCHEMA['output_quality']['constraints'](85)
+    assert not INPUT_SCHEMA['output_quality']['constraints'](0)
+    assert INPUT_SCHEMA['compression_preset']['constraints']('fast')
+
+
+if __name__ == "__main__":
+    print("🚀 Image Encoding Tests")
+    print("=" * 50)
+    test_formats_roundtrip()
+    test_default_is_png()
+    test_presets_and_aliases()
+    test_rgba_to_jpeg()
+    test_parallel_encoding_preserves_order()
+    test_schema_constraints()
+    print("\n🎉 All image encoding tests passed!")
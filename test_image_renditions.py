@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test preview/thumbnail renditions produced and uploaded alongside each full-size image
+"""
+
+import os
+import sys
+import base64
+import hashlib
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cloud_storage as cloud_storage_module
+from image_encoding import parse_renditions, make_rendition, RenditionSpec
+
+
+class FakeBlob:
+    def __init__(self, bucket, path):
+        self.bucket = bucket
+        self.path = path
+        self.public_url = f"https://storage.example/{path}"
+
+    @property
+    def md5_hash(self):
+        return base64.b64encode(hashlib.md5(self.bucket.objects[self.path][0]).digest()).decode()
+
+    def upload_from_string(self, data, content_type=None, timeout=None, predefined_acl=None):
+        self.bucket.objects[self.path] = (data, content_type)
+        self.bucket.acls[self.path] = predefined_acl
+
+    def make_public(self, timeout=None):
+        pass
+
+    def generate_signed_url(self, version=None, method="GET", expiration=None):
+        return f"{self.public_url}?X-Goog-Expires={int(expiration.total_seconds())}&X-Goog-Signature=fake"
+
+
+class FakeBucket:
+    """In-memory stand-in for a Firebase Storage bucket"""
+    def __init__(self):
+        self.objects = {}
+        self.acls = {}
+
+    def blob(self, path):
+        return FakeBlob(self, path)
+
+    def get_blob(self, path):
+        return FakeBlob(self, path) if path in self.objects else None
+
+
+def test_parse_renditions():
+    """Rendition lists parse into specs and malformed entries are skipped"""
+    specs = parse_renditions("preview:512:webp, thumb:128:JPEG,broken")
+    assert specs == [RenditionSpec("preview", 512, "webp"), RenditionSpec("thumb", 128, "jpeg")]
+    assert parse_renditions("") == []
+
+
+def test_make_rendition_keeps_aspect_ratio():
+    """Renditions are bounded by max edge and never upscaled"""
+    image = Image.new("RGB", (1024, 768), "red")
+    thumb = Image.open(BytesIO(make_rendition(image, RenditionSpec("thumb", 128, "png")).data))
+    assert thumb.size == (128, 96)
+    full = Image.open(BytesIO(make_rendition(image, RenditionSpec("full", 0, "png")).data))
+    assert full.size == (1024, 768)
+    assert image.size == (1024, 768)
+
+
+def test_renditions_uploaded_next_to_image(monkeypatch, fake_cloud):
+    """Each image gets its renditions uploaded under generating/{user_id}/image/ and recorded"""
+    print("🧪 Testing rendition uploads...")
+    recorded = []
+    _, _, bucket = fake_cloud(
+        mark_media_ready=lambda *args, **kwargs: True,
+        update_generation_status=lambda user_id, file_uid, data, media_type="videos":
+            recorded.append((file_uid, data)) or True,
+    )
+    monkeypatch.setenv("IMAGE_RENDITIONS", "preview:512:png,thumb:128:jpeg")
+
+    images = [Image.new("RGB", (1024, 1024), "blue"), Image.new("RGB", (1024, 1024), "green")]
+    urls = cloud_storage_module.save_and_upload_images_cloud(images, "job", "user-1", "file-1")
+
+    assert urls == [
+        "https://storage.example/generating/user-1/image/file-1_0.png",
+        "https://storage.example/generating/user-1/image/file-1_1.png",
+    ]
+    for index in range(2):
+        preview = Image.open(BytesIO(bucket.objects[f"generating/user-1/image/file-1_{index}_preview.png"][0]))
+        assert preview.size == (512, 512)
+        assert bucket.objects[f"generating/user-1/image/file-1_{index}_thumb.jpg"][1] == "image/jpeg"
+
+    file_uid, data = recorded[-1]
+    assert file_uid == "file-1"
+    assert data["image_renditions"][1]["thumb"].endswith("file-1_1_thumb.jpg")
+    print(f"✅ Uploaded {len(bucket.objects)} objects")
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
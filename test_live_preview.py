@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test live preview throttling, overhead budget and step numbering (no torch required)
+"""
+
+import os
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from live_preview import LivePreviewReporter
+
+
+def fake_decode(latents, latent_format, max_size):
+    return Image.new("RGB", (max_size, max_size), (10, 20, 30))
+
+
+def _run_steps(reporter, steps):
+    for step in range(steps):
+        assert reporter(None, step, None, {"latents": None}) == {"latents": None}
+    if reporter.in_flight is not None:
+        reporter.in_flight.result()
+
+
+def test_publishes_every_n_steps_with_global_step_numbers():
+    published = []
+    reporter = LivePreviewReporter(
+        publish=lambda data, step, total: published.append((step, total, data)),
+        every_n_steps=2, total_steps=10, max_overhead_pct=100, min_interval=0, max_size=32,
+        decode=fake_decode,
+    )
+    # Generous budget: the reporter starts "long ago"
+    reporter.started -= 100
+
+    for step in range(4):
+        reporter(None, step, None, {"latents": None})
+        if reporter.in_flight is not None:
+            reporter.in_flight.result()
+    reporter.next_stage()
+    for step in range(6):
+        reporter(None, step, None, {"latents": None})
+        if reporter.in_flight is not None:
+            reporter.in_flight.result()
+
+    assert [step for step, _, _ in published] == [2, 4, 6, 8, 10]
+    assert all(total == 10 for _, total, _ in published)
+    assert Image.open(BytesIO(published[0][2])).format == "JPEG"
+    assert reporter.stats()["previews_published"] == 5
+
+
+def test_min_interval_throttles_previews():
+    published = []
+    reporter = LivePreviewReporter(
+        publish=lambda data, step, total: published.append(step),
+        every_n_steps=1, max_overhead_pct=100, min_interval=60, decode=fake_decode,
+    )
+    reporter.started -= 100
+    _run_steps(reporter, 5)
+
+    assert published == [1]
+    assert reporter.stats()["previews_skipped"] == 4
+
+
+def test_overhead_budget_caps_preview_time():
+    def slow_decode(latents, latent_format, max_size):
+        time.sleep(0.05)
+        return fake_decode(latents, latent_format, max_size)
+
+    reporter = LivePreviewReporter(
+        publish=lambda data, step, total: None,
+        every_n_steps=1, max_overhead_pct=2.0, min_interval=0, decode=slow_decode,
+    )
+    for step in range(10):
+        reporter(None, step, None, {"latents": None})
+        time.sleep(0.01)
+        if reporter.in_flight is not None:
+            reporter.in_flight.result()
+
+    stats = reporter.stats()
+    # 50 ms decodes can't fit a 2% budget of ~0.1-0.6 s, beyond the first attempt at most
+    assert stats["previews_published"] <= 1
+    assert stats["previews_skipped"] >= 9
+
+
+def test_skips_while_previous_publish_in_flight_and_survives_errors():
+    def slow_publish(data, step, total):
+        time.sleep(0.2)
+        raise RuntimeError("storage unavailable")
+
+    reporter = LivePreviewReporter(
+        publish=slow_publish, every_n_steps=1, max_overhead_pct=100, min_interval=0, decode=fake_decode,
+    )
+    reporter.started -= 100
+    for step in range(3):
+        reporter(None, step, None, {"latents": None})
+    reporter.in_flight.result()
+
+    stats = reporter.stats()
+    assert stats["previews_skipped"] == 2
+    assert stats["previews_published"] == 0
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-v"]))
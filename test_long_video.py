@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test long-video window planning, overlap blending and tail conditioning (fake pipeline, CPU)
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import long_video
+from long_video import LongVideoGenerator, plan_windows, overlap_frames, crossfade
+
+
+class FakeScheduler:
+    def __init__(self, steps):
+        self.sigmas = torch.linspace(1.0, 0.0, steps + 1)
+        self.step_index = 0
+
+
+class FakeWanPipeline:
+    """Denoises towards a constant per window so windows are distinguishable"""
+
+    def __init__(self, steps=4):
+        self.steps = steps
+        self._execution_device = "cpu"
+        self.transformer = SimpleNamespace(config=SimpleNamespace(in_channels=4))
+        self.vae = None
+        self.calls = []
+
+    def __call__(self, latents, num_frames, callback_on_step_end=None, output_type=None, **kwargs):
+        self.scheduler = FakeScheduler(self.steps)
+        target = torch.full_like(latents, float(len(self.calls) + 1))
+        for step in range(self.steps):
+            self.scheduler.step_index = step + 1
+            sigma = self.scheduler.sigmas[step + 1]
+            latents = (1 - sigma) * target + sigma * latents
+            if callback_on_step_end is not None:
+                latents = callback_on_step_end(self, step, None, {"latents": latents})["latents"]
+        self.calls.append({"num_frames": num_frames, "latents": latents.clone()})
+        return SimpleNamespace(frames=latents)
+
+
+def fake_decode(vae, latents):
+    """One frame per latent frame boundary (1 + 4 * (T - 1)), value = mean latent of that frame"""
+    values = latents[0].mean(dim=(0, 2, 3))
+    frames = [values[0]] + [value for value in values[1:] for _ in range(4)]
+    return np.stack([np.full((8, 8, 3), float(value) * 10, dtype=np.uint8) for value in frames])
+
+
+def test_plan_windows():
+    overlap = overlap_frames(4)
+    assert overlap == 13
+    assert plan_windows(81) == [81]
+    windows = plan_windows(200)
+    assert all((frames - 1) % 4 == 0 for frames in windows)
+    assert sum(windows) - overlap * (len(windows) - 1) >= 200
+    assert sum(windows[:-1]) - overlap * (len(windows) - 2) < 200
+
+
+def test_crossfade_ramps_between_windows():
+    previous = np.zeros((3, 1, 1, 3), dtype=np.uint8)
+    current = np.full((3, 1, 1, 3), 100, dtype=np.uint8)
+    assert crossfade(previous, current)[:, 0, 0, 0].tolist() == [25, 50, 75]
+
+
+def test_long_video_streams_windows_with_tail_conditioning(monkeypatch):
+    monkeypatch.setattr(long_video, "decode_wan_latents", fake_decode)
+    pipe = FakeWanPipeline()
+    progress = []
+    generator = LongVideoGenerator(
+        pipe, prompt="a", negative_prompt="", num_frames=160, height=64, width=64,
+        guidance_scale=5.0, seed=1, on_window=lambda *args: progress.append(args),
+    )
+
+    frames = list(generator)
+    assert len(frames) == len(generator) == 160
+    assert [call["num_frames"] for call in pipe.calls] == generator.windows
+    assert [entry[0] for entry in progress] == list(range(len(generator.windows)))
+    assert progress[-1][2] == 160
+
+    # The second window starts from the first window's final tail latents
+    tail = pipe.calls[0]["latents"][:, :, -4:]
+    assert torch.allclose(pipe.calls[1]["latents"][:, :, :4], tail)
+    assert generator.window_bytes == 81 * 8 * 8 * 3
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-v"]))
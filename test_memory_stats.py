@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Test peak host memory measurement used for video jobs
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from memory_stats import PeakHostMemory
+
+
+def test_peak_includes_transient_allocation():
+    """A 200 MB buffer freed inside the block still shows up in the peak"""
+    with PeakHostMemory() as memory:
+        buffer = np.ones(200 * 1024 * 1024, dtype=np.uint8)
+        del buffer
+    assert memory.growth_mb >= 150
+    assert memory.peak_mb >= memory.start_kb / 1024 + 150
+
+
+def test_peak_is_frozen_after_block():
+    with PeakHostMemory() as memory:
+        pass
+    peak = memory.peak_mb
+    buffer = np.ones(100 * 1024 * 1024, dtype=np.uint8)
+    assert memory.peak_mb == peak
+    del buffer
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-v"]))
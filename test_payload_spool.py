@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test that base64 fallbacks stay out of Firestore: oversized data URIs are spilled to a
+secondary backend or the payload spool, and the spool keeps retrying until the upload lands
+"""
+
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cloud_storage as cloud_storage_module
+from payload_spool import PayloadSpool
+from storage_backends import MemoryStorageBackend, content_md5
+from test_image_renditions import FakeBlob, FakeBucket
+
+
+class OutageBucket(FakeBucket):
+    """Every upload fails while ``down``"""
+    def __init__(self):
+        super().__init__()
+        self.down = True
+
+    def blob(self, path):
+        bucket = self
+
+        class OutageBlob(FakeBlob):
+            def upload_from_string(self, data, content_type=None, timeout=None, predefined_acl=None):
+                if bucket.down:
+                    raise ConnectionError("storage unreachable")
+                super().upload_from_string(data, content_type)
+
+        return OutageBlob(self, path)
+
+
+def _unreachable(data, meta):
+    raise ConnectionError("storage unreachable")
+
+
+def _noise(size=64):
+    return Image.fromarray(np.random.default_rng(0).integers(0, 255, (size, size, 3), dtype=np.uint8))
+
+
+def _use_fakes(monkeypatch, fake_cloud, tmp_path):
+    storage, db, bucket = fake_cloud(OutageBucket(), spool_dir=str(tmp_path / "spool"), _spool=None,
+                                     spill_backend=None)
+    monkeypatch.setattr(storage.backend.retry, "max_retries", 0)
+    return storage, db, bucket
+
+
+def test_spool_retries_and_survives_restart(tmp_path):
+    delivered = []
+
+    spool = PayloadSpool(str(tmp_path), _unreachable, backoff=60)
+    spool.put("abc", b"payload", {"path": "x.png"})
+    spool.close()
+
+    reopened = PayloadSpool(str(tmp_path), lambda data, meta: delivered.append((data, meta)), backoff=0.01)
+    assert reopened.drain(5)
+    assert delivered == [(b"payload", {"path": "x.png"})]
+    assert os.listdir(reopened.directory) == []
+    reopened.close()
+
+
+def test_orphaned_spool_is_taken_over(tmp_path):
+    """Entries of a worker that was scaled down are delivered by the next worker to start"""
+    gone = PayloadSpool(str(tmp_path), _unreachable, backoff=60, worker_id="pod-a")
+    gone.put("abc", b"payload", {"path": "x.png"})
+    live = PayloadSpool(str(tmp_path), _unreachable, backoff=60, worker_id="pod-b")
+    live.put("def", b"other", {"path": "y.png"})
+    gone.close()
+
+    delivered = []
+    successor = PayloadSpool(str(tmp_path), lambda data, meta: delivered.append(meta), worker_id="pod-c")
+    assert successor.drain(5) and successor.stats()["adopted"] == 1
+    assert delivered == [{"path": "x.png"}]
+    assert not (tmp_path / "pod-a").exists() and live.pending() == 1
+    live.close()
+    successor.close()
+
+
+def test_permanent_failures_are_dead_lettered(tmp_path):
+    given_up = []
+
+    def rejected(data, meta):
+        raise ValueError("bucket does not exist")
+
+    spool = PayloadSpool(str(tmp_path / "rejected"), rejected, backoff=0.01,
+                         on_dead_letter=lambda meta, error: given_up.append((meta, str(error))))
+    spool.put("abc", b"payload", {"path": "x.png"})
+    assert spool.drain(5)
+    assert given_up == [({"path": "x.png"}, "bucket does not exist")]
+    assert sorted(os.listdir(spool.dead_directory)) == ["abc.bin", "abc.json"]
+    assert spool.stats()["dead_lettered"] == 1
+    spool.close()
+
+    # Transient failures give up after max_attempts
+    down = PayloadSpool(str(tmp_path / "down"), _unreachable, backoff=0.001, max_attempts=3)
+    down.put("abc", b"payload", {"path": "x.png"})
+    assert down.drain(5)
+    assert down.stats()["failures"] == 3 and down.stats()["dead_lettered"] == 1
+    down.close()
+
+
+def test_failed_upload_keeps_base64_out_of_firestore(monkeypatch, fake_cloud, tmp_path):
+    """The job still returns the data URI, the document gets a reference and later the URL"""
+    storage, db, bucket = _use_fakes(monkeypatch, fake_cloud, tmp_path)
+
+    urls = cloud_storage_module.save_and_upload_images_cloud([_noise()], "job", "user-1", "file-1")
+    assert urls[0].startswith("data:image/png;base64,")
+
+    document = db.documents["generations/user-1/images/file-1"]
+    key = content_md5(cloud_storage_module.base64.b64decode(urls[0].partition(",")[2]))
+    reference = f"spooled://generating/user-1/spilled/{key}.png"
+    assert document["generation_data"]["image_urls"] == [reference]
+    assert "base64" not in repr(db.documents)
+
+    # The same bytes spilled from a second document are delivered to both
+    data_uri = urls[0]
+    storage.update_generation_status("user-1", "file-2", {"image_url": data_uri}, "images")
+    assert storage._spool.pending() == 2
+
+    bucket.down = False
+    storage._spool.backoff = 0.01
+    assert storage._spool.drain(10)
+    url = f"https://storage.example/generating/user-1/spilled/{key}.png"
+    assert document["spilled_payloads"][key] == url
+    assert db.documents["generations/user-1/images/file-2"]["spilled_payloads"][key] == url
+    storage._spool.close()
+
+
+def test_spill_backend_and_small_payloads(monkeypatch, fake_cloud, tmp_path):
+    storage, db, _ = _use_fakes(monkeypatch, fake_cloud, tmp_path)
+    spill = MemoryStorageBackend()
+    monkeypatch.setattr(storage, "spill_backend", spill)
+    small = "data:text/plain;base64,aGk="
+    large = "data:image/png;base64," + cloud_storage_module.base64.b64encode(os.urandom(4096)).decode()
+
+    storage.update_generation_status("user-1", "file-2", {"image_url": large, "images": [large, small]}, "images")
+
+    data = db.documents["generations/user-1/images/file-2"]["generation_data"]
+    assert data["image_url"].startswith("memory://generating/user-1/spilled/")
+    assert data["images"] == [data["image_url"], small]
+    assert spill.stats()["objects"] == 1
+    assert storage._spool is None
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test the post-processing stage: hand-off returns immediately, in-flight jobs are bounded and
+the submitting thread's context follows each job
+"""
+
+import os
+import sys
+import threading
+from contextvars import ContextVar
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from postprocess import PostProcessStage
+
+JOB = ContextVar("JOB", default=None)
+
+
+def test_handoff_is_bounded():
+    """Submissions beyond max_in_flight wait until a running job finishes"""
+    stage = PostProcessStage(workers=2, max_in_flight=3)
+    release = threading.Event()
+    futures = [stage.submit(release.wait, 5) for _ in range(3)]
+    assert stage.stats()["in_flight"] == 3
+
+    blocked = threading.Thread(target=lambda: futures.append(stage.submit(lambda: "late")))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive(), "fourth hand-off should wait for a free slot"
+
+    release.set()
+    blocked.join(5)
+    assert futures[-1].result(5) == "late"
+    for future in futures:
+        future.result(5)
+    stats = stage.stats()
+    assert stats["completed"] == 4 and stats["in_flight"] == 0 and stats["peak_in_flight"] == 3
+
+
+def test_jobs_run_in_submitter_context():
+    stage = PostProcessStage(workers=1, max_in_flight=2)
+    JOB.set("job-1")
+    future = stage.submit(JOB.get)
+    JOB.set(None)
+    assert future.result(5) == "job-1"
+
+    failing = stage.submit(lambda: 1 / 0)
+    assert isinstance(failing.exception(5), ZeroDivisionError)
+    assert stage.stats()["failed"] == 1
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test chunked resumable uploads against a local stand-in for a GCS upload session that
+drops connections, fails requests and accepts chunks only partially
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cloud_storage as cloud_storage_module
+from resumable_upload import ResumableUpload, ResumableUploadError
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FaultySession:
+    """
+    Resumable upload session following the GCS protocol. ``faults`` is consumed one entry per
+    data request: "drop" raises before anything is stored, "503" stores nothing and fails,
+    "partial" stores half of the bytes and answers 308, None behaves normally.
+    """
+    def __init__(self, faults=()):
+        self.data = bytearray()
+        self.complete = False
+        self.faults = list(faults)
+        self.requests = 0
+
+    def _incomplete(self):
+        return FakeResponse(308, {"Range": f"bytes=0-{len(self.data) - 1}"} if self.data else {})
+
+    def put(self, url, data=b"", headers=None):
+        self.requests += 1
+        span, total = headers["Content-Range"][len("bytes "):].split("/")
+        if span == "*":  # status query, or finalize when everything has arrived
+            if total != "*" and int(total) == len(self.data):
+                self.complete = True
+                return FakeResponse(200)
+            return self._incomplete()
+
+        fault = self.faults.pop(0) if self.faults else None
+        if fault == "drop":
+            raise ConnectionError("connection reset by peer")
+        if fault == "503":
+            return FakeResponse(503)
+
+        start = int(span.split("-")[0])
+        assert start == len(self.data), "chunk must start at the committed offset"
+        self.data += data[:len(data) // 2] if fault == "partial" else data
+        if total != "*" and int(total) == len(self.data):
+            self.complete = True
+            return FakeResponse(200)
+        return self._incomplete()
+
+
+PAYLOAD = bytes(range(256)) * 400  # 102400 bytes
+
+
+def _upload(session, pieces=1, chunk_size=16384, max_retries=5):
+    upload = ResumableUpload("https://upload.example/session", session, chunk_size=chunk_size,
+                             max_retries=max_retries, backoff=0)
+    step = len(PAYLOAD) // pieces + 1
+    for start in range(0, len(PAYLOAD), step):
+        upload.write(PAYLOAD[start:start + step])
+    upload.finish()
+    return upload
+
+
+def test_upload_in_chunks():
+    session = FaultySession()
+    upload = _upload(session, pieces=7)
+    assert session.complete and bytes(session.data) == PAYLOAD
+    assert upload.chunks == 7  # 6 full 16 KiB chunks + the tail
+    assert upload.retries == 0
+
+
+def test_failed_chunks_retried_individually():
+    """Each fault costs one resend of the affected chunk, never a restart"""
+    session = FaultySession([None, "drop", None, "503", "partial", None, "drop"])
+    upload = _upload(session)
+    assert session.complete and bytes(session.data) == PAYLOAD
+    assert upload.retries == 3
+    assert upload.stats()["bytes"] == len(PAYLOAD)
+
+
+def test_gives_up_after_retries():
+    session = FaultySession(["503"] * 10)
+    with pytest.raises(ResumableUploadError):
+        _upload(session, max_retries=2)
+    assert not session.complete
+
+
+def test_video_streamed_during_encoding(monkeypatch):
+    """VideoUploadStream forwards encoder chunks to a resumable upload and keeps the bytes"""
+    session = FaultySession(["drop", None, "partial"])
+    blobs = []
+
+    class FakeBlob:
+        def __init__(self, name):
+            self.name = name
+            self.public_url = f"https://storage.example/{name}"
+            blobs.append(self)
+
+        def create_resumable_upload_session(self, content_type=None, size=None, predefined_acl=None):
+            self.predefined_acl = predefined_acl
+            return "https://upload.example/session"
+
+        def make_public(self, timeout=None):
+            self.public = True
+
+    bucket = types.SimpleNamespace(blob=FakeBlob, client=types.SimpleNamespace(_http=session))
+    storage = cloud_storage_module.cloud_storage
+    monkeypatch.setattr(storage, "storage_type", "firebase")
+    monkeypatch.setattr(storage, "storage_bucket", bucket)
+
+    stream = cloud_storage_module.VideoUploadStream("user-1", "file-1")
+    for start in range(0, len(PAYLOAD), 5000):
+        stream(PAYLOAD[start:start + 5000])
+    url = stream.finish()
+
+    assert url == "https://storage.example/generating/user-1/video/file-1.mp4"
+    # Made public by the session's ACL, without a make_public request
+    assert blobs[0].predefined_acl == "publicRead" and not hasattr(blobs[0], "public")
+    assert bytes(stream.buffer) == PAYLOAD
+    assert session.complete and bytes(session.data) == PAYLOAD
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
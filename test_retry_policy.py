@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test retries of uploads and status writes against fault-injecting stand-ins: only transient
+failures are retried, deadlines are respected, and a retried upload never sends the same
+object twice
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from retry_policy import RetryMetrics, RetryPolicy, is_transient, jittered_delay
+from storage_backends import FirebaseStorageBackend
+from test_firestore_batching import FakeDocument, FakeFirestore
+from test_image_renditions import FakeBlob, FakeBucket
+
+
+class ServiceUnavailable(Exception):
+    """Shaped like google.api_core.exceptions.ServiceUnavailable"""
+    code = 503
+
+
+class Forbidden(Exception):
+    code = 403
+
+
+class FaultyBucket(FakeBucket):
+    """
+    ``faults`` is consumed one entry per upload_from_string / make_public call: "lost" stores
+    the object and then times out (the response never arrives), "503" fails without storing,
+    "403" is a permanent error, None succeeds
+    """
+    def __init__(self, faults=()):
+        super().__init__()
+        self.faults = list(faults)
+        self.uploads = 0
+        self.public = set()
+
+    def blob(self, path):
+        bucket = self
+
+        class FaultyBlob(FakeBlob):
+            def upload_from_string(self, data, content_type=None, timeout=None, predefined_acl=None):
+                fault = bucket.faults.pop(0) if bucket.faults else None
+                if fault == "503":
+                    raise ServiceUnavailable("backend unavailable")
+                if fault == "403":
+                    raise Forbidden("permission denied")
+                bucket.uploads += 1
+                super().upload_from_string(data, content_type)
+                if fault == "lost":
+                    raise TimeoutError("read timed out")
+
+            def make_public(self, timeout=None):
+                fault = bucket.faults.pop(0) if bucket.faults else None
+                if fault == "503":
+                    raise ServiceUnavailable("backend unavailable")
+                bucket.public.add(self.path)
+
+        return FaultyBlob(self, path)
+
+
+def _backend(bucket, **kwargs):
+    kwargs.setdefault("backoff", 0)
+    # make_public is a second request that can fail on its own
+    kwargs.setdefault("url_strategy", "make_public")
+    return FirebaseStorageBackend(bucket, **kwargs)
+
+
+def test_transient_errors():
+    assert is_transient(ConnectionResetError()) and is_transient(TimeoutError())
+    assert is_transient(ServiceUnavailable()) and not is_transient(Forbidden())
+    throttled = Exception()
+    throttled.response = {"ResponseMetadata": {"HTTPStatusCode": 429}}
+    assert is_transient(throttled)
+    assert not is_transient(ValueError("bad request"))
+
+
+def test_backoff_is_jittered_and_capped():
+    delays = [jittered_delay(0.5, 4, max_delay=2.0) for _ in range(200)]
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert len(set(delays)) > 100
+
+
+def test_lost_response_is_not_uploaded_twice():
+    """The object arrived but the response was lost: the retry only finishes the upload"""
+    bucket = FaultyBucket(["lost"])
+    backend = _backend(bucket)
+    url = backend.upload("generating/u/image/f.png", b"png bytes", "image/png")
+    assert url == "https://storage.example/generating/u/image/f.png"
+    assert bucket.uploads == 1
+    assert "generating/u/image/f.png" in bucket.public
+    assert backend.stats()["retries"] == 1 and backend.stats()["resumed"] == 1
+
+
+def test_transient_failures_retried_permanent_not():
+    bucket = FaultyBucket(["503", None, "503"])  # upload fails, then make_public fails once
+    backend = _backend(bucket)
+    backend.upload("a.png", b"a", "image/png")
+    assert bucket.uploads == 1 and backend.stats()["retries"] == 2
+
+    bucket = FaultyBucket(["403"])
+    backend = _backend(bucket)
+    with pytest.raises(Forbidden):
+        backend.upload("b.png", b"b", "image/png")
+    assert backend.stats()["retries"] == 0 and backend.stats()["failures"] == 1
+
+
+def test_deadline_stops_retries():
+    metrics = RetryMetrics()
+    slept = []
+    policy = RetryPolicy("op", max_retries=10, base_delay=4.0, max_delay=4.0, deadline=3.0,
+                         metrics=metrics, sleep=slept.append, clock=lambda: sum(slept))
+
+    def always_unavailable(attempt, remaining):
+        assert remaining is not None and remaining <= 3.0
+        raise ServiceUnavailable()
+
+    with pytest.raises(ServiceUnavailable):
+        policy.call(always_unavailable)
+    counters = metrics.snapshot()["op"]
+    assert counters["gave_up"] == 1 and counters["attempts"] == len(slept) + 1
+    # Delays are drawn from [0, 4]; the policy stops before one would cross 3s
+    assert sum(slept) < 3.0
+
+
+def test_status_write_retried(monkeypatch, fake_cloud):
+    """A transiently failing Firestore write is retried and counted"""
+    failures = ["503"]
+
+    class FlakyDocument(FakeDocument):
+        def set(self, fields, merge=False, timeout=None):
+            if failures:
+                failures.pop()
+                raise ServiceUnavailable("backend unavailable")
+            super().set(fields, merge, timeout)
+
+    db = FakeFirestore()
+    storage, _, _ = fake_cloud(db=db, _document=lambda user_id, media_type, file_uid:
+                               FlakyDocument(db, f"generations/{user_id}/{media_type}/{file_uid}"))
+    monkeypatch.setattr(storage.status_retry, "base_delay", 0)
+    before = storage.status_retry.metrics.snapshot().get("firestore_write", {}).get("retries", 0)
+
+    assert storage.mark_media_ready("u", "f", "images")
+    assert db.documents["generations/u/images/f"]["generated"] is True
+    assert storage.status_retry.metrics.snapshot()["firestore_write"]["retries"] == before + 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Test the write-behind status journal: superseded updates collapse, delivery is retried until
+Firestore accepts it, and queued updates survive a restart
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from status_journal import StatusJournal
+from test_firestore_batching import FakeFirestore
+
+SERVER_TIMESTAMP = object()
+
+
+class FlakyDelivery:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def __call__(self, updates):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("deadline exceeded")
+        self.batches.append(updates)
+
+
+def test_updates_collapse_and_retry(tmp_path):
+    """Updates to one document merge into a single write, delivered after transient failures"""
+    delivery = FlakyDelivery(failures=2)
+    journal = StatusJournal(str(tmp_path / "journal.sqlite"), delivery,
+                            sentinels={"SERVER_TIMESTAMP": SERVER_TIMESTAMP}, backoff=0.01)
+    journal.append_many([
+        ("generations/u/images/f", {"status": "processing", "generation_data": {"seed": 1}}),
+        ("generations/u/images/f", {"status": "completed", "generation_data": {"image_count": 2},
+                                    "completed_at": SERVER_TIMESTAMP}),
+    ])
+    assert journal.drain(5)
+
+    delivered = [update for batch in delivery.batches for update in batch]
+    assert delivered == [("generations/u/images/f", {
+        "status": "completed",
+        "generation_data": {"seed": 1, "image_count": 2},
+        "completed_at": SERVER_TIMESTAMP,
+    })]
+    stats = journal.stats()
+    assert stats["failures"] == 2 and stats["collapsed"] == 1 and stats["pending"] == 0
+    journal.close()
+
+
+def test_pending_updates_survive_restart(tmp_path):
+    path = str(tmp_path / "journal.sqlite")
+    down = FlakyDelivery(failures=1000)
+    journal = StatusJournal(path, down, backoff=60)
+    journal.append("generations/u/videos/f", {"status": "completed"})
+    journal.close()
+
+    delivery = FlakyDelivery()
+    reopened = StatusJournal(path, delivery)
+    assert reopened.drain(5)
+    assert delivery.batches == [[("generations/u/videos/f", {"status": "completed"})]]
+    reopened.close()
+
+
+class RejectingDelivery(FlakyDelivery):
+    """Rejects any batch containing a path in ``rejected``, like an invalid document write"""
+    def __init__(self, rejected, failures=0):
+        super().__init__(failures)
+        self.rejected = set(rejected)
+
+    def __call__(self, updates):
+        if any(path in self.rejected for path, _ in updates):
+            raise ValueError("invalid document")
+        super().__call__(updates)
+
+
+def test_rejected_update_is_isolated_and_dead_lettered(tmp_path):
+    """A permanently rejected update does not hold back the rest of its batch"""
+    delivery = RejectingDelivery({"generations/u/images/bad"})
+    journal = StatusJournal(str(tmp_path / "journal.sqlite"), delivery, backoff=0.01)
+    journal.append_many([(f"generations/u/images/{name}", {"status": "completed"})
+                         for name in ("a", "bad", "b")])
+    assert journal.drain(5)
+
+    delivered = [path for batch in delivery.batches for path, _ in batch]
+    assert delivered == ["generations/u/images/a", "generations/u/images/b"]
+    stats = journal.stats()
+    assert stats["dead_letters"] == 1 and stats["pending"] == 0
+
+    delivery.rejected.clear()
+    assert journal.requeue_dead_letters() == 1
+    assert journal.drain(5)
+    assert delivery.batches[-1] == [("generations/u/images/bad", {"status": "completed"})]
+    assert journal.stats()["dead_letters"] == 0
+    journal.close()
+
+
+def test_transient_failures_give_up_after_max_attempts(tmp_path):
+    delivery = FlakyDelivery(failures=1000)
+    journal = StatusJournal(str(tmp_path / "journal.sqlite"), delivery, backoff=0.001, max_attempts=3)
+    journal.append("generations/u/videos/f", {"status": "completed"})
+    assert journal.drain(5)
+    stats = journal.stats()
+    assert stats["failures"] == 3 and stats["dead_letters"] == 1 and delivery.batches == []
+    journal.close()
+
+
+def test_orphaned_journal_is_taken_over(tmp_path):
+    """A worker that is scaled down leaves its journal behind; the next one to start delivers it"""
+    gone = StatusJournal(str(tmp_path / "pod-a.sqlite"), FlakyDelivery(failures=1000), backoff=60)
+    gone.append("generations/u/images/f", {"status": "completed"})
+    live = StatusJournal(str(tmp_path / "pod-b.sqlite"), FlakyDelivery(failures=1000), backoff=60)
+    gone.close()
+
+    delivery = FlakyDelivery()
+    # pod-b still holds its lock, so only pod-a's journal is taken over
+    successor = StatusJournal(str(tmp_path / "pod-c.sqlite"), delivery)
+    assert successor.drain(5) and successor.stats()["adopted"] == 1
+    assert delivery.batches == [[("generations/u/images/f", {"status": "completed"})]]
+    assert not (tmp_path / "pod-a.sqlite").exists() and (tmp_path / "pod-b.sqlite").exists()
+    live.close()
+    successor.close()
+
+
+def test_deliver_now_skips_backoff(tmp_path):
+    delivery = FlakyDelivery(failures=1)
+    journal = StatusJournal(str(tmp_path / "journal.sqlite"), delivery, backoff=60)
+    journal.append("generations/u/videos/f", {"status": "failed"})
+    assert not journal.drain(0.2)
+    assert journal.deliver_now("generations/u/videos/f") and journal.pending() == 0
+    assert delivery.batches == [[("generations/u/videos/f", {"status": "failed"})]]
+    journal.close()
+
+
+def test_job_status_does_not_wait_for_firestore(fake_cloud, tmp_path, capsys):
+    """While Firestore is failing, the job's status writes are journaled and arrive later"""
+    db = FakeFirestore()
+    db.unavailable = 2
+    storage, _, _ = fake_cloud(db=db, journal_path=str(tmp_path / "journal.sqlite"))
+
+    with storage.coalesce_writes():
+        assert storage.update_generation_status("u", "f", {"status": "processing"}, "images")
+        assert storage.flush_writes()
+    assert storage.update_generation_status("u", "f", {"status": "completed"}, "images")
+    assert "📒 Queued Firestore update (journaled): generations/u/images/f" in capsys.readouterr().out
+
+    assert storage.drain_journal(5)
+    assert db.documents["generations/u/images/f"]["generation_data"]["status"] == "completed"
+    assert storage.journal_stats()["failures"] == 2
+    storage._journal.close()
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Test the storage backends: filesystem, S3 (against a stub client) and the in-memory fake,
+their shared retry / concurrency policy, and routing of the worker's uploads through them
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cloud_storage as cloud_storage_module
+from storage_backends import (
+    FirebaseStorageBackend, LocalStorageBackend, MemoryStorageBackend, S3StorageBackend, S3_MIN_PART_SIZE,
+    create_storage_backend,
+)
+from test_image_renditions import FakeBlob, FakeBucket
+
+
+class StubS3Client:
+    """The slice of the boto3 S3 client the backend uses"""
+    def __init__(self):
+        self.objects = {}
+        self.multipart = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[(Bucket, Key)] = Body
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.example/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        self.multipart[Key] = {}
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.multipart[Key][PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.multipart.pop(Key)
+        self.objects[(Bucket, Key)] = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.multipart.pop(Key, None)
+
+
+def test_filesystem_backend(tmp_path):
+    backend = LocalStorageBackend(root=str(tmp_path))
+    url = backend.upload("generating/user-1/image/a.png", b"png", "image/png")
+    assert url == f"file://{tmp_path}/generating/user-1/image/a.png"
+    assert (tmp_path / "generating/user-1/image/a.png").read_bytes() == b"png"
+
+    upload = backend.open_upload("generating/user-1/video/b.mp4", "video/mp4")
+    for piece in (b"a" * 10, b"b" * 10):
+        upload.write(piece)
+    assert not (tmp_path / "generating/user-1/video/b.mp4").exists()
+    backend.complete_upload(upload)
+    assert (tmp_path / "generating/user-1/video/b.mp4").read_bytes() == b"a" * 10 + b"b" * 10
+    assert not list(tmp_path.rglob("*.part"))
+    assert backend.stats()["objects"] == 2
+
+
+def test_s3_backend_put_and_multipart():
+    client = StubS3Client()
+    backend = S3StorageBackend("outputs", client=client)
+    url = backend.upload("job/0.png", b"png", "image/png")
+    assert url.startswith("https://s3.example/outputs/job/0.png?expires=")
+
+    data = os.urandom(S3_MIN_PART_SIZE * 2 + 100)
+    upload = backend.open_upload("job/video.mp4", "video/mp4", chunk_size=S3_MIN_PART_SIZE)
+    for start in range(0, len(data), 1 << 20):
+        upload.write(data[start:start + (1 << 20)])
+    assert len(upload.parts) == 2  # full parts go out while writing
+    assert backend.complete_upload(upload) == "https://s3.example/outputs/job/video.mp4?expires=604800"
+    assert client.objects[("outputs", "job/video.mp4")] == data
+
+    public = S3StorageBackend("outputs", client=client, public_base_url="https://cdn.example/")
+    assert public.upload("job/1.png", b"png", "image/png") == "https://cdn.example/job/1.png"
+
+
+def test_s3_monthly_bucket_follows_the_calendar(monkeypatch):
+    """Without BUCKET_NAME, a long-lived backend writes to the current month's bucket"""
+    import storage_backends
+    client = StubS3Client()
+    monkeypatch.delenv("BUCKET_NAME", raising=False)
+    backend = S3StorageBackend.from_env(client=client)
+    month = ["05-26"]
+    monkeypatch.setattr(storage_backends.time, "strftime", lambda fmt: month[0])
+
+    backend.upload("job/0.png", b"may", "image/png")
+    month[0] = "06-26"
+    assert backend.upload("job/1.png", b"june", "image/png").startswith("https://s3.example/06-26/job/1.png")
+    assert set(client.objects) == {("05-26", "job/0.png"), ("06-26", "job/1.png")}
+
+
+def test_firebase_url_strategies():
+    """Only make_public costs a request after the upload; latency is recorded per strategy"""
+    calls = []
+
+    class CountingBucket(FakeBucket):
+        def blob(self, path):
+            class CountingBlob(FakeBlob):
+                def make_public(self, timeout=None):
+                    calls.append(path)
+            return CountingBlob(self, path)
+
+    urls = {}
+    for strategy in ("predefined_acl", "bucket_public", "signed", "make_public"):
+        bucket = CountingBucket()
+        backend = FirebaseStorageBackend(bucket, url_strategy=strategy, signed_url_expiry=3600)
+        urls[strategy] = backend.upload(f"{strategy}.png", b"png", "image/png")
+        assert bucket.acls[f"{strategy}.png"] == ("publicRead" if strategy == "predefined_acl" else None)
+        stats = backend.stats()
+        assert stats["url_strategy"] == strategy and stats["upload_ms_p50"] is not None
+
+    assert calls == ["make_public.png"]
+    assert urls["bucket_public"] == "https://storage.example/bucket_public.png"
+    assert urls["signed"].startswith("https://storage.example/signed.png?X-Goog-Expires=3600&")
+    with pytest.raises(ValueError):
+        FirebaseStorageBackend(FakeBucket(), url_strategy="public")
+
+
+def test_retries_and_concurrency_limit():
+    """Failed puts are retried; never more than max_concurrency uploads run at once"""
+    class CountingBackend(MemoryStorageBackend):
+        active = peak = 0
+        guard = threading.Lock()
+
+        def _put(self, path, data, content_type, timeout=None):
+            with self.guard:
+                CountingBackend.active += 1
+                CountingBackend.peak = max(CountingBackend.peak, CountingBackend.active)
+            try:
+                return super()._put(path, data, content_type, timeout)
+            finally:
+                with self.guard:
+                    CountingBackend.active -= 1
+
+    backend = CountingBackend(latency=0.02, failure_rate=0.3, max_concurrency=3, max_retries=10, backoff=0)
+    threads = [threading.Thread(target=backend.upload, args=(f"o/{i}", b"x", "image/png")) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = backend.stats()
+    assert len(backend.store) == 12 and stats["objects"] == 12
+    assert stats["retries"] > 0 and stats["failures"] == 0
+    assert CountingBackend.peak == 3
+
+    failing = MemoryStorageBackend(failure_rate=1.0, max_retries=1, backoff=0)
+    with pytest.raises(ConnectionError):
+        failing.upload("o/x", b"x", "image/png")
+    assert failing.stats()["failures"] == 1
+
+
+def test_worker_uploads_use_configured_backend(monkeypatch):
+    """Images and streamed videos go to whichever backend the manager holds"""
+    storage = cloud_storage_module.cloud_storage
+    backend = create_storage_backend("memory")
+    monkeypatch.setattr(storage, "backend", backend)
+    monkeypatch.setenv("IMAGE_RENDITIONS", "")
+
+    url = storage.upload_file(b"png", "", "image/png", "user-1", "file-1")
+    assert url == "memory://generating/user-1/image/file-1.png"
+
+    stream = cloud_storage_module.VideoUploadStream("user-1", "file-2")
+    stream(b"mp4 ")
+    stream(b"bytes")
+    assert stream.finish() == "memory://generating/user-1/video/file-2.mp4"
+    assert backend.store["generating/user-1/video/file-2.mp4"] == (b"mp4 bytes", "video/mp4")
+
+
+def test_jobs_complete_without_firebase(monkeypatch):
+    """With a non-Firebase backend and no Firebase SDK loaded, image and video jobs (and their
+    error paths) build status payloads without touching Firestore"""
+    storage = cloud_storage_module.cloud_storage
+    backend = create_storage_backend("memory")
+    monkeypatch.setattr(storage, "storage_type", "memory")
+    monkeypatch.setattr(storage, "backend", backend)
+    monkeypatch.setattr(storage, "firestore_db", None)
+    monkeypatch.setattr(cloud_storage_module, "firestore", None)
+    monkeypatch.setenv("IMAGE_RENDITIONS", "")
+    image = Image.new("RGB", (8, 8))
+
+    urls = cloud_storage_module.save_and_upload_images_cloud([image], "job", "user-1", "file-1")
+    assert urls == ["memory://generating/user-1/image/file-1.png"]
+    url = cloud_storage_module.save_and_upload_video_cloud([], "job", "user-1", "file-2", video_bytes=b"mp4")
+    assert url == "memory://generating/user-1/video/file-2.mp4"
+
+    monkeypatch.setattr(storage, "backend", MemoryStorageBackend(failure_rate=1.0, max_retries=0))
+    urls = cloud_storage_module.save_and_upload_images_cloud([image], "job", "user-1", "file-3")
+    assert urls[0].startswith("data:image/png;base64,")
+    url = cloud_storage_module.save_and_upload_video_cloud([], "job", "user-1", "file-4", video_bytes=b"mp4")
+    assert url == "data:video/mp4;base64,bXA0"
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
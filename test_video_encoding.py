@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test in-memory MP4 encoding used by the video output paths
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from video_encoding import (
+    encode_video, encode_video_output, frame_to_uint8, resolve_video_encoding, is_codec_supported,
+    StreamingVideoEncoder, VIDEO_PROFILES,
+)
+
+
+def _float_frames(num_frames=9, width=96, height=64):
+    """Float frames in [0, 1], the format Wan returns"""
+    frames = []
+    for i in range(num_frames):
+        frame = np.zeros((height, width, 3), dtype=np.float32)
+        frame[:, :, 0] = i / num_frames
+        frame[:, :, 1] = np.linspace(0, 1, width)[None, :]
+        frames.append(frame)
+    return frames
+
+
+def _read_frames(video_bytes):
+    import imageio.v2 as imageio
+    with tempfile.NamedTemporaryFile(suffix=".mp4") as temp_file:
+        temp_file.write(video_bytes)
+        temp_file.flush()
+        reader = imageio.get_reader(temp_file.name)
+        frames = [frame for frame in reader]
+        reader.close()
+    return frames
+
+
+def test_frame_conversion():
+    """Float, uint8 and PIL frames all become contiguous HxWx3 uint8"""
+    assert frame_to_uint8(np.ones((4, 4, 3), dtype=np.float32)).max() == 255
+    assert frame_to_uint8(np.full((4, 4, 3), 7, dtype=np.uint8)).max() == 7
+    assert frame_to_uint8(Image.new("RGB", (4, 4), (1, 2, 3)))[0, 0].tolist() == [1, 2, 3]
+    assert frame_to_uint8(np.zeros((4, 4), dtype=np.uint8)).shape == (4, 4, 3)
+
+    # Frames of a decoded (T, H, W, 3) uint8 clip are passed through without copying
+    clip = np.zeros((3, 4, 4, 3), dtype=np.uint8)
+    assert np.shares_memory(frame_to_uint8(clip[1]), clip)
+
+
+def test_encode_video_in_memory():
+    """Encoded bytes are a playable MP4 with every frame"""
+    print("🧪 Testing in-memory video encoding...")
+    frames = _float_frames()
+    video_bytes = encode_video(frames, fps=15)
+    assert video_bytes[4:8] == b"ftyp"
+    # Movie header comes before media data so playback can start immediately
+    assert video_bytes.find(b"moov") < video_bytes.find(b"mdat")
+
+    decoded = _read_frames(video_bytes)
+    assert len(decoded) == len(frames)
+    assert decoded[0].shape == (64, 96, 3)
+    print(f"✅ {len(frames)} frames -> {len(video_bytes)} bytes")
+
+
+def test_odd_dimensions_and_pil_frames():
+    """PIL frames with odd sizes are padded to even dimensions for yuv420p"""
+    frames = [Image.new("RGB", (33, 17), color) for color in ["red", "green", "blue", "yellow", "purple"]]
+    decoded = _read_frames(encode_video(frames, fps=5))
+    assert len(decoded) == 5
+    assert decoded[0].shape[:2] == (18, 34)
+
+
+def test_streaming_encoder_chunks_and_generators():
+    """Frames from a generator stream through; on_chunk receives the whole file incrementally"""
+    chunks = []
+    frames = (frame for frame in _float_frames(num_frames=12))
+    assert encode_video(frames, fps=12, on_chunk=chunks.append) == b""
+
+    video_bytes = b"".join(chunks)
+    assert video_bytes[4:8] == b"ftyp"
+    assert len(_read_frames(video_bytes)) == 12
+
+
+def test_streaming_encoder_rejects_mismatched_frames():
+    """A frame of a different size aborts the encode instead of producing a corrupt file"""
+    frames = _float_frames(num_frames=2)
+    try:
+        with StreamingVideoEncoder(fps=15) as encoder:
+            encoder.write(frames[0])
+            encoder.write(np.zeros((10, 10, 3), dtype=np.uint8))
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    assert encoder.frames_written == 1
+
+
+def test_encoder_profiles():
+    """Every profile produces a playable MP4; the preview profile is the smallest"""
+    frames = _float_frames(num_frames=16, width=128, height=96)
+    sizes = {}
+    for profile in VIDEO_PROFILES:
+        encoded = encode_video_output(frames, fps=15, profile=profile)
+        assert encoded.profile == profile and encoded.codec == "h264"
+        assert encoded.frames == 16 and encoded.seconds > 0
+        assert len(_read_frames(encoded.data)) == 16
+        sizes[profile] = len(encoded.data)
+    assert sizes["fast-preview"] <= sizes["archive"]
+
+
+def test_faststart_muxing_and_codec_fallback():
+    """faststart writes a regular (non-fragmented) MP4 with moov first; unknown codecs fall back"""
+    frames = _float_frames()
+    encoded = encode_video_output(frames, fps=15, muxing="faststart")
+    assert encoded.muxing == "faststart"
+    assert encoded.data.find(b"moov") < encoded.data.find(b"mdat")
+    assert b"moof" not in encoded.data
+    assert len(_read_frames(encoded.data)) == len(frames)
+
+    assert resolve_video_encoding(codec="mpeg1", profile="nope")["codec"] == "h264"
+    assert resolve_video_encoding(profile="nope")["profile"] == "balanced"
+    if is_codec_supported("h265"):
+        encoded = encode_video_output(frames, fps=15, codec="h265", profile="fast-preview")
+        assert encoded.codec == "h265" and encoded.data[4:8] == b"ftyp"
+
+
+if __name__ == "__main__":
+    print("🚀 Video Encoding Tests")
+    print("=" * 50)
+    test_frame_conversion()
+    test_encode_video_in_memory()
+    test_odd_dimensions_and_pil_frames()
+    test_streaming_encoder_chunks_and_generators()
+    test_streaming_encoder_rejects_mismatched_frames()
+    test_encoder_profiles()
+    test_faststart_muxing_and_codec_fallback()
+    print("\n🎉 All video encoding tests passed!")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test the poster / animated previews built while a video's frames stream to the encoder
+"""
+
+import os
+import sys
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cloud_storage as cloud_storage_module
+from video_previews import VideoPreviewTap
+
+
+def _clip(num_frames=32, width=640, height=384):
+    clip = np.zeros((num_frames, height, width, 3), dtype=np.uint8)
+    for i in range(num_frames):
+        clip[i, :, :, 0] = i * 8
+    return clip
+
+
+def test_tap_passes_frames_through():
+    """Frames reach the consumer unchanged and in order"""
+    clip = _clip()
+    tap = VideoPreviewTap(clip, fps=16)
+    assert len(tap) == len(clip)
+    for original, passed in zip(clip, tap):
+        assert np.array_equal(passed, original)
+
+
+def test_poster_and_animated_webp():
+    """The poster is the middle frame as JPEG; the animation is a downscaled looping WebP"""
+    clip = _clip()
+    tap = VideoPreviewTap(clip, fps=16, max_size=160, preview_fps=8)
+    list(tap)
+    previews = tap.results()
+
+    poster = Image.open(BytesIO(previews["poster"].data))
+    assert previews["poster"].content_type == "image/jpeg"
+    assert poster.size == (640, 384)
+    assert abs(int(np.asarray(poster)[..., 0].mean()) - 16 * 8) <= 2
+
+    animated = Image.open(BytesIO(previews["animated"].data))
+    assert previews["animated"].content_type == "image/webp"
+    assert animated.size == (160, 96)
+    assert animated.n_frames == 16
+
+
+def test_gif_format():
+    """VIDEO_PREVIEW_FORMAT=gif produces an animated GIF"""
+    tap = VideoPreviewTap(_clip(8), fps=8, output_format="gif")
+    list(tap)
+    animated = tap.results()["animated"]
+    assert animated.content_type == "image/gif"
+    assert Image.open(BytesIO(animated.data)).n_frames == 8
+
+
+def test_previews_uploaded_next_to_video(fake_cloud):
+    """Previews upload to generating/{user_id}/video/ and their URLs are recorded"""
+    print("🧪 Testing video preview uploads...")
+    recorded = []
+    _, _, bucket = fake_cloud(
+        mark_media_ready=lambda *args, **kwargs: True,
+        update_generation_status=lambda user_id, file_uid, data, media_type="videos": recorded.append(data) or True,
+    )
+
+    tap = VideoPreviewTap(_clip(16), fps=8)
+    list(tap)
+    url = cloud_storage_module.save_and_upload_video_cloud(
+        [], "job", "user-1", "file-1", fps=8, video_bytes=b"mp4", previews=tap.results()
+    )
+
+    assert url == "https://storage.example/generating/user-1/video/file-1.mp4"
+    assert bucket.objects["generating/user-1/video/file-1_poster.jpg"][1] == "image/jpeg"
+    assert bucket.objects["generating/user-1/video/file-1_animated.webp"][1] == "image/webp"
+    assert recorded[-1]["video_previews"]["animated"].endswith("file-1_animated.webp")
+    print(f"✅ Uploaded {len(bucket.objects)} objects")
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
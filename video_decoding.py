@@ -0,0 +1,195 @@
+"""
+Wan Video Decoding for SDXL Worker
+Decodes Wan latents with the pipeline's VAE straight into one contiguous uint8 frame buffer,
+optionally a few latent frames and one spatial tile at a time to bound GPU memory
+"""
+
+import os
+import inspect
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+
+# Latent frames decoded before flushing to the host buffer (0 = decode the whole clip at once)
+DEFAULT_CHUNK_FRAMES = int(os.environ.get("WAN_VAE_CHUNK_FRAMES", "4"))
+# Spatial tile edge in latent pixels (8 output pixels each; 0 = no tiling) and tile overlap
+DEFAULT_TILE_SIZE = int(os.environ.get("WAN_VAE_TILE_SIZE", "0"))
+DEFAULT_TILE_OVERLAP = int(os.environ.get("WAN_VAE_TILE_OVERLAP", "8"))
+# Settings retried with when a decode runs out of GPU memory
+OOM_FALLBACK_CHUNK_FRAMES = 1
+OOM_FALLBACK_TILE_SIZE = 32
+
+VAE_DTYPES = {
+    "float32": torch.float32,
+    "bfloat16": torch.bfloat16,
+    "float16": torch.float16,
+}
+
+
+def get_vae_dtype() -> torch.dtype:
+    """Wan VAE precision from WAN_VAE_DTYPE (float32 default; bfloat16 halves decode memory)"""
+    name = os.environ.get("WAN_VAE_DTYPE", "float32").lower()
+    if name not in VAE_DTYPES:
+        print(f"⚠️ Unknown WAN_VAE_DTYPE '{name}', using float32")
+        name = "float32"
+    return VAE_DTYPES[name]
+
+
+def denormalize_wan_latents(vae, latents: torch.Tensor) -> torch.Tensor:
+    """Undo the per-channel latent normalisation WanPipeline applies before decoding"""
+    latents = latents.to(vae.dtype)
+    z_dim = vae.config.z_dim
+    latents_mean = torch.tensor(vae.config.latents_mean).view(1, z_dim, 1, 1, 1).to(latents.device, latents.dtype)
+    latents_std = torch.tensor(vae.config.latents_std).view(1, z_dim, 1, 1, 1).to(latents.device, latents.dtype)
+    return latents * latents_std + latents_mean
+
+
+def video_to_uint8(video: torch.Tensor) -> torch.Tensor:
+    """
+    Convert decoded video (C, T, H, W) in [-1, 1] to (T, H, W, C) uint8 on the same device,
+    so only a quarter of the float32 bytes ever cross to the host
+    """
+    video = ((video.float() + 1.0) * 127.5).round_().clamp_(0, 255)
+    return video.to(torch.uint8).permute(1, 2, 3, 0)
+
+
+def tile_starts(size: int, tile: int, overlap: int) -> List[int]:
+    """Start offsets of tiles covering ``size`` with at least ``overlap`` between neighbours"""
+    if tile <= 0 or size <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    return list(range(0, size - tile, stride)) + [size - tile]
+
+
+def blend_weights(length: int, overlap_before: int) -> np.ndarray:
+    """Per-pixel weight of a new tile along one axis: a linear ramp over the overlap, then 1"""
+    weights = np.ones(length, dtype=np.float32)
+    if overlap_before > 0:
+        weights[:overlap_before] = np.arange(1, overlap_before + 1, dtype=np.float32) / (overlap_before + 1)
+    return weights
+
+
+def _onload(vae):
+    """Move an offloaded VAE to the GPU (what diffusers does before vae.decode)"""
+    hook = getattr(vae, "_hf_hook", None)
+    if hook is not None and hasattr(hook, "pre_forward"):
+        hook.pre_forward(vae)
+
+
+def _decode_chunks(vae, z: torch.Tensor, chunk_frames: int):
+    """
+    Yield decoded (C, t, H, W) chunks of a single-video latent (1, C, T, h, w)
+
+    Runs the Wan decoder one latent frame at a time with its causal feature cache (as
+    AutoencoderKLWan._decode does), but hands each chunk back instead of concatenating
+    the whole clip on the GPU.
+    """
+    num_latent_frames = z.shape[2]
+    first_chunk_arg = "first_chunk" in inspect.signature(vae.decoder.forward).parameters
+
+    vae.clear_cache()
+    try:
+        x = vae.post_quant_conv(z)
+        pending = []
+        for i in range(num_latent_frames):
+            vae._conv_idx = [0]
+            kwargs = {"first_chunk": True} if (i == 0 and first_chunk_arg) else {}
+            pending.append(vae.decoder(x[:, :, i:i + 1], feat_cache=vae._feat_map, feat_idx=vae._conv_idx, **kwargs))
+            if len(pending) == chunk_frames or i == num_latent_frames - 1:
+                yield torch.cat(pending, 2)[0].clamp_(-1.0, 1.0)
+                pending = []
+    finally:
+        vae.clear_cache()
+
+
+def _output_shape(vae, latents: torch.Tensor) -> Tuple[int, int, int]:
+    """(frames, height, width) a latent clip decodes to"""
+    temporal = getattr(vae, "temporal_compression_ratio", 4)
+    spatial = getattr(vae, "spatial_compression_ratio", 8)
+    _, _, num_latent_frames, height, width = latents.shape
+    return 1 + temporal * (num_latent_frames - 1), height * spatial, width * spatial
+
+
+def _decode_chunked(vae, latents: torch.Tensor, chunk_frames: int, tile_size: int,
+                    tile_overlap: int) -> np.ndarray:
+    num_frames, height, width = _output_shape(vae, latents)
+    spatial = height // latents.shape[3]
+    frames = np.empty((num_frames, height, width, 3), dtype=np.uint8)
+
+    rows = tile_starts(latents.shape[3], tile_size, tile_overlap)
+    cols = tile_starts(latents.shape[4], tile_size, tile_overlap)
+    tile_h = min(tile_size, latents.shape[3]) if tile_size > 0 else latents.shape[3]
+    tile_w = min(tile_size, latents.shape[4]) if tile_size > 0 else latents.shape[4]
+
+    for row_index, y0 in enumerate(rows):
+        overlap_y = (rows[row_index - 1] + tile_h - y0) * spatial if row_index else 0
+        for col_index, x0 in enumerate(cols):
+            overlap_x = (cols[col_index - 1] + tile_w - x0) * spatial if col_index else 0
+            z = latents[:, :, :, y0:y0 + tile_h, x0:x0 + tile_w]
+            py, px = y0 * spatial, x0 * spatial
+
+            # New tiles fade in over the region already written by the tiles above / to the left
+            weights = None
+            if overlap_y or overlap_x:
+                weights = (blend_weights(tile_h * spatial, overlap_y)[:, None]
+                           * blend_weights(tile_w * spatial, overlap_x)[None, :])[None, :, :, None]
+
+            t = 0
+            for chunk in _decode_chunks(vae, z, chunk_frames):
+                tile = video_to_uint8(chunk).cpu().numpy()
+                n, th, tw = tile.shape[:3]
+                region = frames[t:t + n, py:py + th, px:px + tw]
+                if weights is None:
+                    region[...] = tile
+                else:
+                    region[...] = np.rint(region * (1.0 - weights) + tile * weights)
+                t += n
+
+    return frames[:t]
+
+
+def decode_wan_latents(vae, latents: torch.Tensor, chunk_frames: Optional[int] = None,
+                       tile_size: Optional[int] = None, tile_overlap: Optional[int] = None,
+                       oom_fallback: bool = True) -> np.ndarray:
+    """
+    Decode the first video of a batch of Wan latents
+
+    Args:
+        vae: AutoencoderKLWan of the pipeline that produced the latents
+        latents: (B, C, T, H, W) latents from ``WanPipeline(..., output_type="latent")``
+        chunk_frames: Latent frames (4 video frames each) decoded per host flush; 0 decodes the
+            whole clip in one vae.decode call (default: WAN_VAE_CHUNK_FRAMES)
+        tile_size: Spatial tile edge in latent pixels, 0 for no tiling (default: WAN_VAE_TILE_SIZE)
+        tile_overlap: Latent pixels shared by neighbouring tiles, blended linearly
+            (default: WAN_VAE_TILE_OVERLAP)
+        oom_fallback: On CUDA OOM, retry once with single-frame chunks and small tiles
+
+    Returns:
+        Contiguous (frames, height, width, 3) uint8 array. Frames are views into this one
+        buffer, so encoding and upload never copy the clip again.
+    """
+    chunk_frames = DEFAULT_CHUNK_FRAMES if chunk_frames is None else chunk_frames
+    tile_size = DEFAULT_TILE_SIZE if tile_size is None else tile_size
+    tile_overlap = DEFAULT_TILE_OVERLAP if tile_overlap is None else tile_overlap
+
+    _onload(vae)
+    latents = denormalize_wan_latents(vae, latents[:1])
+
+    try:
+        if chunk_frames <= 0 and tile_size <= 0:
+            video = vae.decode(latents, return_dict=False)[0][0]
+            frames = video_to_uint8(video)
+            del video
+            return np.ascontiguousarray(frames.cpu().numpy())
+        return _decode_chunked(vae, latents, max(1, chunk_frames), tile_size, tile_overlap)
+    except torch.cuda.OutOfMemoryError:
+        if not oom_fallback or (0 < tile_size <= OOM_FALLBACK_TILE_SIZE
+                                and 0 < chunk_frames <= OOM_FALLBACK_CHUNK_FRAMES):
+            raise
+        print(f"⚠️ VAE decode ran out of GPU memory (chunk_frames={chunk_frames}, tile_size={tile_size}), "
+              f"retrying with chunk_frames={OOM_FALLBACK_CHUNK_FRAMES}, tile_size={OOM_FALLBACK_TILE_SIZE}")
+
+    # Retried outside the except block so the failed attempt's tensors can be freed first
+    torch.cuda.empty_cache()
+    return _decode_chunked(vae, latents, OOM_FALLBACK_CHUNK_FRAMES, OOM_FALLBACK_TILE_SIZE, tile_overlap)
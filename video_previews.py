@@ -0,0 +1,110 @@
+"""
+Video Previews for SDXL Worker
+Poster JPEG and looping animated WebP/GIF built from the frames on their way to the MP4 encoder
+"""
+
+import os
+from io import BytesIO
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from image_encoding import EncodedImage, encode_image, _ENCODE_POOL
+
+DEFAULT_PREVIEW_SIZE = int(os.environ.get("VIDEO_PREVIEW_SIZE", "320"))
+DEFAULT_PREVIEW_FPS = int(os.environ.get("VIDEO_PREVIEW_FPS", "8"))
+DEFAULT_PREVIEW_FORMAT = os.environ.get("VIDEO_PREVIEW_FORMAT", "webp")
+PREVIEW_QUALITY = 70
+POSTER_QUALITY = 85
+
+ANIMATED_FORMATS = {
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "gif": ("GIF", "image/gif", ".gif"),
+}
+
+
+def _downscale(frame: np.ndarray, max_size: int) -> Image.Image:
+    image = Image.fromarray(frame)
+    image.thumbnail((max_size, max_size), Image.BILINEAR)
+    return image
+
+
+def _encode_poster(frame: np.ndarray) -> EncodedImage:
+    return encode_image(Image.fromarray(frame), "jpeg", POSTER_QUALITY)
+
+
+def encode_animation(frames: List[Image.Image], fps: int, output_format: str = "webp") -> EncodedImage:
+    """Encode frames as a looping animated WebP or GIF"""
+    pil_format, content_type, extension = ANIMATED_FORMATS[output_format]
+    params = {"save_all": True, "append_images": frames[1:], "duration": round(1000 / fps), "loop": 0}
+    if output_format == "webp":
+        params.update(quality=PREVIEW_QUALITY, method=4)
+    else:
+        params.update(optimize=True)
+
+    buffer = BytesIO()
+    frames[0].save(buffer, format=pil_format, **params)
+    return EncodedImage(buffer.getvalue(), content_type, extension)
+
+
+class VideoPreviewTap:
+    """
+    Pass-through wrapper around a frame sequence that builds the video's previews as the
+    frames stream to the encoder:
+
+    - the middle frame is JPEG-encoded on the shared encoder pool as soon as it passes
+    - every few frames a downscaled copy is kept (about ``preview_fps``); once the stream
+      ends they are encoded as an animated WebP/GIF on the pool, while the MP4 is finishing
+
+    Frames are yielded unchanged, so the tap costs the encoder nothing but a reference.
+    """
+
+    def __init__(self, frames, fps: int, max_size: Optional[int] = None, preview_fps: Optional[int] = None,
+                 output_format: Optional[str] = None):
+        self.frames = frames
+        self.fps = fps
+        self.max_size = max_size or DEFAULT_PREVIEW_SIZE
+        self.preview_fps = min(preview_fps or DEFAULT_PREVIEW_FPS, fps)
+        self.output_format = (output_format or DEFAULT_PREVIEW_FORMAT).lower()
+        if self.output_format not in ANIMATED_FORMATS:
+            self.output_format = "webp"
+
+        self._poster = None
+        self._animation = None
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        poster_index = len(self.frames) // 2
+        stride = max(1, round(self.fps / self.preview_fps))
+        samples = []
+
+        for index, frame in enumerate(self.frames):
+            if index == poster_index:
+                self._poster = _ENCODE_POOL.submit(_encode_poster, frame)
+            if index % stride == 0:
+                samples.append(_ENCODE_POOL.submit(_downscale, frame, self.max_size))
+            yield frame
+
+        self._animation = _ENCODE_POOL.submit(
+            lambda: encode_animation([sample.result() for sample in samples], self.fps / stride, self.output_format)
+        )
+
+    def results(self) -> Dict[str, EncodedImage]:
+        """
+        Wait for the previews; call after the frames have been consumed
+
+        Returns:
+            {"poster": EncodedImage, "animated": EncodedImage}; a failed preview is left out
+        """
+        previews = {}
+        for name, future in (("poster", self._poster), ("animated", self._animation)):
+            if future is None:
+                continue
+            try:
+                previews[name] = future.result()
+            except Exception as e:
+                print(f"⚠️ Failed to build video {name} preview: {e}")
+        return previews
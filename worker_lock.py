@@ -0,0 +1,57 @@
+"""
+Worker Lock for SDXL Worker
+Ownership of per-worker state on the persistent volume (status journal, payload spool): a
+worker holds an exclusive lock on its own files for as long as it runs, so files whose lock
+can be taken were left by a worker that is gone and can be taken over
+"""
+
+import os
+import fcntl
+import socket
+from typing import Iterator, Optional
+
+# Names this worker's files on the volume
+WORKER_ID = os.environ.get("RUNPOD_POD_ID") or socket.gethostname()
+
+
+def try_lock(path: str) -> Optional[int]:
+    """Take the exclusive lock ``{path}.lock`` without waiting; its descriptor, or None when held elsewhere"""
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def release(path: str, fd: int, remove: bool = False):
+    """Release a lock from ``try_lock``, removing its file first when ``path`` is gone for good"""
+    if remove:
+        try:
+            os.remove(path + ".lock")
+        except OSError:
+            pass
+    os.close(fd)
+
+
+def orphans(directory: str, own: str, suffix: str = "") -> Iterator[str]:
+    """
+    Paths in ``directory`` ending in ``suffix``, other than ``own``, whose owner is gone
+
+    Each is locked while the caller handles it, and its lock is removed afterwards: the caller
+    is expected to take over and delete the path. A path deleted by another worker between
+    listing and locking is skipped.
+    """
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith(suffix) or name.endswith(".lock") or os.path.abspath(path) == os.path.abspath(own):
+            continue
+        fd = try_lock(path)
+        if fd is None:
+            continue
+        try:
+            if os.path.exists(path):
+                yield path
+        finally:
+            release(path, fd, remove=True)